@@ -0,0 +1,270 @@
+import os
+import sys
+import json
+import click
+import platform
+import subprocess
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from multiprocessing import get_context
+from time import perf_counter
+from typing import Optional
+
+from sqlalchemy import create_engine, func, select
+
+from main import PARAMS, load_model, run_scheduler, schedule_populate
+from rfb import settings
+from rfb.models import Checkpoint
+from rfb.utils import NAMES_PATTERNS
+from rfb.utils.convert_database import ConvertDatabase, list_files, read_file
+from rfb.utils.loader import ExecutemanyLoader, OrmLoader, PostgresCopyLoader
+from rfb.utils.scheduler import Scheduler
+from rfb.utils.synthetic import generate
+
+# Estratégias de carga comparadas com o --loader
+LOADERS = {
+    'copy': PostgresCopyLoader,
+    'executemany': ExecutemanyLoader,
+    'orm': OrmLoader,
+}
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    """ Pico de memória (RSS) do processo atual em MB """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def stage_read_file(directory: str) -> int:
+    """ Leitura e split das linhas de todos os arquivos, sem o parse """
+    rows = 0
+    for pattern_name in NAMES_PATTERNS:
+        for file in list_files(directory, pattern_name):
+            for _ in read_file(file):
+                rows += 1
+    return rows
+
+
+def stage_parse(directory: str, pattern_name: str) -> tuple:
+    """ Apenas o parse (parse_*) das linhas já lidas, em blocos """
+    parse_function = getattr(ConvertDatabase, f'parse_{pattern_name}')
+    rows, elapsed = 0, 0.
+
+    for file in list_files(directory, pattern_name):
+        lines = read_file(file)
+        while True:
+            chunk = list(islice(lines, settings.CHUNK_ROWS_INSERT_DATABASE))
+            if not chunk:
+                break
+
+            start = perf_counter()
+            for row in chunk:
+                parse_function(row)
+            elapsed += perf_counter() - start
+            rows += len(chunk)
+
+    return rows, elapsed
+
+
+def _reset_database(database_url: str) -> None:
+    """ Remove as tabelas da carga para que cada medição comece com o banco vazio """
+    engine = create_engine(database_url, future=True)
+    for param in PARAMS:
+        load_model(param['model']).__table__.drop(engine, checkfirst=True)
+    Checkpoint.__table__.drop(engine, checkfirst=True)
+    engine.dispose()
+
+
+def _count_rows(engine, tables: list) -> int:
+    with engine.connect() as connection:
+        return sum(connection.execute(select(func.count()).select_from(table)).scalar() for table in tables)
+
+
+def get_loader(name: str):
+    """
+    Estratégia de carga informada no --loader
+    :param name: copy, executemany ou orm (bulk_insert_mappings)
+    """
+    if name == 'orm':
+        return OrmLoader([load_model(param['model']) for param in PARAMS])
+    return LOADERS[name]()
+
+
+def stage_populate(directory: str, database_url: str, threads: bool, loader: Optional[str] = None) -> tuple:
+    """
+    Carga completa (ConvertDatabase.populate) de todos os arquivos no banco
+    :param loader: Estratégia de carga (LOADERS), caso não seja informada será utilizada a do main.start
+    """
+    _reset_database(database_url)
+
+    convert_database = ConvertDatabase(database_url, directory)
+    convert_database.create_tables()
+
+    # Sem a thread de escrita o SQLite não suporta as escritas concorrentes
+    if loader is not None and convert_database.engine.dialect.name == 'sqlite':
+        threads = False
+
+    # Mesmo agendamento da carga do main.start
+    scheduler = Scheduler()
+    params = [dict(param) for param in PARAMS]
+    _, sqlite_writer = schedule_populate(scheduler, database_url, directory, params, convert_database.engine,
+                                         run_in_singleton=not threads,
+                                         loader=get_loader(loader) if loader else None)
+
+    start = perf_counter()
+    run_scheduler(scheduler, not threads, sqlite_writer)
+    elapsed = perf_counter() - start
+
+    tables = [load_model(param['model']).__table__ for param in PARAMS]
+    return _count_rows(convert_database.engine, tables), elapsed
+
+
+def stage_indexes(directory: str, database_url: str) -> tuple:
+    """ Construção dos índices após a carga, as linhas são as das tabelas indexadas """
+    convert_database = ConvertDatabase(database_url, directory)
+
+    start = perf_counter()
+    convert_database.create_indexes()
+    elapsed = perf_counter() - start
+
+    return _count_rows(convert_database.engine, convert_database.indexed_tables), elapsed
+
+
+def _measure(function, *args) -> dict:
+    """ Executado no processo da etapa, retorna o tempo, as linhas e o pico de memória """
+    start = perf_counter()
+    result = function(*args)
+    elapsed = perf_counter() - start
+
+    # As etapas que medem apenas parte do tempo retornam (linhas, segundos)
+    rows, elapsed = result if isinstance(result, tuple) else (result, elapsed)
+    return {'linhas': rows, 'segundos': round(elapsed, 3), 'pico_rss_mb': peak_rss_mb()}
+
+
+def run_stage(name: str, function, *args) -> dict:
+    """
+    Executa a etapa em um processo novo, isolando o pico de memória de cada etapa
+    """
+    click.echo(f'Executando a etapa {name}...', err=True)
+
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+        result = executor.submit(_measure, function, *args).result()
+
+    result['etapa'] = name
+    result['linhas_por_segundo'] = round(result['linhas'] / result['segundos']) if result['segundos'] else None
+    click.echo(f'  {result["linhas"]} linhas em {result["segundos"]}s ({result["linhas_por_segundo"]} linhas/s, '
+               f'pico de {result["pico_rss_mb"] or 0:.0f}MB)', err=True)
+    return result
+
+
+def compare(previous: dict, current: dict, tolerance: float) -> bool:
+    """
+    Compara as linhas/segundo de cada etapa com uma execução anterior
+    :return: True se alguma etapa ficou mais lenta do que a tolerância
+    """
+    before = {stage['etapa']: stage for stage in previous['etapas']}
+    regression = False
+
+    for stage in current['etapas']:
+        old = before.get(stage['etapa'])
+        if not old or not old['linhas_por_segundo'] or not stage['linhas_por_segundo']:
+            continue
+
+        change = stage['linhas_por_segundo'] / old['linhas_por_segundo'] - 1
+        slower = change < -tolerance
+        regression |= slower
+        click.echo(f'{stage["etapa"]:40} {old["linhas_por_segundo"]:>12} -> {stage["linhas_por_segundo"]:>12} '
+                   f'linhas/s ({change:+.1%}){"  REGRESSÃO" if slower else ""}')
+
+    return regression
+
+
+def git_version():
+    """ Commit atual do repositório, quando disponível """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.command()
+@click.option("--linhas", show_default=True, default=100_000, type=click.IntRange(min=1),
+              help="Quantidade de empresas dos arquivos sintéticos")
+@click.option("--arquivos", show_default=True, default=2, type=click.IntRange(min=1),
+              help="Quantidade de arquivos de empresas, estabelecimentos e sócios")
+@click.option("--diretorio", show_default=True, default='benchmark', type=click.Path(),
+              help="Pasta dos arquivos sintéticos, gerados caso não existam")
+@click.option("--database_url", "--database-url", multiple=True, type=click.STRING,
+              help="URLs dos bancos da carga completa (pode ser repetido), default: SQLite na pasta")
+@click.option("--threads", show_default=True, default=True, type=click.BOOL,
+              help="Executa a carga completa em threads?")
+@click.option("--loader", multiple=True, type=click.Choice(list(LOADERS)),
+              help="Estratégias de carga comparadas na carga completa (pode ser repetido), default: a do main.py. "
+                   "No SQLite a carga com o --loader não utiliza threads")
+@click.option("--somente_gerar", "--somente-gerar", is_flag=True, help="Apenas gera os arquivos sintéticos")
+@click.option("--saida", show_default=True, default='benchmark.json', type=click.Path(),
+              help="Arquivo JSON com o resultado")
+@click.option("--comparar", type=click.Path(exists=True), default=None,
+              help="Resultado anterior (JSON) para a comparação, termina com erro caso alguma etapa fique mais lenta")
+@click.option("--tolerancia", show_default=True, default=0.1, type=click.FLOAT,
+              help="Perda de linhas/segundo tolerada na comparação")
+def start(linhas, arquivos, diretorio, database_url, threads, loader, somente_gerar, saida, comparar, tolerancia):
+
+    if not os.path.isdir(diretorio) or not any(name.endswith('.zip') for name in os.listdir(diretorio)):
+        click.echo(f'Gerando os arquivos sintéticos em {diretorio}...', err=True)
+        generate(diretorio, linhas, arquivos)
+
+    if somente_gerar:
+        return
+
+    database_urls = database_url or (f'sqlite:///{os.path.join(diretorio, "benchmark.sqlite3")}',)
+
+    stages = [run_stage('read_file', stage_read_file, diretorio)]
+    for param in PARAMS:
+        stages.append(run_stage(f'parse_{param["pattern_name"]}', stage_parse, diretorio, param['pattern_name']))
+
+    for url in database_urls:
+        dialect = create_engine(url).dialect.name
+        if 'copy' in loader and dialect != 'postgresql':
+            raise click.BadParameter(f'O COPY é suportado apenas no PostgreSQL ({url})', param_hint='--loader')
+
+        for name in loader or (None,):
+            suffix = f'{dialect}_{name}' if name else dialect
+            stages.append(run_stage(f'populate_{suffix}', stage_populate, diretorio, url, threads, name))
+            stages.append(run_stage(f'indices_{suffix}', stage_indexes, diretorio, url))
+
+    result = {
+        'versao': git_version(),
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'diretorio': diretorio,
+        'threads': threads,
+        'loaders': list(loader),
+        'etapas': stages,
+    }
+
+    with open(saida, 'w') as file:
+        json.dump(result, file, indent=2, ensure_ascii=False)
+    click.echo(f'Resultado gravado em {saida}', err=True)
+
+    if comparar:
+        with open(comparar) as file:
+            if compare(json.load(file), result, tolerancia):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    start()
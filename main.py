@@ -1,33 +1,178 @@
 import click
 import logging
-import threading
-
-from time import sleep
 
+from functools import partial
 from importlib import import_module
+from typing import Iterable, Optional
+
+from rfb import cnpj_index
+from rfb import settings
 from rfb.utils import download
+from rfb.utils import pipeline
+from rfb.utils import prescan
+from rfb.utils.stream_import import StreamImport
 from rfb.utils.convert_database import ConvertDatabase
+from rfb.utils.metrics import MetricsExporter
+from rfb.utils.parquet import ParquetExport
+from rfb.utils.scheduler import Scheduler, Task
+from rfb.utils.shadow import ShadowTables
+from rfb.utils.sqlite_writer import SqliteWriter
 
 
 log = logging.getLogger('rfb')
 log.setLevel(logging.INFO)
 logging.basicConfig(filename='rfb.log', format='%(levelname)s: %(name)s: %(asctime)s - %(message)s')
 
+# Parâmetros do ConvertDatabase.populate de cada arquivo da RFB
+PARAMS = [
+    {'pattern_name': 'cnae', 'qt_column': 2, 'model': 'rfb.models.Cnae'},
+    {'pattern_name': 'motivo_cadastral', 'qt_column': 2, 'model': 'rfb.models.MotivoCadastral'},
+    {'pattern_name': 'municipio', 'qt_column': 2, 'model': 'rfb.models.Municipio'},
+    {'pattern_name': 'natureza', 'qt_column': 2, 'model': 'rfb.models.Natureza'},
+    {'pattern_name': 'pais', 'qt_column': 2, 'model': 'rfb.models.Pais'},
+    {'pattern_name': 'qualificacao', 'qt_column': 2, 'model': 'rfb.models.Qualificacao'},
+    {'pattern_name': 'dado_simples', 'qt_column': 7, 'model': 'rfb.models.DadoSimples'},
+    {'pattern_name': 'socio', 'qt_column': 11, 'model': 'rfb.models.Socio'},
+    {'pattern_name': 'empresa', 'qt_column': 7, 'model': 'rfb.models.Empresa'},
+    {'pattern_name': 'estabelecimento', 'qt_column': 30, 'model': 'rfb.models.Estabelecimento'},
+]
+
 
-def run_insert(database_url: str, diretorio_arquivos: str, function_params: dict):
+def compact_params(params: list) -> list:
+    """
+    Troca os models e as funções de parse de cada pattern_name pelos do schema compacto
+    (rfb.models.compacto), as tabelas sem um conversor próprio utilizam o padrão
+    :param params: Parâmetros repassados para o ConvertDatabase.populate
+    """
+    for param in params:
+        param['model'] = param['model'].replace('rfb.models.', 'rfb.models.compacto.')
+
+        parse_function = f'parse_{param["pattern_name"]}_compacto'
+        if hasattr(ConvertDatabase, parse_function):
+            param['parse_function'] = parse_function
+
+    return params
+
+
+def load_model(path: str):
+    """
+    Importa o model a partir do caminho completo da classe
+    :param path: Caminho da classe, ex.: rfb.models.Cnae
+    """
+    module, cls = path.rsplit('.', maxsplit=1)
+    module = import_module(module)
+    return getattr(module, cls)
+
+
+def run_insert(database_url: str, diretorio_arquivos: str, function_params: dict, loader=None, engine=None):
     """
     Função auxiliar para permitir executar ou não em threads as inserções no banco
     de dados
     :param database_url: URL de conexão com o banco de dados
     :param diretorio_arquivos: Diretório base dos arquivos CSV
-    :param run_in_singleton: Não é para fazer a inserção de forma pararela na base de dados
+    :param function_params: Parâmetros repassados para o ConvertDatabase.populate
+    :param loader: Estratégia de carga compartilhada entre as threads (ex.: SqliteWriter)
+    :param engine: Engine compartilhada entre as threads, cada uma utiliza uma conexão do pool
     """
-    module, cls = function_params['model'].rsplit('.', maxsplit=1)
-    module = import_module(module)
-    model = getattr(module, cls)
+    function_params['model'] = load_model(function_params['model'])
+    convert_database = ConvertDatabase(database_url, diretorio_arquivos, loader, engine)
+    try:
+        convert_database.populate(**function_params)
+    finally:
+        convert_database.session.close()
+
+
+def start_sqlite_writer(database_url: str, engine) -> Optional[SqliteWriter]:
+    """
+    O SQLite não suporta escritas concorrentes, então as threads apenas fazem
+    a leitura dos arquivos e uma única thread faz a escrita no banco
+    :param database_url: URL de conexão com o banco de dados
+    :param engine: Engine do SQLAlchemy utilizada pela escrita do SQLite
+    :return: a thread de escrita já iniciada, None nos demais bancos
+    """
+    if not database_url.startswith('sqlite'):
+        return None
+
+    sqlite_writer = SqliteWriter(engine)
+    sqlite_writer.start()
+    return sqlite_writer
 
-    function_params['model'] = model
-    ConvertDatabase(database_url, diretorio_arquivos).populate(**function_params)
+
+def schedule_imports(scheduler: Scheduler, database_url: str, diretorio_arquivos: str, params: list,
+                     loader=None, engine=None, depends: Iterable[Task] = ()) -> list:
+    """
+    Agenda a carga de cada pattern_name, os que têm os maiores arquivos primeiro (tamanho
+    descompactado da pré-análise ou, sem a mesma, o compactado)
+    :param scheduler: Scheduler onde as etapas serão agendadas
+    :param database_url: URL de conexão com o banco de dados
+    :param diretorio_arquivos: Diretório base dos arquivos CSV
+    :param params: Parâmetros repassados para o ConvertDatabase.populate
+    :param loader: Estratégia de carga compartilhada entre as threads (ex.: SqliteWriter)
+    :param engine: Engine compartilhada entre as threads
+    :param depends: Etapas que precisam terminar antes da carga (ex.: download)
+    :return: etapas agendadas
+    """
+    return [
+        scheduler.add(
+            f'importação {param["pattern_name"]}', run_insert, database_url, diretorio_arquivos, param, loader, engine,
+            depends=depends, weight=partial(prescan.weight, diretorio_arquivos, param['pattern_name'])
+        )
+        for param in params
+    ]
+
+
+def schedule_populate(scheduler: Scheduler, database_url: str, diretorio_arquivos: str, params: list, engine,
+                      depends: Iterable[Task] = (), delta: bool = False, shadow: Optional[ShadowTables] = None,
+                      run_in_singleton: bool = False, loader=None) -> tuple:
+    """
+    Agenda a carga em threads de todos os pattern_name (schedule_imports), com a thread de
+    escrita do SQLite, utilizado pelo start e pelo benchmark
+    :param scheduler: Scheduler onde as etapas serão agendadas
+    :param database_url: URL de conexão com o banco de dados
+    :param diretorio_arquivos: Diretório base dos arquivos CSV
+    :param params: Parâmetros repassados para o ConvertDatabase.populate
+    :param engine: Engine compartilhada entre as threads, também utilizada pela escrita do SQLite
+    :param depends: Etapas que precisam terminar antes da carga (ex.: download)
+    :param delta: Importação incremental
+    :param shadow: Nova geração das tabelas que recebe a carga (recarga em tabelas sombra)
+    :param run_in_singleton: Importa um arquivo de cada vez
+    :param loader: Estratégia de carga (rfb.utils.loader) no lugar da mais rápida disponível para
+        o SGBD, não inicia a thread de escrita do SQLite (ex.: comparação no benchmark.py)
+    :return: etapas agendadas e a thread de escrita do SQLite (None nos demais bancos), que
+        deve ser encerrada caso a execução termine com erro (run_scheduler)
+    """
+    # Os arquivos de um mesmo dataset também são importados em paralelo (POPULATE_FILE_WORKERS)
+    for param in params:
+        param['delta'] = delta
+        if shadow is not None:
+            param['shadow'] = shadow
+        if run_in_singleton:
+            param['workers'] = 1
+
+    sqlite_writer = start_sqlite_writer(database_url, engine) if loader is None else None
+    imports = schedule_imports(scheduler, database_url, diretorio_arquivos, params, sqlite_writer or loader, engine,
+                               depends)
+
+    # Os índices do SQLite só podem ser construídos após a escrita de todos os blocos
+    if sqlite_writer is not None:
+        imports = [scheduler.add('escrita no SQLite', sqlite_writer.close, depends=imports)]
+
+    return imports, sqlite_writer
+
+
+def run_scheduler(scheduler: Scheduler, run_in_singleton: bool, sqlite_writer: Optional[SqliteWriter] = None):
+    """
+    Executa as etapas agendadas, encerrando a thread de escrita do SQLite caso a execução
+    termine antes da etapa de escrita
+    :param scheduler: Scheduler com as etapas agendadas
+    :param run_in_singleton: Executa uma etapa de cada vez
+    :param sqlite_writer: Thread de escrita do SQLite (schedule_populate)
+    """
+    try:
+        scheduler.run(1 if run_in_singleton else settings.IMPORT_WORKERS)
+    finally:
+        if sqlite_writer is not None and sqlite_writer.is_alive():
+            sqlite_writer.close()
 
 
 @click.command()
@@ -35,14 +180,42 @@ def run_insert(database_url: str, diretorio_arquivos: str, function_params: dict
               help="É para baixar os arquivos?")
 @click.option("--threads", show_default=True, default=True, type=click.BOOL,
               help="É para ser executado em Threads?")
+@click.option("--delta", show_default=True, default=False, type=click.BOOL,
+              help="Aplica apenas as diferenças em relação à última importação?")
+@click.option("--workers", show_default=True, default=0, type=click.IntRange(min=0),
+              help="Quantidade de processos de leitura/parse, 0 utiliza o modo em threads")
+@click.option("--indices", show_default=True, default=True, type=click.BOOL,
+              help="Constrói os índices após a carga?")
+@click.option("--importar_ao_baixar", "--importar-ao-baixar", show_default=True, default=False, type=click.BOOL,
+              help="Importa cada arquivo enquanto o mesmo é baixado?")
+@click.option("--pre_analise", "--pre-analise", show_default=True, default=True, type=click.BOOL,
+              help="Estima as linhas dos arquivos antes da carga, ajustando os blocos e exibindo o progresso?")
 @click.option("--diretorio_arquivos", "--diretorio", "--diretorio-arquivos",
               show_default=True, default='download',
               type=click.Path(), help="Pasta de destino dos arquivos de download")
 @click.option("--database_url", "--database", "--database-url", type=click.STRING, default=None,
               help="URL de conexão do banco de dados")
-def start(baixar, threads, diretorio_arquivos, database_url):
+@click.option("--parquet", type=click.Path(), default=None,
+              help="Pasta de destino da exportação para Parquet, substitui a carga no banco de dados")
+@click.option("--indice_cnpj", "--indice-cnpj", type=click.Path(), default=None,
+              help="Arquivo do índice binário dos CNPJs (rfb.cnpj_index), substitui a carga no banco de dados")
+@click.option("--compacto", show_default=True, default=False, type=click.BOOL,
+              help="Utiliza o schema compacto, com o CNPJ, o CEP, os telefones e os códigos inteiros?")
+@click.option("--particionar", show_default=True, default=False, type=click.BOOL,
+              help="Cria as tabelas estabelecimentos e socios particionadas (apenas PostgreSQL)?")
+@click.option("--recarga_sombra", "--recarga-sombra", show_default=True, default=False, type=click.BOOL,
+              help="Recarrega em uma nova geração das tabelas e troca as mesmas ao final, sem afetar as consultas?")
+@click.option("--cnaes_secundarios", "--cnaes-secundarios", show_default=True, default=False, type=click.BOOL,
+              help="Carrega a tabela estabelecimento_cnaes com o CNAE principal e os secundários?")
+@click.option("--metricas_prometheus", "--metricas-prometheus", type=click.Path(), default=None,
+              help="Arquivo .prom atualizado durante a execução (textfile collector do node_exporter)")
+@click.option("--metricas_json", "--metricas-json", type=click.Path(), default=None,
+              help="Arquivo JSON com o resumo das métricas de cada etapa, gravado ao final")
+def start(baixar, threads, delta, workers, indices, importar_ao_baixar, pre_analise, diretorio_arquivos, database_url,
+          parquet, indice_cnpj, compacto, particionar, recarga_sombra, cnaes_secundarios, metricas_prometheus,
+          metricas_json):
 
-    if database_url is None:
+    if database_url is None and parquet is None and indice_cnpj is None:
         if click.prompt(
             "Não foi informado a url de conexão com o banco de dados, deseja utilizar o SQLite?",
             show_choices=True,
@@ -60,58 +233,165 @@ def start(baixar, threads, diretorio_arquivos, database_url):
         Iniciando com os parâmetros:
             baixar: {baixar}
             threads: {threads}
+            delta: {delta}
+            workers: {workers}
+            indices: {indices}
+            importar_ao_baixar: {importar_ao_baixar}
+            pre_analise: {pre_analise}
             diretorio_arquivos: {diretorio_arquivos}
             database_url: {database_url}
+            parquet: {parquet}
+            indice_cnpj: {indice_cnpj}
+            compacto: {compacto}
+            particionar: {particionar}
+            recarga_sombra: {recarga_sombra}
+            cnaes_secundarios: {cnaes_secundarios}
+            metricas_prometheus: {metricas_prometheus}
+            metricas_json: {metricas_json}
         """
     log.info(msg)
     click.secho(msg)
 
-    if baixar:
-        download.start_download(diretorio_arquivos)
+    if parquet and (delta or workers or importar_ao_baixar):
+        raise click.BadParameter('A exportação para Parquet não suporta o uso de --delta, --workers ou '
+                                 '--importar_ao_baixar', param_hint='--parquet')
+
+    if importar_ao_baixar and not baixar:
+        raise click.BadParameter('A importação durante o download exige --baixar', param_hint='--importar_ao_baixar')
+
+    if importar_ao_baixar and (delta or workers):
+        raise click.BadParameter('A importação durante o download não suporta o uso de --delta ou --workers',
+                                 param_hint='--importar_ao_baixar')
+
+    if indice_cnpj and (parquet or delta or workers or importar_ao_baixar):
+        raise click.BadParameter('O índice dos CNPJs não suporta o uso de --parquet, --delta, --workers ou '
+                                 '--importar_ao_baixar', param_hint='--indice_cnpj')
+
+    if compacto and parquet:
+        raise click.BadParameter('A exportação para Parquet já utiliza os tipos compactos', param_hint='--compacto')
+
+    if cnaes_secundarios and (delta or parquet):
+        raise click.BadParameter('A tabela estabelecimento_cnaes não suporta o uso de --delta ou --parquet',
+                                 param_hint='--cnaes_secundarios')
+
+    if particionar and (parquet or indice_cnpj or cnaes_secundarios):
+        raise click.BadParameter('O particionamento não suporta o uso de --parquet, --indice_cnpj ou '
+                                 '--cnaes_secundarios', param_hint='--particionar')
+
+    if particionar and not database_url.startswith('postgresql'):
+        raise click.BadParameter('O particionamento das tabelas é suportado apenas no PostgreSQL',
+                                 param_hint='--particionar')
+
+    if recarga_sombra and (delta or workers or importar_ao_baixar or particionar or parquet or indice_cnpj):
+        raise click.BadParameter('A recarga em tabelas sombra não suporta o uso de --delta, --workers, '
+                                 '--importar_ao_baixar, --particionar, --parquet ou --indice_cnpj',
+                                 param_hint='--recarga_sombra')
+
+    if recarga_sombra and not database_url.startswith(('postgresql', 'sqlite')):
+        raise click.BadParameter('A recarga em tabelas sombra é suportada apenas no PostgreSQL e no SQLite',
+                                 param_hint='--recarga_sombra')
+
+    if workers and (metricas_prometheus or metricas_json):
+        raise click.BadParameter('As métricas são registradas apenas no processo principal e não suportam o uso '
+                                 'de --workers', param_hint='--workers')
+
+    if delta and workers:
+        raise click.BadParameter('A importação incremental não suporta o uso de --workers', param_hint='--delta')
+
+    # As métricas são gravadas ao final mesmo que a execução termine com erro
+    if metricas_prometheus or metricas_json:
+        exporter = MetricsExporter(metricas_prometheus, metricas_json)
+        exporter.start()
+        click.get_current_context().call_on_close(exporter.close)
+
+    # Criado antes do download para validar a instalação do pyarrow
+    export = ParquetExport(diretorio_arquivos, parquet) if parquet else None
+
+    # Etapas executadas de acordo com as dependências: download -> importação -> índices
+    scheduler = Scheduler()
+    params = [dict(param) for param in PARAMS]
+
+    downloads = []
+    if baixar and not importar_ao_baixar:
+        downloads.append(scheduler.add('download', download.start_download, diretorio_arquivos))
+
+    # Índice binário dos CNPJs, sem o uso do banco de dados
+    if indice_cnpj is not None:
+        scheduler.add('índice dos CNPJs', cnpj_index.build, diretorio_arquivos, indice_cnpj, depends=downloads)
+        scheduler.run()
+        return
+
+    # Exportação para Parquet, sem o uso do banco de dados
+    if export is not None:
+        for param in params:
+            param['model'] = load_model(param['model'])
+            scheduler.add(f'exportação {param["pattern_name"]}', export.export, depends=downloads, **param)
+
+        scheduler.run()
+        return
+
+    if compacto:
+        compact_params(params)
+
+    # O CNAE principal e os secundários são separados na carga de cada bloco dos estabelecimentos
+    if cnaes_secundarios:
+        for param in params:
+            if param['pattern_name'] == 'estabelecimento':
+                param['cnaes_secundarios'] = True
 
     # Verificando se é para rodar sem o uso de paralerismo
-    # OBS: SQLite não suporta paralelismo
-    run_in_singleton = database_url.startswith('sqlite') or not threads
+    # OBS: No SQLite a importação incremental precisa ser sequencial, pois a aplicação
+    # das diferenças é feita fora da thread de escrita
+    run_in_singleton = not threads or (delta and database_url.startswith('sqlite'))
 
-    convert_database = ConvertDatabase(database_url, diretorio_arquivos)
+    convert_database = ConvertDatabase(database_url, diretorio_arquivos, compact=compacto, partitioned=particionar,
+                                       cnaes_secundarios=cnaes_secundarios)
     convert_database.create_tables()  # Cria as tabelas
 
-    params = [
-        {'pattern_name': 'cnae', 'qt_column': 2, 'model': 'rfb.models.Cnae'},
-        {'pattern_name': 'motivo_cadastral', 'qt_column': 2, 'model': 'rfb.models.MotivoCadastral'},
-        {'pattern_name': 'municipio', 'qt_column': 2, 'model': 'rfb.models.Municipio'},
-        {'pattern_name': 'natureza', 'qt_column': 2, 'model': 'rfb.models.Natureza'},
-        {'pattern_name': 'pais', 'qt_column': 2, 'model': 'rfb.models.Pais'},
-        {'pattern_name': 'qualificacao', 'qt_column': 2, 'model': 'rfb.models.Qualificacao'},
-        {'pattern_name': 'dado_simples', 'qt_column': 7, 'model': 'rfb.models.DadoSimples'},
-        {'pattern_name': 'socio', 'qt_column': 11, 'model': 'rfb.models.Socio'},
-        {'pattern_name': 'empresa', 'qt_column': 7, 'model': 'rfb.models.Empresa'},
-        {'pattern_name': 'estabelecimento', 'qt_column': 30, 'model': 'rfb.models.Estabelecimento'},
-    ]
+    # A recarga em tabelas sombra grava em uma nova geração das tabelas, as tabelas atuais
+    # continuam com os dados e os índices até a troca
+    shadow = None
+    if recarga_sombra:
+        shadow = convert_database.shadow_tables([load_model(param['model']) for param in params], cnaes_secundarios)
 
-    thread_name = 'cnpj_insert'
-    tsleep = 0.05
+    # Os índices são construídos apenas após a carga. Na importação incremental
+    # os índices são mantidos, pois são utilizados na aplicação das diferenças
+    if not delta and shadow is None:
+        convert_database.drop_indexes()
 
-    for param in params:
-        if not run_in_singleton:
-            threading.Thread(
-                target=run_insert,
-                args=[database_url, diretorio_arquivos, param],
-                name=thread_name
-            ).start()
-        else:
-            run_insert(database_url, diretorio_arquivos, param)
+    # A pré-análise escolhe o tamanho dos blocos e a quantidade de arquivos em paralelo de cada
+    # dataset e o total do progresso, os arquivos só existem por completo após o download
+    if pre_analise and not importar_ao_baixar:
+        downloads = [scheduler.add('pré-análise', prescan.scan_all, diretorio_arquivos, params, depends=downloads)]
+
+    sqlite_writer = None
+    if importar_ao_baixar:
+        # Cada arquivo é importado assim que o download do mesmo começa
+        for param in params:
+            param['model'] = load_model(param['model'])
+
+        imports = [scheduler.add('download e importação',
+                                 StreamImport(database_url, diretorio_arquivos, params, threads).run)]
+    elif workers:
+        # Leitura/parse em processos separados, evitando o GIL
+        for param in params:
+            param['model'] = load_model(param['model'])
 
-    if not run_in_singleton:
-        threads_runinngs = [x.name for x in threading.enumerate() if thread_name == x.name]
+        imports = [scheduler.add('importação', pipeline.run, database_url, diretorio_arquivos, params, workers,
+                                 depends=downloads)]
+    else:
+        imports, sqlite_writer = schedule_populate(scheduler, database_url, diretorio_arquivos, params,
+                                                   convert_database.engine, downloads, delta, shadow,
+                                                   run_in_singleton)
 
-        while len(threads_runinngs) >= len(params):
-            threads_runinngs = [x.name for x in threading.enumerate() if thread_name == x.name]
-            sleep(tsleep)
+    if shadow is not None:
+        # Índices e estatísticas da nova geração e troca das tabelas em uma única transação
+        prepare = scheduler.add('índices da nova geração', shadow.prepare, indices, depends=imports)
+        scheduler.add('troca das tabelas', shadow.swap, depends=[prepare])
+    elif indices:
+        scheduler.add('índices', convert_database.create_indexes, depends=imports)
 
-        while threads_runinngs:
-            threads_runinngs = [x.name for x in threading.enumerate() if thread_name == x.name]
-            sleep(tsleep)
+    run_scheduler(scheduler, run_in_singleton, sqlite_writer)
 
 
 if __name__ == '__main__':
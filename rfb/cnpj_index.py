@@ -0,0 +1,285 @@
+# ------------------------------------------------------------------------------#
+#                                                                               |
+#     ÍNDICE BINÁRIO DOS CNPJs (MMAP) PARA CONSULTAS SEM O BANCO DE DADOS       |
+#                                                                               |
+# ------------------------------------------------------------------------------#
+# Formato do arquivo (inteiros little-endian):
+#   MAGIC
+#   registros: um JSON (lista com os valores das colunas) por linha convertida
+#   índices: uma seção por dataset, entradas de ENTRY.size bytes (chave, posição e
+#            tamanho do registro) ordenadas pela chave
+#   metadados: JSON com as colunas, a quantidade e a posição do índice de cada dataset
+#   TRAILER: posição e tamanho dos metadados + MAGIC
+import os
+import json
+import click
+import heapq
+import mmap
+import struct
+import tempfile
+
+from datetime import date
+from logging import getLogger
+from typing import Iterator, Optional
+
+from rfb import settings
+
+
+log = getLogger(__name__)
+
+MAGIC = b'RFBCNPJ1'
+
+# Chave (CNPJ completo ou base), posição e tamanho do registro
+ENTRY = struct.Struct('<QQI')
+
+# Posição e tamanho dos metadados, seguidos do MAGIC
+TRAILER = struct.Struct('<QQ8s')
+
+# Datasets do índice: (seção, pattern_name, quantidade de colunas, colunas da chave)
+SECTIONS = (
+    ('estabelecimentos', 'estabelecimento', 30, ('cnpj', 'cnpj_ordem', 'cnpj_dv')),
+    ('empresas', 'empresa', 7, ('cnpj',)),
+    ('simples', 'dado_simples', 7, ('cnpj',)),
+)
+
+
+def _json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'Tipo não suportado no índice: {type(value)}')
+
+
+def _write_run(entries: list, directory: str) -> str:
+    """ Grava um bloco de entradas já ordenado em um arquivo temporário """
+
+    entries.sort()
+    fd, path = tempfile.mkstemp(suffix='.run', dir=directory)
+    with os.fdopen(fd, 'wb', buffering=settings.CNPJ_INDEX_BUFFER_SIZE) as run:
+        pack = ENTRY.pack
+        for entry in entries:
+            run.write(pack(*entry))
+    return path
+
+
+def _read_run(path: str) -> Iterator[tuple]:
+    """ Percorre as entradas de um arquivo temporário em blocos """
+
+    size = ENTRY.size * (settings.CNPJ_INDEX_BUFFER_SIZE // ENTRY.size)
+    with open(path, 'rb') as run:
+        while True:
+            block = run.read(size)
+            if not block:
+                break
+            yield from ENTRY.iter_unpack(block)
+
+
+def _write_section(output, directory: str, runs_directory: str, pattern_name: str, qt_column: int,
+                   key_columns: tuple) -> dict:
+    """
+    Grava os registros de um dataset e as entradas do índice em blocos ordenados de
+    CNPJ_INDEX_RUN_SIZE entradas (arquivos temporários), intercalados ao final do build,
+    evitando manter todas as entradas em memória
+    :param output: Arquivo do índice
+    :param directory: Diretório onde está os arquivos ZIP
+    :param runs_directory: Diretório dos arquivos temporários
+    :param pattern_name: Nome do pattern_name em utils.NAMES_PATTERNS
+    :param qt_column: Quantidade de colunas que se espera que tenha cada linha
+    :param key_columns: Colunas concatenadas na chave
+    :return: metadados da seção, com os arquivos temporários em runs
+    """
+    # Importado apenas na construção, a consulta (CnpjIndex) não depende do SQLAlchemy
+    from rfb.utils.convert_database import ConvertDatabase, list_files, read_chunks
+
+    populate_name = pattern_name.replace('_', ' ').upper()
+    parse_function = getattr(ConvertDatabase, f'parse_{pattern_name}')
+    keys = [parse_function.columns.index(column) for column in key_columns]
+
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_json_default).encode
+    entries, runs = [], []
+    total, skipped = 0, 0
+
+    for file in list_files(directory, pattern_name):
+        msg = f'[{populate_name}] Indexando o CSV {file}'
+        log.info(msg)
+        click.echo(msg, nl=True)
+
+        for chunk in read_chunks(file, populate_name, qt_column, parse_function):
+            for row in chunk.rows:
+                try:
+                    key = int(''.join([row[i] for i in keys]))
+                except (TypeError, ValueError):
+                    skipped += 1  # CNPJ vazio ou inválido
+                    continue
+
+                record = dumps(row).encode('utf-8')
+                entries.append((key, output.tell(), len(record)))
+                output.write(record)
+
+            if len(entries) >= settings.CNPJ_INDEX_RUN_SIZE:
+                runs.append(_write_run(entries, runs_directory))
+                total += len(entries)
+                entries = []
+
+    if entries:
+        runs.append(_write_run(entries, runs_directory))
+        total += len(entries)
+
+    if skipped:
+        log.warning(f'[{populate_name}] {skipped} linhas sem um CNPJ válido não foram indexadas')
+
+    return {'columns': list(parse_function.columns), 'count': total, 'runs': runs}
+
+
+def build(directory: str, path: str) -> dict:
+    """
+    Constrói o índice a partir dos arquivos ZIP da RFB, com as mesmas funções de leitura e
+    parse da carga. O arquivo é gravado ao lado do destino e substitui o anterior apenas
+    no final (os.replace), então as consultas abertas continuam no arquivo anterior
+    :param directory: Diretório onde está os arquivos ZIP
+    :param path: Arquivo de destino do índice
+    :return: metadados gravados no índice
+    """
+    path = os.path.abspath(path)
+    temp = f'{path}.tmp'
+    metadata = {'versao': 1, 'secoes': {}}
+
+    with tempfile.TemporaryDirectory(prefix='.cnpj_index_', dir=os.path.dirname(path)) as runs_directory:
+        try:
+            with open(temp, 'wb', buffering=settings.CNPJ_INDEX_BUFFER_SIZE) as output:
+                output.write(MAGIC)
+
+                sections = {
+                    section: _write_section(output, directory, runs_directory, pattern_name, qt_column, key_columns)
+                    for section, pattern_name, qt_column, key_columns in SECTIONS
+                }
+
+                # Intercala os blocos ordenados de cada seção no índice final
+                for section, info in sections.items():
+                    info['index'] = output.tell()
+                    pack = ENTRY.pack
+                    for entry in heapq.merge(*[_read_run(run) for run in info.pop('runs')]):
+                        output.write(pack(*entry))
+
+                    metadata['secoes'][section] = info
+
+                content = json.dumps(metadata, ensure_ascii=False).encode('utf-8')
+                position = output.tell()
+                output.write(content)
+                output.write(TRAILER.pack(position, len(content), MAGIC))
+
+                output.flush()
+                os.fsync(output.fileno())
+
+            os.replace(temp, path)
+        except BaseException:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+
+    counts = ', '.join(f'{info["count"]} {section}' for section, info in metadata['secoes'].items())
+    msg = f'Índice dos CNPJs gravado em {path} ({counts})'
+    log.info(msg)
+    click.echo(msg, nl=True)
+
+    return metadata
+
+
+class CnpjIndex:
+    """
+    Consulta do índice construído pelo build: o arquivo é aberto com mmap (apenas as
+    páginas consultadas são lidas do disco) e cada CNPJ é localizado por busca binária
+    nas entradas ordenadas
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: Arquivo do índice
+        """
+        self.path = path
+        self._mmap = None
+        self._open()
+
+    def _open(self) -> None:
+        with open(self.path, 'rb') as file:
+            self._stat = os.fstat(file.fileno())
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        position, size, magic = TRAILER.unpack_from(self._mmap, len(self._mmap) - TRAILER.size)
+        if self._mmap[:len(MAGIC)] != MAGIC or magic != MAGIC:
+            self._mmap.close()
+            raise ValueError(f'O arquivo {self.path} não é um índice dos CNPJs')
+
+        self.metadata = json.loads(self._mmap[position:position + size])
+        self._sections = {
+            section: (info['index'], info['count'], info['columns'])
+            for section, info in self.metadata['secoes'].items()
+        }
+
+    def refresh(self) -> bool:
+        """
+        Reabre o índice caso o arquivo tenha sido substituído por um novo build
+        :return: True caso o índice tenha sido reaberto
+        """
+        stat = os.stat(self.path)
+        if (stat.st_ino, stat.st_mtime_ns) == (self._stat.st_ino, self._stat.st_mtime_ns):
+            return False
+
+        old = self._mmap
+        self._open()
+        old.close()
+        return True
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _find(self, section: str, key: int) -> Optional[dict]:
+        """ Busca binária da chave nas entradas da seção """
+
+        index, count, columns = self._sections[section]
+        data, unpack_from, size = self._mmap, ENTRY.unpack_from, ENTRY.size
+
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if unpack_from(data, index + middle * size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low == count:
+            return None
+
+        found, position, length = unpack_from(data, index + low * size)
+        if found != key:
+            return None
+        return dict(zip(columns, json.loads(data[position:position + length])))
+
+    def lookup(self, cnpj) -> Optional[dict]:
+        """
+        Retorna o estabelecimento, a empresa e o Simples do CNPJ, as datas no formato ISO
+        :param cnpj: CNPJ completo (14 dígitos), com ou sem formatação
+        :return: dict com estabelecimento, empresa e simples (None quando não existir)
+            ou None caso o estabelecimento não exista
+        """
+        digits = ''.join(c for c in str(cnpj) if c.isdigit())
+        if len(digits) != 14:
+            raise ValueError(f'CNPJ inválido: {cnpj!r}, informe o CNPJ completo (14 dígitos)')
+
+        estabelecimento = self._find('estabelecimentos', int(digits))
+        if estabelecimento is None:
+            return None
+
+        base = int(digits[:8])
+        return {
+            'estabelecimento': estabelecimento,
+            'empresa': self._find('empresas', base),
+            'simples': self._find('simples', base),
+        }
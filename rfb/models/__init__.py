@@ -1,7 +1,9 @@
+from .checkpoint import Checkpoint
 from .cnae import Cnae
 from .dados_simples import DadoSimples
 from .empresa import Empresa
 from .estabelecimento import Estabelecimento
+from .estabelecimento_cnae import EstabelecimentoCnae
 from .motivo_cadastral import MotivoCadastral
 from .municipio import Municipio
 from .natureza import Natureza
@@ -11,10 +13,12 @@ from .socio import Socio
 
 
 __all__ = [
+    'Checkpoint',
     'Cnae',
     'DadoSimples',
     'Empresa',
     'Estabelecimento',
+    'EstabelecimentoCnae',
     'MotivoCadastral',
     'Municipio',
     'Natureza',
@@ -0,0 +1,29 @@
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import Column, String, BigInteger, Boolean, Integer
+
+Base = declarative_base()
+
+
+class Checkpoint(Base):
+    """
+    Model de controle com o progresso da importação de cada arquivo, gravado
+    na mesma transação de cada bloco inserido
+    """
+    __tablename__ = 'checkpoints'
+
+    id = Column(Integer, primary_key=True)
+
+    # NOME DO ARQUIVO ZIP
+    arquivo = Column(String, index=True)
+
+    # NOME DO ARQUIVO CSV DENTRO DO ZIP
+    membro = Column(String)
+
+    # HASH DO CONTEÚDO DO ARQUIVO ZIP
+    hash_arquivo = Column(String(length=32))
+
+    # QUANTIDADE DE LINHAS DO MEMBRO JÁ INSERIDAS
+    linha = Column(BigInteger)
+
+    # INDICA SE O MEMBRO FOI IMPORTADO POR COMPLETO
+    finalizado = Column(Boolean)
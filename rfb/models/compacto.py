@@ -0,0 +1,316 @@
+"""
+Schema compacto (--compacto): as mesmas tabelas do schema padrão com o CNPJ, o CEP,
+os telefones e os códigos gravados como inteiros e sem o id nas tabelas em que a
+chave natural é única. Os zeros à esquerda não são gravados, ex.: o CNPJ base
+00000000 é gravado como 0 e deve ser formatado na consulta (lpad(cnpj::text, 8, '0'))
+"""
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import Column, String, Date, Float, Boolean, SmallInteger, Integer, BigInteger, Index
+
+Base = declarative_base()
+
+
+class Empresa(Base):
+    """
+    Model com os dados da empresa, a chave é o CNPJ base
+    """
+    __tablename__ = 'empresas'
+
+    # NÚMERO BASE DE INSCRIÇÃO NO CNPJ (OITO PRIMEIROS DÍGITOS DO CNPJ)
+    cnpj = Column(Integer, primary_key=True, autoincrement=False)
+
+    # NOME EMPRESARIAL DA PESSOA JURÍDICA
+    razao = Column(String)
+
+    # CÓDIGO DA NATUREZA JURÍDICA
+    natureza = Column(SmallInteger)
+
+    # QUALIFICAÇÃO DA PESSOA FÍSICA RESPONSÁVEL PELA EMPRESA
+    qualificacao_pf = Column(SmallInteger)
+
+    # CAPITAL SOCIAL DA EMPRESA
+    capital = Column(Float)
+
+    # CÓDIGO DO PORTE DA EMPRESA
+    porte = Column(SmallInteger)
+
+    # ENTE FEDERATIVO RESPONSÁVEL
+    ente_federativo = Column(SmallInteger)
+
+
+class Estabelecimento(Base):
+    """
+    Model com os dados do estabelecimento, a chave é o CNPJ completo (14 dígitos)
+    """
+    __tablename__ = 'estabelecimentos'
+
+    # CNPJ COMPLETO (CNPJ BASE + ORDEM + DÍGITO VERIFICADOR)
+    cnpj_completo = Column(BigInteger, primary_key=True, autoincrement=False)
+
+    # NÚMERO BASE DE INSCRIÇÃO NO CNPJ (OITO PRIMEIROS DÍGITOS DO CNPJ)
+    cnpj = Column(Integer, index=True)
+
+    # CORRESPONDE AO NOME FANTASIA
+    nome = Column(String)
+
+    # CÓDIGO DO IDENTIFICADOR MATRIZ/FILIAL
+    matriz_filial = Column(SmallInteger)
+
+    # CÓDIGO DA SITUAÇÃO CADASTRAL
+    situacao = Column(SmallInteger, index=True)
+
+    # DATA DO EVENTO DA SITUAÇÃO CADASTRA
+    data_situacao = Column(Date)
+
+    # CÓDIGO DO MOTIVO DA SITUAÇÃO CADASTRAL
+    motivo_situacao = Column(SmallInteger)
+
+    # NOME DA CIDADE NO EXTERIOR
+    cidade_exterior = Column(String)
+
+    # CÓDIGO DO PAIS
+    pais = Column(SmallInteger)
+
+    # DATA DE INÍCIO DA ATIVIDADE
+    inicio_atividade = Column(Date)
+
+    # CÓDIGO DA ATIVIDADE ECONÔMICA PRINCIPAL DO ESTABELECIMENTO
+    cnae_fiscal = Column(Integer, index=True)
+
+    # CÓDIGO DA(S) ATIVIDADE(S) ECONÔMICA(S) SECUNDÁRIA(S) DO ESTABELECIMENTO
+    cnae_secundario = Column(String)
+
+    # DESCRIÇÃO DO TIPO DE LOGRADOURO
+    tipo_logradouro = Column(String)
+
+    # NOME DO LOGRADOURO ONDE SE LOCALIZA O ESTABELECIMENTO
+    logradouro = Column(String)
+
+    # NÚMERO ONDE SE LOCALIZA O ESTABELECIMENTO
+    numero = Column(String)
+
+    # COMPLEMENTO
+    complemento = Column(String)
+
+    # BAIRRO ONDE SE LOCALIZA O ESTABELECIMENTO
+    bairro = Column(String)
+
+    # CÓDIGO DE ENDEREÇAMENTO POSTAL
+    cep = Column(Integer)
+
+    # SIGLA DA UNIDADE DA FEDERAÇÃO
+    uf = Column(String(length=2), index=True)
+
+    # CÓDIGO DO MUNICÍPIO DE JURISDIÇÃO
+    municipio = Column(SmallInteger, index=True)
+
+    # CONTÉM O DDD 1
+    ddd_1 = Column(SmallInteger)
+
+    # CONTÉM O NÚMERO DO TELEFONE 1
+    telefone_1 = Column(BigInteger)
+
+    # CONTÉM O DDD 2
+    ddd_2 = Column(SmallInteger)
+
+    # CONTÉM O NÚMERO DO TELEFONE 2
+    telefone_2 = Column(BigInteger)
+
+    # CONTÉM O DDD DO FAX
+    ddd_fax = Column(SmallInteger)
+
+    # CONTÉM O NÚMERO DO FAX
+    numero_fax = Column(BigInteger)
+
+    # CONTÉM O E-MAIL DO CONTRIBUINTE
+    email = Column(String)
+
+    # SITUAÇÃO ESPECIAL DA EMPRESA
+    situacao_especial = Column(String)
+
+    # DATA EM QUE A EMPRESA ENTROU EM SITUAÇÃO ESPECIAL
+    data_situacao_especial = Column(Date)
+
+
+class EstabelecimentoCnae(Base):
+    """
+    Model com uma linha para cada CNAE (principal e secundários) do estabelecimento,
+    a chave atende a busca dos estabelecimentos de um CNAE
+    """
+    __tablename__ = 'estabelecimento_cnaes'
+    __table_args__ = (
+        # CNAEs de um estabelecimento
+        Index('ix_estabelecimento_cnaes_cnpj_completo', 'cnpj_completo'),
+    )
+
+    # CÓDIGO DA ATIVIDADE ECONÔMICA
+    cnae = Column(Integer, primary_key=True, autoincrement=False)
+
+    # INDICA SE É A ATIVIDADE ECONÔMICA PRINCIPAL (cnae_fiscal)
+    principal = Column(Boolean, primary_key=True)
+
+    # CNPJ COMPLETO DO ESTABELECIMENTO
+    cnpj_completo = Column(BigInteger, primary_key=True, autoincrement=False)
+
+
+class DadoSimples(Base):
+    """
+    Model com os dados do Simples Nacional, a chave é o CNPJ base
+    """
+    __tablename__ = 'dados_simples'
+
+    # NÚMERO BASE DE INSCRIÇÃO NO CNPJ (OITO PRIMEIROS DÍGITOS DO CNPJ)
+    cnpj = Column(Integer, primary_key=True, autoincrement=False)
+
+    # INDICADOR DA EXISTÊNCIA DA OPÇÃO PELO SIMPLES
+    opcao_simples = Column(String(length=1))
+
+    # DATA DE OPÇÃO PELO SIMPLES
+    data_opcao_simples = Column(Date)
+
+    # DATA DE EXCLUSÃO DO SIMPLES
+    data_exclusao = Column(Date)
+
+    # INDICADOR DA EXISTÊNCIA DA OPÇÃO PELO MEI
+    opcao_mei = Column(String(length=1))
+
+    # DATA DE OPÇÃO PELO MEI
+    data_opcao_mei = Column(Date)
+
+    # DATA DE EXCLUSÃO DO MEI
+    data_exclusao_mei = Column(Date)
+
+
+class Socio(Base):
+    """
+    Model com os dados do sócio, mantém o id pois uma empresa tem vários sócios
+    """
+    __tablename__ = 'socios'
+
+    id = Column(Integer, primary_key=True)
+
+    # NÚMERO BASE DE INSCRIÇÃO NO CNPJ (OITO PRIMEIROS DÍGITOS DO CNPJ)
+    cnpj = Column(Integer, index=True)
+
+    # CÓDIGO DO IDENTIFICADOR DE SÓCIO
+    identificador_socio = Column(SmallInteger)
+
+    # NOME DO SÓCIO OU RAZÃO SOCIAL
+    nome = Column(String)
+
+    # CPF OU CNPJ DO SÓCIO, O CPF É DESCARACTERIZADO (***999999**)
+    cpf_cnpj = Column(String(length=14), index=True)
+
+    # CÓDIGO DA QUALIFICAÇÃO DO SÓCIO
+    qualificacao = Column(SmallInteger)
+
+    # DATA DE ENTRADA NA SOCIEDADE
+    data_entrada_sociedade = Column(Date)
+
+    # CÓDIGO PAÍS DO SÓCIO ESTRANGEIRO
+    codigo_pais = Column(SmallInteger)
+
+    # CPF DO REPRESENTANTE LEGAL, DESCARACTERIZADO
+    cpf_representante_legal = Column(String(length=11))
+
+    # NOME DO REPRESENTANTE LEGAL
+    nome_representante_legal = Column(String)
+
+    # CÓDIGO DA QUALIFICAÇÃO DO REPRESENTANTE LEGAL
+    qualificacao_representante_legal = Column(SmallInteger)
+
+    # CÓDIGO DA FAIXA ETÁRIA DO SÓCIO
+    faixa_etaria = Column(SmallInteger)
+
+
+class Cnae(Base):
+    """
+    Model com os dados do CNAE
+    """
+    __tablename__ = 'cnaes'
+
+    # CÓDIGO DA ATIVIDADE ECONÔMICA
+    codigo = Column(Integer, primary_key=True, autoincrement=False)
+
+    # NOME DA ATIVIDADE ECONÔMICA
+    descricao = Column(String)
+
+
+class MotivoCadastral(Base):
+    """
+    Model com os motivos da situação cadastral
+    """
+    __tablename__ = 'motivo_cadastral'
+
+    # CÓDIGO DO MOTIVO
+    codigo = Column(SmallInteger, primary_key=True, autoincrement=False)
+
+    # DESCRIÇÃO DO MOTIVO
+    descricao = Column(String)
+
+
+class Municipio(Base):
+    """
+    Model com os municípios
+    """
+    __tablename__ = 'municipios'
+
+    # CÓDIGO DO MUNICÍPIO
+    codigo = Column(SmallInteger, primary_key=True, autoincrement=False)
+
+    # NOME DO MUNICÍPIO
+    descricao = Column(String)
+
+
+class Natureza(Base):
+    """
+    Model com as naturezas jurídicas
+    """
+    __tablename__ = 'naturezas'
+
+    # CÓDIGO DA NATUREZA JURÍDICA
+    codigo = Column(SmallInteger, primary_key=True, autoincrement=False)
+
+    # NOME DA NATUREZA JURÍDICA
+    descricao = Column(String)
+
+
+class Pais(Base):
+    """
+    Model com os países
+    """
+    __tablename__ = 'paises'
+
+    # CÓDIGO DO PAÍS
+    codigo = Column(SmallInteger, primary_key=True, autoincrement=False)
+
+    # NOME DO PAÍS
+    descricao = Column(String)
+
+
+class Qualificacao(Base):
+    """
+    Model com as qualificações dos sócios
+    """
+    __tablename__ = 'qualificacoes'
+
+    # CÓDIGO DA QUALIFICAÇÃO
+    codigo = Column(SmallInteger, primary_key=True, autoincrement=False)
+
+    # NOME DA QUALIFICAÇÃO
+    descricao = Column(String)
+
+
+__all__ = [
+    'Cnae',
+    'DadoSimples',
+    'Empresa',
+    'Estabelecimento',
+    'EstabelecimentoCnae',
+    'MotivoCadastral',
+    'Municipio',
+    'Natureza',
+    'Pais',
+    'Qualificacao',
+    'Socio'
+]
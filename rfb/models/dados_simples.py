@@ -14,7 +14,7 @@ class DadoSimples(Base):
 
     # NÚMERO BASE DE INSCRIÇÃO NO CNPJ (OITO PRIMEIROS
     # DÍGITOS DO CNPJ).
-    cnpj = Column(String(length=8))
+    cnpj = Column(String(length=8), index=True)
 
     # INDICADOR DA EXISTÊNCIA DA OPÇÃO PELO SIMPLES.
     #  S - SIM
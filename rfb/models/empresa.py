@@ -10,7 +10,7 @@ class Empresa(Base):
     id = Column(Integer, primary_key=True)
 
     # NÚMERO BASE DE INSCRIÇÃO NO CNPJ (OITO PRIMEIROS DÍGITOS DO CNPJ).
-    cnpj = Column(String(length=8))
+    cnpj = Column(String(length=8), index=True)
 
     # NOME EMPRESARIAL DA PESSOA JURÍDICA
     razao = Column(String)
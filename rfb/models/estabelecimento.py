@@ -1,11 +1,15 @@
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, String, Integer, Date
+from sqlalchemy import Column, String, Integer, Date, Index
 
 Base = declarative_base()
 
 
 class Estabelecimento(Base):
     __tablename__ = 'estabelecimentos'
+    __table_args__ = (
+        # CNPJ completo, também atende as consultas apenas pelo CNPJ base
+        Index('ix_estabelecimentos_cnpj_completo', 'cnpj', 'cnpj_ordem', 'cnpj_dv'),
+    )
 
     id = Column(Integer, primary_key=True)
 
@@ -35,7 +39,7 @@ class Estabelecimento(Base):
     #      3 – SUSPENSA
     #      4 – INAPTA
     #      08 – BAIXADA
-    situacao = Column(Integer)
+    situacao = Column(Integer, index=True)
 
     # DATA DO EVENTO DA SITUAÇÃO CADASTRA
     data_situacao = Column(Date)
@@ -54,7 +58,7 @@ class Estabelecimento(Base):
 
     # CÓDIGO DA ATIVIDADE ECONÔMICA PRINCIPAL DO
     # ESTABELECIMENTO
-    cnae_fiscal = Column(String)
+    cnae_fiscal = Column(String, index=True)
 
     # CÓDIGO DA(S) ATIVIDADE(S) ECONÔMICA(S) SECUNDÁRIA(S) DO
     # ESTABELECIMENTO
@@ -83,11 +87,11 @@ class Estabelecimento(Base):
 
     # SIGLA DA UNIDADE DA FEDERAÇÃO EM QUE SE ENCONTRA O
     # ESTABELECIMENTO
-    uf = Column(String(length=2))
+    uf = Column(String(length=2), index=True)
 
     # CÓDIGO DO MUNICÍPIO DE JURISDIÇÃO ONDE SE ENCONTRA O
     # ESTABELECIMENTO
-    municipio = Column(Integer)
+    municipio = Column(Integer, index=True)
 
     # CONTÉM O DDD 1
     ddd_1 = Column(String)
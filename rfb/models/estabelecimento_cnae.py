@@ -0,0 +1,39 @@
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import Column, String, Boolean, Integer, Index
+
+Base = declarative_base()
+
+
+class EstabelecimentoCnae(Base):
+    """
+    Model com uma linha para cada CNAE (principal e secundários) do estabelecimento,
+    preenchido a partir das colunas cnae_fiscal e cnae_secundario durante a carga
+    """
+    __tablename__ = 'estabelecimento_cnaes'
+    __table_args__ = (
+        # Estabelecimentos de um CNAE, apenas como principal ou secundário
+        Index('ix_estabelecimento_cnaes_cnae', 'cnae', 'principal'),
+        # CNAEs de um estabelecimento, mesma chave do ix_estabelecimentos_cnpj_completo
+        Index('ix_estabelecimento_cnaes_cnpj_completo', 'cnpj', 'cnpj_ordem', 'cnpj_dv'),
+    )
+
+    id = Column(Integer, primary_key=True)
+
+    # NÚMERO BASE DE INSCRIÇÃO NO CNPJ (OITO PRIMEIROS DÍGITOS
+    # DO CNPJ).
+    cnpj = Column(String(length=8))
+
+    # NÚMERO DO ESTABELECIMENTO DE INSCRIÇÃO NO CNPJ (DO
+    # NONO ATÉ O DÉCIMO SEGUNDO DÍGITO DO CNPJ).
+    cnpj_ordem = Column(String(length=4))
+
+    # DÍGITO VERIFICADOR DO NÚMERO DE INSCRIÇÃO NO CNPJ (DOIS
+    # ÚLTIMOS DÍGITOS DO CNPJ).
+    cnpj_dv = Column(String(length=2))
+
+    # CÓDIGO DA ATIVIDADE ECONÔMICA
+    cnae = Column(String(length=7))
+
+    # INDICA SE É A ATIVIDADE ECONÔMICA PRINCIPAL (cnae_fiscal)
+    # OU UMA DAS SECUNDÁRIAS (cnae_secundario)
+    principal = Column(Boolean)
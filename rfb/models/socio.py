@@ -14,7 +14,7 @@ class Socio(Base):
 
     # NÚMERO BASE DE INSCRIÇÃO NO CNPJ (CADASTRO
     # NACIONAL DA PESSOA JURÍDICA).
-    cnpj = Column(String(length=8))
+    cnpj = Column(String(length=8), index=True)
 
     # CÓDIGO DO IDENTIFICADOR DE SÓCIO
     # 1 – PESSOA JURÍDICA
@@ -29,7 +29,7 @@ class Socio(Base):
 
     # CPF OU CNPJ DO SÓCIO (SÓCIO ESTRANGEIRO NÃO TEM
     # ESTA INFORMAÇÃO).
-    cpf_cnpj = Column(String(length=14))
+    cpf_cnpj = Column(String(length=14), index=True)
 
     # CÓDIGO DA QUALIFICAÇÃO DO SÓCIO
     qualificacao = Column(Integer)
@@ -0,0 +1,411 @@
+# ------------------------------------------------------------------------------#
+#                                                                               |
+#     CONSULTA DO PERFIL COMPLETO DAS EMPRESAS POR CNPJ, COM CACHE E API HTTP   |
+#                                                                               |
+# ------------------------------------------------------------------------------#
+import json
+import click
+import threading
+
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import getLogger
+from time import monotonic
+from typing import Iterable, Optional
+from urllib.parse import parse_qs, urlparse
+
+from sqlalchemy import create_engine, inspect, select
+from sqlalchemy.engine import Connection, Engine
+
+from rfb import models, settings
+from rfb.models import compacto
+from rfb.utils.cache import MISSING, TTLCache
+from rfb.utils.convert import only_number
+
+
+log = getLogger(__name__)
+
+# Códigos do layout da RFB que não têm um arquivo de domínio
+MATRIZ_FILIAL = {1: 'MATRIZ', 2: 'FILIAL'}
+
+SITUACOES = {1: 'NULA', 2: 'ATIVA', 3: 'SUSPENSA', 4: 'INAPTA', 8: 'BAIXADA'}
+
+PORTES = {0: 'NÃO INFORMADO', 1: 'MICRO EMPRESA', 3: 'EMPRESA DE PEQUENO PORTE', 5: 'DEMAIS'}
+
+IDENTIFICADORES_SOCIO = {1: 'PESSOA JURÍDICA', 2: 'PESSOA FÍSICA', 3: 'ESTRANGEIRO'}
+
+FAIXAS_ETARIAS = {
+    0: 'NÃO SE APLICA', 1: 'ENTRE 0 A 12 ANOS', 2: 'ENTRE 13 A 20 ANOS', 3: 'ENTRE 21 A 30 ANOS',
+    4: 'ENTRE 31 A 40 ANOS', 5: 'ENTRE 41 A 50 ANOS', 6: 'ENTRE 51 A 60 ANOS', 7: 'ENTRE 61 A 70 ANOS',
+    8: 'ENTRE 71 A 80 ANOS', 9: 'MAIORES DE 80 ANOS',
+}
+
+
+def normalize_cnpj(cnpj) -> str:
+    """
+    Retorna apenas os dígitos do CNPJ base (8 dígitos) ou completo (14 dígitos)
+    :param cnpj: CNPJ com ou sem formatação, ex.: 00.000.000/0001-91 ou 00000000
+    :return: CNPJ com os zeros à esquerda
+    """
+    if isinstance(cnpj, int):
+        cnpj = str(cnpj).zfill(8 if cnpj < 10 ** 8 else 14)
+
+    digits = only_number(cnpj) if isinstance(cnpj, str) else None
+    if not digits or len(digits) not in (8, 14):
+        raise ValueError(f'CNPJ inválido: {cnpj!r}, informe o CNPJ base (8 dígitos) ou completo (14 dígitos)')
+    return digits
+
+
+def _code(value):
+    """ Chave dos códigos nas tabelas de domínio, '01' e 1 são o mesmo código """
+
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return value
+
+
+def _describe(descriptions: dict, value) -> Optional[dict]:
+    """ Retorna o código com a descrição ou None quando o código não foi informado """
+
+    if value is None or value == '':
+        return None
+    return {'codigo': value, 'descricao': descriptions.get(_code(value))}
+
+
+class CompanyQuery:
+    """
+    Monta o perfil completo das empresas (empresa, estabelecimentos, sócios, Simples e as
+    descrições dos códigos) com uma consulta por tabela para todo o lote de CNPJs. Os perfis
+    ficam em um cache LRU com TTL e as tabelas de domínio são mantidas em memória pelo
+    mesmo TTL. Funciona com o schema padrão e com o compacto (--compacto).
+    Os perfis retornados são os mesmos objetos do cache e não devem ser alterados
+    """
+
+    def __init__(self, database_url: str, engine: Optional[Engine] = None, cache: Optional[TTLCache] = None):
+        """
+        :param database_url: URL de conexão com o banco de dados
+        :param engine: Engine do SQLAlchemy, caso não seja informada será criada uma nova
+        :param cache: Cache dos perfis, caso não seja informado utiliza o QUERY_CACHE_SIZE e QUERY_CACHE_TTL
+        """
+        self.engine = engine or create_engine(database_url, future=True)
+        self.cache = cache or TTLCache()
+
+        # O schema compacto é identificado pela coluna cnpj_completo dos estabelecimentos
+        columns = {column['name'] for column in inspect(self.engine).get_columns('estabelecimentos')}
+        self.compact = 'cnpj_completo' in columns
+        self.models = compacto if self.compact else models
+
+        self._domains = None
+        self._domains_expire = 0.
+        self._lock = threading.Lock()
+
+    def clear(self) -> None:
+        """ Descarta o cache, ex.: após uma nova importação """
+
+        with self._lock:
+            self._domains = None
+        self.cache.clear()
+
+    def get_company(self, cnpj) -> Optional[dict]:
+        """
+        Retorna o perfil completo da empresa
+        :param cnpj: CNPJ base, que retorna todos os estabelecimentos, ou completo,
+            que retorna apenas o estabelecimento informado
+        :return: perfil da empresa ou None caso o CNPJ não exista
+        """
+        return self.get_companies([cnpj])[normalize_cnpj(cnpj)]
+
+    def get_companies(self, cnpjs: Iterable) -> dict:
+        """
+        Retorna o perfil completo de várias empresas, os CNPJs que não estão no cache
+        são consultados juntos, com uma consulta por tabela
+        :param cnpjs: CNPJs base ou completos
+        :return: dict com o CNPJ (apenas os dígitos) e o perfil da empresa ou None
+        """
+        keys = list(dict.fromkeys(normalize_cnpj(cnpj) for cnpj in cnpjs))
+
+        result, missing = {}, []
+        for key in keys:
+            profile = self.cache.get(key)
+            if profile is MISSING:
+                missing.append(key)
+            else:
+                result[key] = profile
+
+        if missing:
+            fetched = self._fetch(missing)
+            for key in missing:
+                self.cache.set(key, fetched[key])
+                result[key] = fetched[key]
+
+        return {key: result[key] for key in keys}
+
+    def _domain_tables(self, connection: Connection) -> dict:
+        """ Descrições dos códigos de cada tabela de domínio, recarregadas após o TTL """
+
+        with self._lock:
+            if self._domains is None or self._domains_expire < monotonic():
+                self._domains = {
+                    model.__tablename__: {
+                        _code(row.codigo): row.descricao for row in connection.execute(select(model.__table__))
+                    }
+                    for model in (self.models.Cnae, self.models.MotivoCadastral, self.models.Municipio,
+                                  self.models.Natureza, self.models.Pais, self.models.Qualificacao)
+                }
+                self._domains_expire = monotonic() + self.cache.ttl
+
+            return self._domains
+
+    @staticmethod
+    def _select(connection: Connection, model, cnpjs: list) -> dict:
+        """
+        Consulta as linhas da tabela pelo CNPJ base em lotes de QUERY_BATCH_SIZE
+        :return: dict com o CNPJ base e a lista de linhas (dict) de cada um
+        """
+        table = model.__table__
+        rows = {}
+
+        for start in range(0, len(cnpjs), settings.QUERY_BATCH_SIZE):
+            batch = cnpjs[start:start + settings.QUERY_BATCH_SIZE]
+            for row in connection.execute(select(table).where(table.c.cnpj.in_(batch))):
+                row = dict(row._mapping)
+                row.pop('id', None)
+                rows.setdefault(str(row['cnpj']).zfill(8), []).append(row)
+
+        return rows
+
+    def _fetch(self, keys: list) -> dict:
+        """ Consulta e monta os perfis dos CNPJs que não estão no cache """
+
+        bases = sorted({key[:8] for key in keys})
+        values = [int(base) for base in bases] if self.compact else bases
+
+        with self.engine.connect() as connection:
+            domains = self._domain_tables(connection)
+            empresas = self._select(connection, self.models.Empresa, values)
+            estabelecimentos = self._select(connection, self.models.Estabelecimento, values)
+            socios = self._select(connection, self.models.Socio, values)
+            simples = self._select(connection, self.models.DadoSimples, values)
+
+        # O perfil é montado uma vez por CNPJ base, o CNPJ completo filtra os estabelecimentos
+        companies = {}
+        for base in bases:
+            if base not in empresas:
+                continue
+
+            profile = self._empresa(empresas[base][0], domains)
+            profile['estabelecimentos'] = [
+                self._estabelecimento(row, domains) for row in estabelecimentos.get(base, [])
+            ]
+            profile['socios'] = [self._socio(row, domains) for row in socios.get(base, [])]
+            profile['simples'] = self._simples(simples[base][0]) if base in simples else None
+            companies[base] = profile
+
+        profiles = {}
+        for key in keys:
+            profile = companies.get(key[:8])
+            if profile is not None and len(key) == 14:
+                establishments = [row for row in profile['estabelecimentos'] if row['cnpj'] == key]
+                profile = dict(profile, estabelecimentos=establishments) if establishments else None
+            profiles[key] = profile
+
+        return profiles
+
+    @staticmethod
+    def _empresa(row: dict, domains: dict) -> dict:
+        row['cnpj'] = str(row['cnpj']).zfill(8)
+        row['natureza'] = _describe(domains['naturezas'], row['natureza'])
+        row['qualificacao_pf'] = _describe(domains['qualificacoes'], row['qualificacao_pf'])
+        row['porte'] = _describe(PORTES, row['porte'])
+        return row
+
+    @staticmethod
+    def _estabelecimento(row: dict, domains: dict) -> dict:
+        # O CNPJ do estabelecimento é sempre o completo, nos dois schemas
+        if 'cnpj_completo' in row:
+            row['cnpj'] = str(row.pop('cnpj_completo')).zfill(14)
+        else:
+            row['cnpj'] = row['cnpj'] + row.pop('cnpj_ordem') + row.pop('cnpj_dv')
+
+        if isinstance(row['cep'], int):
+            row['cep'] = str(row['cep']).zfill(8)
+        for column in ('telefone_1', 'telefone_2', 'numero_fax'):
+            if isinstance(row[column], int):
+                row[column] = str(row[column])
+
+        cnaes = domains['cnaes']
+        row['matriz_filial'] = _describe(MATRIZ_FILIAL, row['matriz_filial'])
+        row['situacao'] = _describe(SITUACOES, row['situacao'])
+        row['motivo_situacao'] = _describe(domains['motivo_cadastral'], row['motivo_situacao'])
+        row['pais'] = _describe(domains['paises'], row['pais'])
+        row['cnae_fiscal'] = _describe(cnaes, row['cnae_fiscal'])
+        row['cnae_secundario'] = [
+            _describe(cnaes, cnae.strip()) for cnae in (row['cnae_secundario'] or '').split(',') if cnae.strip()
+        ]
+        row['municipio'] = _describe(domains['municipios'], row['municipio'])
+        return row
+
+    @staticmethod
+    def _socio(row: dict, domains: dict) -> dict:
+        del row['cnpj']
+        row['identificador_socio'] = _describe(IDENTIFICADORES_SOCIO, row['identificador_socio'])
+        row['qualificacao'] = _describe(domains['qualificacoes'], row['qualificacao'])
+        row['codigo_pais'] = _describe(domains['paises'], row['codigo_pais'])
+        row['qualificacao_representante_legal'] = _describe(
+            domains['qualificacoes'], row['qualificacao_representante_legal']
+        )
+        row['faixa_etaria'] = _describe(FAIXAS_ETARIAS, row['faixa_etaria'])
+        return row
+
+    @staticmethod
+    def _simples(row: dict) -> dict:
+        del row['cnpj']
+        return row
+
+
+# Consulta utilizada pelas funções do módulo (connect)
+_default: Optional[CompanyQuery] = None
+
+
+def connect(database_url: str) -> CompanyQuery:
+    """
+    Define o banco de dados utilizado pelo get_company e get_companies
+    :param database_url: URL de conexão com o banco de dados
+    """
+    global _default
+    _default = CompanyQuery(database_url)
+    return _default
+
+
+def _get_default() -> CompanyQuery:
+    if _default is None:
+        raise RuntimeError('Informe o banco de dados com rfb.query.connect(database_url) antes das consultas')
+    return _default
+
+
+def get_company(cnpj) -> Optional[dict]:
+    """ Perfil completo da empresa no banco definido pelo connect (CompanyQuery.get_company) """
+    return _get_default().get_company(cnpj)
+
+
+def get_companies(cnpjs: Iterable) -> dict:
+    """ Perfil completo das empresas no banco definido pelo connect (CompanyQuery.get_companies) """
+    return _get_default().get_companies(cnpjs)
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    API HTTP das consultas:
+     - GET /empresas/<cnpj>: perfil de uma empresa
+     - GET /empresas?cnpj=<cnpj>,<cnpj>: perfil de várias empresas
+     - POST /empresas com {"cnpjs": [...]}: perfil de várias empresas
+    """
+
+    query: CompanyQuery = None
+
+    def _send(self, status: HTTPStatus, content) -> None:
+        body = json.dumps(content, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _companies(self, cnpjs: list) -> None:
+        if not cnpjs:
+            self._send(HTTPStatus.BAD_REQUEST, {'erro': 'Nenhum CNPJ informado'})
+        elif len(cnpjs) > settings.QUERY_HTTP_MAX_CNPJS:
+            self._send(HTTPStatus.BAD_REQUEST, {
+                'erro': f'Informe no máximo {settings.QUERY_HTTP_MAX_CNPJS} CNPJs por requisição'
+            })
+        else:
+            self._send(HTTPStatus.OK, self.query.get_companies(cnpjs))
+
+    def _handle(self, method) -> None:
+        try:
+            method()
+        except ValueError as e:
+            self._send(HTTPStatus.BAD_REQUEST, {'erro': str(e)})
+        except Exception as e:
+            log.exception(f'Erro na consulta {self.command} {self.path}: {e}')
+            self._send(HTTPStatus.INTERNAL_SERVER_ERROR, {'erro': 'Erro interno na consulta'})
+
+    def _get(self) -> None:
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split('/') if part]
+
+        if parts == ['empresas']:
+            cnpjs = [cnpj for value in parse_qs(url.query).get('cnpj', []) for cnpj in value.split(',') if cnpj]
+            self._companies(cnpjs)
+        elif len(parts) == 2 and parts[0] == 'empresas':
+            profile = self.query.get_company(parts[1])
+            if profile is None:
+                self._send(HTTPStatus.NOT_FOUND, {'erro': f'CNPJ {parts[1]} não encontrado'})
+            else:
+                self._send(HTTPStatus.OK, profile)
+        else:
+            self._send(HTTPStatus.NOT_FOUND, {'erro': 'Endereço inexistente'})
+
+    def _post(self) -> None:
+        if urlparse(self.path).path.rstrip('/') != '/empresas':
+            self._send(HTTPStatus.NOT_FOUND, {'erro': 'Endereço inexistente'})
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            content = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError as e:
+            raise ValueError(f'JSON inválido: {e}')
+
+        cnpjs = content.get('cnpjs') if isinstance(content, dict) else None
+        if not isinstance(cnpjs, list):
+            raise ValueError('Informe os CNPJs no formato {"cnpjs": [...]}')
+        self._companies(cnpjs)
+
+    def do_GET(self) -> None:  # noqa: N802
+        self._handle(self._get)
+
+    def do_POST(self) -> None:  # noqa: N802
+        self._handle(self._post)
+
+    def log_message(self, format: str, *args) -> None:
+        log.debug(f'{self.address_string()} - {format % args}')
+
+
+def serve(query: CompanyQuery, host: str = settings.QUERY_HTTP_HOST,
+          port: int = settings.QUERY_HTTP_PORT) -> ThreadingHTTPServer:
+    """
+    Cria o servidor HTTP das consultas, cada requisição é atendida em uma thread
+    :param query: Consulta compartilhada entre as requisições (e o cache)
+    :param host: Endereço, por padrão apenas local
+    :param port: Porta
+    :return: servidor, iniciado com serve_forever
+    """
+    handler = type('CompanyQueryHandler', (QueryHandler,), {'query': query})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+@click.command()
+@click.option("--database_url", "--database", "--database-url", type=click.STRING, required=True,
+              help="URL de conexão do banco de dados")
+@click.option("--host", show_default=True, default=settings.QUERY_HTTP_HOST, type=click.STRING,
+              help="Endereço da API")
+@click.option("--porta", show_default=True, default=settings.QUERY_HTTP_PORT, type=click.IntRange(1, 65535),
+              help="Porta da API")
+def start(database_url, host, porta):
+    server = serve(CompanyQuery(database_url), host, porta)
+
+    msg = f'API de consulta dos CNPJs em http://{host}:{porta}/empresas'
+    log.info(msg)
+    click.echo(msg)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    start()
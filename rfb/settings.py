@@ -4,8 +4,176 @@ ENCODING = 'ISO-8859-1'
 # Tamanho dos buffer no momento de persistir os dados no SGBD
 CHUNK_ROWS_INSERT_DATABASE = 20_000
 
+# Quantidade de linhas por transação na escrita do SQLite
+SQLITE_ROWS_PER_TRANSACTION = 200_000
+
+# Quantidade máxima de blocos aguardando a escrita do SQLite
+SQLITE_QUEUE_SIZE = 16
+
+# PRAGMAs utilizados na conexão de escrita do SQLite durante a carga. O WAL mantém o rollback
+# das transações (o progresso gravado nos checkpoints continua correto após uma queda) e
+# permite as consultas durante a escrita, o journal_mode WAL fica gravado no arquivo do banco
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -262_144,  # Em KiB (256MB)
+    'temp_store': 'MEMORY',
+}
+
+# Quantidade máxima de blocos aguardando os processos de escrita no pipeline, dividida entre
+# as filas de cada processo (todos os blocos de um arquivo vão para o mesmo processo)
+PIPELINE_QUEUE_SIZE = 64
+
+# Quantidade máxima de processos de escrita no pipeline (o SQLite utiliza sempre 1)
+PIPELINE_MAX_WRITERS = 4
+
+# Quantidade máxima de índices construídos ao mesmo tempo após a carga (o SQLite utiliza sempre 1)
+INDEX_WORKERS = 4
+
+# maintenance_work_mem utilizado por cada conexão na construção dos índices no PostgreSQL
+INDEX_MAINTENANCE_WORK_MEM = '1GB'
+
+# Coluna da partição de cada tabela particionada no PostgreSQL (--particionar): uf (uma
+# partição por UF) ou cnpj (PARTITION_CNPJ_RANGES faixas do CNPJ base)
+PARTITIONS = {'estabelecimentos': 'uf', 'socios': 'cnpj'}
+
+# Quantidade de faixas do CNPJ base nas tabelas particionadas pelo cnpj
+PARTITION_CNPJ_RANGES = 16
+
+# Quantidade de conexões gravando as partições ao mesmo tempo na carga das tabelas particionadas
+PARTITION_WORKERS = 4
+
+# Quantidade máxima de partes dos blocos aguardando cada conexão de escrita das partições
+PARTITION_QUEUE_SIZE = 32
+
+# Quantidade máxima de linhas de cada row group na exportação para Parquet
+PARQUET_ROW_GROUP_ROWS = 250_000
+
+# Compressão dos arquivos Parquet
+PARQUET_COMPRESSION = 'zstd'
+
+# Quantidade máxima de valores distintos guardados em cada cache da conversão (utils.convert),
+# as datas e os campos com poucos valores distintos reutilizam o mesmo objeto em todas as linhas
+CONVERT_CACHE_SIZE = 100_000
+
+# Memória máxima (bytes) dos blocos lidos e ainda não gravados, somando todos os
+# datasets e arquivos importados ao mesmo tempo
+BUFFER_MEMORY_BUDGET = 512 * 1024 * 1024
+
+# Tamanho médio estimado (bytes) de cada campo de uma linha convertida, utilizado
+# para estimar a memória de cada bloco no orçamento acima
+BUFFER_FIELD_SIZE = 64
+
+# Quantidade de blocos aguardando a escrita enquanto o próximo é lido (fora do SQLite)
+BUFFER_QUEUE_SIZE = 1
+
+# Tamanho lido do início de cada CSV na pré-análise (utils.prescan) para estimar as linhas
+PRESCAN_SAMPLE_SIZE = 1024 * 1024
+
+# Tamanho (bytes do CSV) de cada bloco escolhido pela pré-análise, limitado entre o mínimo
+# e o máximo de linhas, substitui o CHUNK_ROWS_INSERT_DATABASE
+PRESCAN_CHUNK_BYTES = 6 * 1024 * 1024
+PRESCAN_MIN_CHUNK_ROWS = 5_000
+PRESCAN_MAX_CHUNK_ROWS = 100_000
+
+# Tamanho descompactado de cada arquivo importado ao mesmo tempo escolhido pela pré-análise,
+# limitado ao máximo de arquivos, substitui o POPULATE_FILE_WORKERS
+PRESCAN_BYTES_PER_WORKER = 1024 * 1024 * 1024
+PRESCAN_MAX_FILE_WORKERS = 4
+
+# Ajuste contínuo do tamanho dos blocos (utils.batch) pela latência da inserção + commit,
+# a partir do CHUNK_ROWS_INSERT_DATABASE ou do tamanho escolhido pela pré-análise
+BATCH_ADAPTIVE = True
+
+# Tempo (segundos) desejado da inserção + commit de cada bloco
+BATCH_TARGET_SECONDS = 1.0
+
+# Limites (linhas) do tamanho dos blocos ajustados, o máximo também é limitado a metade do
+# BUFFER_MEMORY_BUDGET pela estimativa de cada linha (buffer.max_rows)
+BATCH_MIN_ROWS = 1_000
+BATCH_MAX_ROWS = 200_000
+
+# Peso de cada novo bloco na média móvel do tempo por linha
+BATCH_SMOOTHING = 0.3
+
+# Variação mínima (fração do tamanho atual) para que o tamanho dos blocos seja alterado
+BATCH_ADJUST_THRESHOLD = 0.1
+
+# Memória residente (bytes) do processo a partir da qual os blocos diminuem, None desativa
+BATCH_MEMORY_LIMIT = 1536 * 1024 * 1024
+
+# Intervalo mínimo (segundos) entre as mensagens de progresso da importação
+PROGRESS_INTERVAL = 10
+
+# Quantidade máxima de datasets importados ao mesmo tempo no modo em threads
+IMPORT_WORKERS = 4
+
+# Quantidade de arquivos do mesmo dataset importados ao mesmo tempo, cada um em uma
+# conexão própria da engine compartilhada, os datasets não informados utilizam 1
+POPULATE_FILE_WORKERS = {'estabelecimento': 4, 'socio': 2, 'empresa': 2}
+
+# Conexões mantidas no pool da engine compartilhada entre as threads (exceto no SQLite)
+DATABASE_POOL_SIZE = 16
+
+# Intervalo (segundos) entre as gravações das métricas no arquivo do Prometheus
+METRICS_INTERVAL = 15
+
+# Buckets (segundos) dos histogramas de latência da inserção e do commit
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Tamanho do buffer de leitura dos CSVs, a descompactação é medida a cada bloco
+METRICS_READ_BUFFER_SIZE = 1024 * 1024
+
+# Tamanho dos blocos lidos e decodificados de cada CSV pelo tokenizer
+TOKENIZER_BLOCK_SIZE = 4 * 1024 * 1024
+
+# Quantidade máxima de linhas de um registro com quebras de linha dentro dos campos
+TOKENIZER_MAX_LINES = 10
+
+# Quantidade máxima de perfis de empresas mantidos no cache das consultas (rfb.query)
+QUERY_CACHE_SIZE = 100_000
+
+# Tempo (segundos) em que cada perfil e as tabelas de domínio ficam no cache das consultas
+QUERY_CACHE_TTL = 3600
+
+# Quantidade máxima de CNPJs em cada IN das consultas em lote
+QUERY_BATCH_SIZE = 500
+
+# Quantidade máxima de CNPJs em cada requisição da API HTTP das consultas
+QUERY_HTTP_MAX_CNPJS = 1000
+
+# Endereço e porta padrão da API HTTP das consultas, apenas local por padrão
+QUERY_HTTP_HOST = '127.0.0.1'
+QUERY_HTTP_PORT = 8000
+
+# Quantidade de entradas ordenadas em memória na construção do índice dos CNPJs (rfb.cnpj_index),
+# os blocos ordenados são gravados em arquivos temporários e intercalados no final
+CNPJ_INDEX_RUN_SIZE = 2_000_000
+
+# Tamanho do buffer de escrita e leitura dos arquivos do índice dos CNPJs
+CNPJ_INDEX_BUFFER_SIZE = 4 * 1024 * 1024
+
 # Máxima de tentativas de download
 MAX_RETRY_DOWNLOAD = 100
 
+# Quantidade máxima de arquivos baixados ao mesmo tempo
+DOWNLOAD_WORKERS = 4
+
+# Quantidade de partes (conexões) em que cada arquivo grande é dividido, 1 desativa
+DOWNLOAD_SEGMENTS = 4
+
+# Tamanho mínimo do arquivo para ser dividido em partes
+DOWNLOAD_SEGMENT_MIN_SIZE = 64 * 1024 * 1024
+
+# Tamanho do buffer de leitura do download
+DOWNLOAD_BUFFER_SIZE = 1024 * 1024
+
+# Timeout (segundos) das conexões do download
+DOWNLOAD_TIMEOUT = 60
+
+# Espera (segundos) entre as tentativas de download, dobrando a cada tentativa até o máximo
+DOWNLOAD_BACKOFF = 1
+DOWNLOAD_BACKOFF_MAX = 60
+
 # URL da receita federal onde está os arquivos
 URL_BASE_RFB = 'http://200.152.38.155/CNPJ/'
@@ -0,0 +1,100 @@
+# ------------------------------------------------------------------------------#
+#                                                                               |
+#     AJUSTE CONTÍNUO DO TAMANHO DOS BLOCOS PELA LATÊNCIA DA INSERÇÃO           |
+#                                                                               |
+# ------------------------------------------------------------------------------#
+import os
+import click
+import threading
+
+from logging import getLogger
+from typing import Optional
+
+from rfb import settings
+
+
+log = getLogger(__name__)
+
+
+def rss() -> Optional[int]:
+    """ Memória residente (bytes) do processo, None quando não disponível (fora do Linux) """
+
+    try:
+        with open('/proc/self/statm', 'rb') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError, IndexError):
+        return None
+
+
+class BatchController:
+    """
+    Tamanho dos blocos de um arquivo ajustado a cada bloco gravado: a partir da média
+    móvel do tempo por linha (inserção + commit), o próximo bloco tem o tamanho que
+    levaria BATCH_TARGET_SECONDS, no máximo dobrando ou caindo pela metade a cada
+    ajuste. Quando a memória do processo passa de BATCH_MEMORY_LIMIT os blocos caem
+    pela metade. Utilizado como o chunk_size do read_chunks (chamado a cada bloco)
+    """
+
+    def __init__(self, size: int, name: str,
+                 minimum: int = settings.BATCH_MIN_ROWS,
+                 maximum: int = settings.BATCH_MAX_ROWS,
+                 target: float = settings.BATCH_TARGET_SECONDS,
+                 memory_limit: Optional[int] = settings.BATCH_MEMORY_LIMIT):
+        """
+        :param size: Tamanho inicial (linhas), ex.: escolhido pela pré-análise
+        :param name: Nome utilizado nas mensagens de log
+        :param minimum: Menor tamanho (linhas) dos blocos
+        :param maximum: Maior tamanho (linhas) dos blocos
+        :param target: Tempo (segundos) desejado da inserção + commit de cada bloco
+        :param memory_limit: Memória residente (bytes) a partir da qual os blocos diminuem,
+            None desativa
+        """
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target = target
+        self.memory_limit = memory_limit
+        self.size = self._bound(size)
+        self.per_row = None
+        self._lock = threading.Lock()
+
+    def _bound(self, size: float) -> int:
+        return int(max(self.minimum, min(size, self.maximum)))
+
+    def __call__(self) -> int:
+        return self.size
+
+    def observe(self, rows: int, seconds: float) -> None:
+        """
+        Registra o tempo de um bloco gravado e ajusta o tamanho dos próximos
+        :param rows: Quantidade de linhas do bloco
+        :param seconds: Tempo (segundos) da inserção + commit do bloco
+        """
+        if rows <= 0:
+            return
+
+        with self._lock:
+            sample = seconds / rows
+            if self.per_row is None:
+                self.per_row = sample
+            else:
+                self.per_row += settings.BATCH_SMOOTHING * (sample - self.per_row)
+
+            size = self.target / self.per_row if self.per_row > 0 else self.maximum
+            size = max(self.size / 2, min(size, self.size * 2))
+            reason = f'{self.per_row * self.size:.2f}s por bloco, alvo de {self.target}s'
+
+            memory = rss() if self.memory_limit else None
+            if memory is not None and memory > self.memory_limit:
+                size = min(size, self.size / 2)
+                reason = f'memória do processo em {memory / 1048576:.0f}MB'
+
+            size = self._bound(size)
+            if abs(size - self.size) < self.size * settings.BATCH_ADJUST_THRESHOLD:
+                return
+
+            previous, self.size = self.size, size
+
+        msg = f'[{self.name}] Tamanho dos blocos ajustado de {previous} para {size} linhas ({reason})'
+        log.info(msg)
+        click.echo(msg, nl=True)
@@ -0,0 +1,180 @@
+# ------------------------------------------------------------------------------#
+#                                                                               |
+#    ESCRITA EM PARALELO À LEITURA, COM FILA LIMITADA E ORÇAMENTO DE MEMÓRIA    |
+#                                                                               |
+# ------------------------------------------------------------------------------#
+import threading
+
+from functools import partial
+from logging import getLogger
+from queue import Empty, Full, Queue
+from typing import Callable, Iterator, Optional, Union
+
+from rfb import settings
+
+
+log = getLogger(__name__)
+
+
+def estimate_size(rows: int, columns: int) -> int:
+    """
+    Estimativa da memória ocupada por um bloco de linhas já convertidas
+    :param rows: Quantidade de linhas do bloco
+    :param columns: Quantidade de colunas de cada linha
+    :return: tamanho estimado em bytes
+    """
+    return rows * columns * settings.BUFFER_FIELD_SIZE
+
+
+class MemoryBudget:
+    """
+    Limite global da memória dos blocos em trânsito (lidos e ainda não gravados),
+    compartilhado entre todos os datasets importados ao mesmo tempo. A leitura de um
+    novo bloco aguarda até que os blocos já gravados liberem o espaço necessário
+    """
+
+    def __init__(self, limit: int = settings.BUFFER_MEMORY_BUDGET):
+        """
+        :param limit: Memória máxima (bytes) dos blocos em trânsito
+        """
+        self.limit = limit
+        self.used = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, size: int) -> int:
+        """
+        Reserva o espaço de um bloco, aguardando a liberação caso o limite tenha sido
+        alcançado. Um bloco maior do que o limite é reservado quando nada mais estiver
+        em trânsito, evitando o bloqueio eterno
+        :param size: Tamanho estimado do bloco (estimate_size)
+        :return: tamanho reservado, que deve ser informado no release
+        """
+        size = min(size, self.limit)
+        with self.condition:
+            self.condition.wait_for(lambda: self.used + size <= self.limit)
+            self.used += size
+        return size
+
+    def release(self, size: int) -> None:
+        """ Libera o espaço reservado de um bloco já gravado """
+
+        with self.condition:
+            self.used -= size
+            self.condition.notify_all()
+
+
+# Orçamento compartilhado entre todas as threads do processo
+BUDGET = MemoryBudget()
+
+
+def max_rows(columns: int, budget: MemoryBudget = BUDGET) -> int:
+    """
+    Maior bloco que ainda permite a leitura do próximo enquanto o anterior é gravado,
+    cada bloco com no máximo metade do orçamento
+    :param columns: Quantidade de colunas de cada linha
+    :param budget: Orçamento de memória
+    :return: quantidade máxima de linhas de cada bloco
+    """
+    return max(budget.limit // (2 * estimate_size(1, columns)), 1)
+
+
+def reserve(items: Iterator, size: Union[int, Callable[[], int]], budget: MemoryBudget = BUDGET) -> Iterator[tuple]:
+    """
+    Percorre os items reservando o espaço de cada um no orçamento antes da leitura
+    :param items: Iterator dos blocos (ex.: read_chunks)
+    :param size: Tamanho estimado de cada bloco (estimate_size) ou função chamada antes
+        de cada bloco retornando o mesmo, quando o tamanho dos blocos é ajustado
+    :param budget: Orçamento de memória
+    :return: tuplas (item, release), release deve ser chamado após a escrita do item
+    """
+    while True:
+        reserved = budget.acquire(size() if callable(size) else size)
+        try:
+            item = next(items)
+        except StopIteration:
+            budget.release(reserved)
+            return
+        except BaseException:
+            budget.release(reserved)
+            raise
+
+        yield item, partial(budget.release, reserved)
+
+
+class ChunkWriter(threading.Thread):
+    """
+    Grava os blocos em uma thread própria enquanto a thread de leitura faz o parse do
+    próximo bloco (double buffering). A fila é limitada, então a leitura aguarda quando
+    a escrita está mais lenta (backpressure)
+    """
+
+    def __init__(self, write: Callable, queue_size: int = settings.BUFFER_QUEUE_SIZE, name: str = 'cnpj_writer'):
+        """
+        :param write: Função executada na thread para cada bloco, com os argumentos do put
+        :param queue_size: Quantidade máxima de blocos aguardando a escrita
+        :param name: Nome da thread
+        """
+        super().__init__(name=name, daemon=True)
+        self.write = write
+        self.queue = Queue(maxsize=max(queue_size, 1))
+        self.error = None
+
+    def _check(self) -> None:
+        if self.error is not None:
+            raise RuntimeError('A escrita dos blocos foi interrompida por um erro') from self.error
+
+    def put(self, *args, on_done: Optional[Callable[[], None]] = None) -> None:
+        """
+        Envia um bloco para a escrita, aguardando espaço na fila
+        :param args: Argumentos da função write
+        :param on_done: Chamado após a escrita do bloco, mesmo em caso de erro
+            (ex.: liberação do orçamento de memória)
+        """
+        while True:
+            if self.error is not None and on_done is not None:
+                on_done()
+            self._check()
+
+            try:
+                self.queue.put((args, on_done), timeout=1)
+                return
+            except Full:
+                continue
+
+    def run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            args, on_done = item
+            try:
+                if self.error is None:
+                    self.write(*args)
+            except Exception as e:
+                self.error = e
+                log.error(f'Erro na escrita dos blocos: {e}')
+            finally:
+                if on_done is not None:
+                    on_done()
+
+    def close(self) -> None:
+        """ Aguarda a escrita dos blocos pendentes e repassa o erro da escrita, se houver """
+
+        self.queue.put(None)
+        self.join()
+        self._check()
+
+    def abort(self) -> None:
+        """ Descarta os blocos pendentes, utilizado quando a leitura falha """
+
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except Empty:
+                break
+            if item is not None and item[1] is not None:
+                item[1]()
+
+        self.queue.put(None)
+        self.join()
@@ -0,0 +1,78 @@
+# ------------------------------------------------------------------------------#
+#                                                                               |
+#            CACHE LRU COM TEMPO DE EXPIRAÇÃO (TTL) DAS CONSULTAS               |
+#                                                                               |
+# ------------------------------------------------------------------------------#
+import threading
+
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Hashable, Iterable
+
+from rfb import settings
+
+
+# Indica que a chave não está no cache, o None também é guardado (ex.: CNPJ inexistente)
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Cache limitado a maxsize chaves, descartando as menos utilizadas (LRU), no qual
+    cada valor expira após ttl segundos. Pode ser compartilhado entre threads
+    """
+
+    def __init__(self, maxsize: int = settings.QUERY_CACHE_SIZE, ttl: float = settings.QUERY_CACHE_TTL):
+        """
+        :param maxsize: Quantidade máxima de chaves, 0 desativa o cache
+        :param ttl: Tempo (segundos) em que cada valor é mantido
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        """ Retorna o valor ou MISSING caso a chave não exista ou tenha expirado """
+
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return MISSING
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """ Guarda o valor, descartando as chaves menos utilizadas após o limite """
+
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = (monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, keys: Iterable[Hashable]) -> None:
+        """ Remove as chaves do cache """
+
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """ Remove todas as chaves, ex.: após uma nova importação """
+
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
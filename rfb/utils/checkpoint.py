@@ -0,0 +1,81 @@
+# ------------------------------------------------------------------------------#
+#                                                                               |
+#        CONTROLE DO PROGRESSO DA IMPORTAÇÃO PARA RETOMAR DE ONDE PAROU         |
+#                                                                               |
+# ------------------------------------------------------------------------------#
+import os
+
+from hashlib import blake2b
+from pathlib import PurePath
+from zipfile import ZipFile
+
+from sqlalchemy import Integer, func, select
+from sqlalchemy.orm import Session
+
+from rfb.models import Checkpoint
+
+
+# Colunas gravadas a cada bloco inserido, a tabela só recebe inclusões
+COLUMNS = ('arquivo', 'membro', 'hash_arquivo', 'linha', 'finalizado')
+
+# Quantidade de bytes do início do arquivo utilizados no hash
+HASH_SAMPLE_SIZE = 1024 * 1024
+
+
+def content_hash(size: int, head: bytes) -> str:
+    """
+    Retorna o hash que identifica a versão do arquivo a partir do tamanho e do início
+    do mesmo, o que permite calculá-lo antes do download do arquivo terminar
+    :param size: Tamanho total do arquivo
+    :param head: Primeiros HASH_SAMPLE_SIZE bytes do arquivo
+    """
+    digest = blake2b(digest_size=16)
+    digest.update(str(size).encode())
+    digest.update(head[:HASH_SAMPLE_SIZE])
+    return digest.hexdigest()
+
+
+def file_hash(path: PurePath) -> str:
+    """
+    Retorna o hash que identifica a versão do arquivo (content_hash)
+    :param path: Caminho do arquivo
+    """
+    with open(path, 'rb') as file:
+        return content_hash(os.fstat(file.fileno()).st_size, file.read(HASH_SAMPLE_SIZE))
+
+
+def load(session: Session, file: PurePath, hash_file: str) -> dict:
+    """
+    Retorna o progresso já gravado da importação do arquivo
+    :param session: Sessão do SQLAlchemy
+    :param file: Caminho do arquivo ZIP
+    :param hash_file: Hash do conteúdo do arquivo, checkpoints de outras versões são ignorados
+    :return: dict com o nome do membro e uma tupla (linhas inseridas, finalizado)
+    """
+    table = Checkpoint.__table__
+    query = select(
+        table.c.membro, func.max(table.c.linha), func.max(table.c.finalizado.cast(Integer))
+    ).where(
+        table.c.arquivo == file.name,
+        table.c.hash_arquivo == hash_file
+    ).group_by(table.c.membro)
+
+    return {member: (line, bool(finished)) for member, line, finished in session.execute(query)}
+
+
+def row(file: PurePath, member: str, hash_file: str, line: int, finished: bool) -> tuple:
+    """ Retorna a linha da tabela de checkpoints na ordem de COLUMNS """
+    return file.name, member, hash_file, line, finished
+
+
+def is_finished(file: PurePath, progress: dict) -> bool:
+    """
+    Verifica se todos os membros do arquivo ZIP já foram importados
+    :param file: Caminho do arquivo ZIP
+    :param progress: Progresso retornado pela função load
+    """
+    if not progress:
+        return False
+
+    with ZipFile(file, 'r') as zip_file:
+        return all(progress.get(member, (0, False))[1] for member in zip_file.namelist())
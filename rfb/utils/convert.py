@@ -1,5 +1,50 @@
 import re
 from datetime import date
+from functools import wraps
+
+from rfb import settings
+
+
+# Tudo que não é dígito, compilado apenas uma vez
+NOT_NUMBER = re.compile(r'[^0-9]')
+
+
+class ConvertCache(dict):
+    """
+    Cache dos valores convertidos de uma coluna, indexado pelo texto original.
+    Os valores encontrados são retornados direto pelo dict, sem a chamada de uma
+    função em Python, e os novos são convertidos pelo __missing__. O cache é
+    limitado a maxsize valores, após o limite os novos valores são apenas convertidos
+    """
+
+    def __init__(self, function, maxsize: int = settings.CONVERT_CACHE_SIZE):
+        super().__init__()
+        self.function = function
+        self.maxsize = maxsize
+
+    def __missing__(self, value):
+        result = self.function(value)
+        if len(self) < self.maxsize:
+            self[value] = result
+        return result
+
+
+def memoize(function):
+    """
+    Guarda em cache os valores convertidos das colunas que se repetem muito (datas,
+    UF, códigos, etc.), evitando a conversão e a criação de um novo objeto a cada linha
+    :param function: Função de conversão de um único valor
+    :return: função com o cache, o ConvertCache fica no atributo cache e é utilizado
+        direto pelos conversores de linhas (utils.fields.compile_converter)
+    """
+    cache = ConvertCache(function)
+
+    @wraps(function)
+    def wrapper(value):
+        return cache[value]
+
+    wrapper.cache = cache
+    return wrapper
 
 
 def parse_float(value):
@@ -26,9 +71,22 @@ def parse_int(value):
         return None
 
 
+@memoize
+def parse_code(value):
+    """
+    Convert o código (município, natureza, situação, etc.) para inteiro,
+    reutilizando o mesmo objeto para os códigos repetidos
+    :param value:
+    :return:
+    """
+    return parse_int(value)
+
+
+@memoize
 def parse_date(value):
     """
-    Convert o valor para uma datetime.date
+    Convert o valor para uma datetime.date, as datas se repetem muito e são
+    guardadas em cache pelo texto original
     :param value:
     :return:
     """
@@ -44,10 +102,69 @@ def parse_date(value):
     return None
 
 
+@memoize
+def parse_text(value):
+    """
+    Retorna o texto ou None, reutilizando a mesma string nas colunas com poucos
+    valores distintos (CNAE, motivo, tipo de logradouro, etc.)
+    :param value:
+    :return:
+    """
+    return value or None
+
+
 def only_number(value):
     """
     Retorna apenas os números ou o valor None
     :param value:
     :return:
     """
-    return re.compile(r'[^0-9]').sub('', str(value)) if value is not None else None
+    if value is None:
+        return None
+
+    value = str(value)
+    if value.isascii() and value.isdigit():
+        return value
+    return NOT_NUMBER.sub('', value)
+
+
+def parse_cep(value):
+    """
+    Retorna apenas os números do CEP ou None caso o mesmo não tenha 8 dígitos
+    :param value:
+    :return:
+    """
+    cep = only_number(value)
+    return cep if len(cep) == 8 else None
+
+
+@memoize
+def parse_uf(value):
+    """
+    Retorna a UF ou None, algumas UF estão com os dados errados vindo da RFB
+    :param value:
+    :return:
+    """
+    return value or None if len(value) <= 2 else None
+
+
+def parse_number(value):
+    """
+    Retorna apenas os números convertidos para inteiro ou None, utilizado no
+    schema compacto (telefones)
+    :param value:
+    :return:
+    """
+    number = only_number(value)
+    return int(number) if number else None
+
+
+def parse_cep_number(value):
+    """
+    Retorna o CEP convertido para inteiro ou None caso o mesmo não tenha 8 dígitos,
+    utilizado no schema compacto
+    :param value:
+    :return:
+    """
+    cep = parse_cep(value)
+    return int(cep) if cep else None
@@ -6,16 +6,23 @@
 import click
 from rfb import settings
 
-from typing import Optional
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Optional, Union
 from logging import getLogger
+from time import perf_counter
 
-from sqlalchemy import create_engine
+from sqlalchemy import Table, create_engine, delete
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm.decl_api import DeclarativeMeta
 
 from rfb.models import DadoSimples
 from rfb.models import Empresa
 from rfb.models import Estabelecimento
+from rfb.models import EstabelecimentoCnae
 from rfb.models import Socio
 from rfb.models import Pais
 from rfb.models import Municipio
@@ -23,13 +30,111 @@ from rfb.models import Qualificacao
 from rfb.models import Natureza
 from rfb.models import Cnae
 from rfb.models import MotivoCadastral
+from rfb.models import Checkpoint
+from rfb.models import compacto
 from pathlib import Path, PurePath
 from zipfile import ZipFile
 from rfb.utils import NAMES_PATTERNS
-from rfb.utils import convert
+from rfb.utils import checkpoint
+from rfb.utils import fields
+from rfb.utils import metrics
+from rfb.utils import partitions
+from rfb.utils.batch import BatchController
+from rfb.utils.buffer import ChunkWriter, estimate_size, max_rows, reserve
+from rfb.utils.delta import NATURAL_KEYS, DeltaTables, row_hash
+from rfb.utils.fields import compile_converter
+from rfb.utils.indexes import create_indexes, create_table, drop_indexes
+from rfb.utils.loader import get_loader
+from rfb.utils.metrics import REGISTRY
+from rfb.utils.progress import PROGRESS
+from rfb.utils.shadow import ShadowTables
+from rfb.utils.sqlite_writer import SqliteWriter
+from rfb.utils.tokenizer import tokenize
+from rfb.utils.zip_stream import GrowingFile, iter_members
 
 log = getLogger(__name__)
 
+# Tabelas com índices declarados nos models, das maiores para as menores
+INDEXED_TABLES = [
+    Estabelecimento.__table__,
+    EstabelecimentoCnae.__table__,
+    Socio.__table__,
+    Empresa.__table__,
+    DadoSimples.__table__,
+]
+
+# Tabelas de domínio, carregadas por completo a cada importação
+DOMAIN_TABLES = [
+    Cnae.__table__,
+    Pais.__table__,
+    Municipio.__table__,
+    Qualificacao.__table__,
+    Natureza.__table__,
+    MotivoCadastral.__table__,
+]
+
+# Mesmas tabelas no schema compacto (models.compacto)
+COMPACT_INDEXED_TABLES = [
+    compacto.Estabelecimento.__table__,
+    compacto.EstabelecimentoCnae.__table__,
+    compacto.Socio.__table__,
+    compacto.Empresa.__table__,
+    compacto.DadoSimples.__table__,
+]
+
+COMPACT_DOMAIN_TABLES = [
+    compacto.Cnae.__table__,
+    compacto.Pais.__table__,
+    compacto.Municipio.__table__,
+    compacto.Qualificacao.__table__,
+    compacto.Natureza.__table__,
+    compacto.MotivoCadastral.__table__,
+]
+
+# Tabela estabelecimento_cnaes do schema de cada model dos estabelecimentos
+CNAE_TABLES = {
+    Estabelecimento: EstabelecimentoCnae.__table__,
+    compacto.Estabelecimento: compacto.EstabelecimentoCnae.__table__,
+}
+
+
+def read_lines(lines: Iterable[bytes], skip: int = 0, columns: Optional[int] = None,
+               on_quoted: Optional[Callable[[], None]] = None) -> Iterator[list]:
+    """
+    Faz a leitura de um arquivo CSV retornando as colunas de cada registro
+    :param lines: Conteúdo do CSV ainda não decodificado, arquivo aberto ou blocos de bytes
+    :param skip: Quantidade de registros iniciais que serão descartados sem o parse
+    :param columns: Quantidade de colunas esperada, os registros com outra quantidade
+        passam pela separação com aspas (utils.tokenizer)
+    :param on_quoted: Chamado a cada registro separado pela separação com aspas
+    :return: lista na qual cada elemento representa uma coluna da linha lida
+    """
+    return tokenize(lines, skip, columns, on_quoted)
+
+
+def read_member(file: ZipFile, name: str, skip: int = 0) -> Iterator[list]:
+    """
+    Faz a leitura de um dos arquivos CSV de dentro do ZIP retornando a linha lida
+    :param file: Arquivo ZIP aberto
+    :param name: Nome do arquivo CSV dentro do ZIP
+    :param skip: Quantidade de linhas iniciais que serão descartadas sem o parse
+    :return: lista na qual cada elemento representa uma coluna da linha lida
+    """
+    with file.open(name, mode='r') as content:
+        yield from read_lines(content, skip)
+
+
+def zip_members(path: PurePath) -> Iterator[tuple]:
+    """
+    Retorna os membros do arquivo ZIP já baixado
+    :param path: Caminho do arquivo ZIP
+    :return: tuplas (nome do membro, linhas do membro)
+    """
+    with ZipFile(path, 'r') as zip_file:
+        for name in zip_file.namelist():
+            with zip_file.open(name, mode='r') as content:
+                yield name, content
+
 
 def read_file(path: str) -> list:
     """
@@ -41,12 +146,129 @@ def read_file(path: str) -> list:
     file = ZipFile(path, 'r')
 
     for name in file.namelist():
-        content = file.open(name, mode='r')
+        yield from read_member(file, name)
+
+
+def list_files(directory: str, pattern_name: str) -> list:
+    """
+    Retorna os arquivos ZIP do diretório referentes ao pattern_name
+    :param directory: Diretório onde está os arquivos
+    :param pattern_name: Nome do pattern_name em utils.NAMES_PATTERNS
+    """
+    file_pattern_name = NAMES_PATTERNS[pattern_name]
+    files_csvs = filter(
+        lambda p: p.name.startswith(file_pattern_name) and p.name.endswith('.zip'),
+        Path(directory).iterdir()
+    )
+    return sorted(files_csvs)
+
+
+def files_size(directory: str, pattern_name: str) -> int:
+    """
+    Retorna o tamanho total (compactado) dos arquivos do pattern_name, utilizado
+    para importar os maiores primeiro
+    :param directory: Diretório onde está os arquivos
+    :param pattern_name: Nome do pattern_name em utils.NAMES_PATTERNS
+    """
+    if not Path(directory).is_dir():
+        return 0
+    return sum(file.stat().st_size for file in list_files(directory, pattern_name))
+
+
+# Bloco de linhas convertidas de um membro do ZIP
+#  member: nome do arquivo CSV dentro do ZIP
+#  line: quantidade de linhas do membro lidas até o final do bloco
+#  rows: linhas convertidas pela função de parse
+#  finished: indica que é o último bloco do membro
+Chunk = namedtuple('Chunk', ['member', 'line', 'rows', 'finished'])
+
+
+def read_chunks(file: PurePath, populate_name: str, columns: int,
+                parse_function: Callable[[list], tuple],
+                chunk_size: Union[int, Callable[[], int]] = settings.CHUNK_ROWS_INSERT_DATABASE,
+                resume: Optional[dict] = None,
+                members: Optional[Iterator[tuple]] = None) -> Iterator[Chunk]:
+    """
+    Faz a leitura e o parse do arquivo retornando blocos de linhas prontos para a inserção
+    :param file: Caminho do arquivo ZIP que será lido
+    :param populate_name: Nome utilizado nas mensagens de log
+    :param columns: Quantidade de colunas que se espera que tenha cada linha
+    :param parse_function: Função responsável por fazer o parse de cada linha
+    :param chunk_size: Quantidade de linhas de cada bloco ou função chamada a cada bloco
+        retornando a mesma, ex.: batch.BatchController
+    :param resume: Progresso já gravado (checkpoint.load), os membros finalizados são
+        ignorados e as linhas já inseridas são descartadas
+    :param members: Membros do ZIP (nome, conteúdo), caso não sejam informados serão
+        lidos do arquivo (zip_members), ex.: zip_stream.iter_members durante o download
+    :return: blocos (Chunk) com as linhas convertidas pela parse_function
+    """
+    resume = resume or {}
+
+    if members is None:
+        members = zip_members(file)
+
+    for member, lines in members:
+        skip, finished = resume.get(member, (0, False))
+        if finished:
+            continue
+
+        if skip:
+            PROGRESS.skip(populate_name, skip)
+            msg = f'[{populate_name}] Retomando o CSV {member} do arquivo {file} a partir da linha {skip + 1}'
+            log.info(msg)
+            click.echo(msg, nl=True)
+
+        lines, reader = metrics.timed_lines(lines)
+        rows = read_lines(lines, skip, columns,
+                          partial(REGISTRY.inc, 'rfb_rows_quoted_total', dataset=populate_name))
+        line, finished = skip, False
+
+        while not finished:
+            size = chunk_size() if callable(chunk_size) else chunk_size
+            start = perf_counter()
+            raw = list(islice(rows, size))
+            read = perf_counter()
+            rows_cache = [parse_function(row) for row in raw if len(row) == columns]
+            parsed = perf_counter()
+
+            finished = len(raw) < size
+            decompress, read_bytes = reader.take() if reader else (0., 0)
+            REGISTRY.inc('rfb_stage_seconds_total', decompress, stage='decompress', dataset=populate_name)
+            REGISTRY.inc('rfb_stage_seconds_total', read - start - decompress, stage='decode', dataset=populate_name)
+            REGISTRY.inc('rfb_stage_seconds_total', parsed - read, stage='parse', dataset=populate_name)
+            REGISTRY.inc('rfb_bytes_decompressed_total', read_bytes, dataset=populate_name)
+            REGISTRY.inc('rfb_rows_parsed_total', len(rows_cache), dataset=populate_name)
+            PROGRESS.advance(populate_name, len(raw))
+
+            if len(rows_cache) != len(raw):
+                i, row = next((i, row) for i, row in enumerate(raw, line) if len(row) != columns)
+                msg = f'[{populate_name}] Erro de integridade na leitura do arquivo, linha {i} arquivo {file}! '\
+                      f'Esperado {columns} e encontrado {len(row)}'
+                log.error(msg)
+                raise ValueError(msg)
+
+            line += len(raw)
+            if not finished:
+                msg = f'[{populate_name}] Inserindo o registro {line} do arquivo {file}'
+                log.debug(msg)
+                click.echo(msg, nl=True)
+
+            # O último bloco leva os resquícios de dados que podem ter ficado sem ser inseridos
+            yield Chunk(member, line, rows_cache, finished)
+
 
-        for line in content:
-            row = line.strip().decode(encoding=settings.ENCODING, errors='replace')
-            row = row.replace('\0', '')[1:-1].split('";"')
-            yield row
+def cnae_inserts(model: DeclarativeMeta, split_cnaes: Optional[Callable[[list], list]],
+                 rows: list) -> Optional[list]:
+    """
+    Retorna o bloco da tabela estabelecimento_cnaes gerado a partir das linhas já convertidas
+    :param model: Model dos estabelecimentos (schema padrão ou compacto)
+    :param split_cnaes: Função gerada pelo fields.cnae_splitter, None quando a tabela não é carregada
+    :param rows: Linhas convertidas dos estabelecimentos
+    :return: lista de blocos (table, columns, rows) para o _insert ou None
+    """
+    if split_cnaes is None:
+        return None
+    return [(CNAE_TABLES[model], split_cnaes.columns, split_cnaes(rows))]
 
 
 class ConvertDatabase:
@@ -55,176 +277,131 @@ class ConvertDatabase:
     de dados
     """
 
-    def __init__(self, database_url: str, directory: str):
+    def __init__(self, database_url: str, directory: str, loader=None, engine: Optional[Engine] = None,
+                 compact: bool = False, partitioned: bool = False, cnaes_secundarios: bool = False):
         """
         :param database_url: URL de conexão com o banco de dados
         :param directory: Diretório onde está os arquivos CSV
+        :param loader: Estratégia de carga dos dados, caso não seja informada,
+            será utilizada a mais rápida disponível para o SGBD
+        :param engine: Engine compartilhada entre as threads, cada instância utiliza
+            uma conexão do pool, caso não seja informada será criada uma nova
+        :param compact: Utiliza o schema compacto (models.compacto) na criação das
+            tabelas e dos índices, a carga utiliza o model informado no populate
+        :param partitioned: Cria as tabelas de settings.PARTITIONS particionadas (apenas
+            PostgreSQL), a carga identifica as tabelas particionadas no próprio banco
+        :param cnaes_secundarios: Cria a tabela estabelecimento_cnaes e os índices da mesma,
+            utilizada apenas na carga com --cnaes_secundarios
         """
 
-        engine_kwargs = {
-            'url': database_url,
-            'echo': False,
-            'future': True,
-            'encoding': settings.ENCODING
-        }
+        if engine is None:
+            engine_kwargs = {
+                'url': database_url,
+                'echo': False,
+                'future': True,
+                'encoding': settings.ENCODING
+            }
+            if not database_url.startswith('sqlite'):
+                engine_kwargs['pool_size'] = settings.DATABASE_POOL_SIZE
+
+            engine = create_engine(**engine_kwargs)
 
-        self.engine = create_engine(**engine_kwargs)
+        self.engine = engine
         self.directory = directory
         self.session = sessionmaker(bind=self.engine)()
+        self.loader = loader or get_loader(self.engine.dialect.name)
+        self.compact = compact
+        self.partitioned = partitioned
+        self.cnaes_secundarios = cnaes_secundarios
+
+    @property
+    def indexed_tables(self) -> list:
+        """ Tabelas de dados do schema utilizado, a estabelecimento_cnaes apenas com cnaes_secundarios """
+
+        tables = COMPACT_INDEXED_TABLES if self.compact else INDEXED_TABLES
+        if self.cnaes_secundarios:
+            return list(tables)
+        return [table for table in tables if table not in CNAE_TABLES.values()]
 
     def create_tables(self):
         """
-        Cria as tabelas da bases de dados
+        Cria as tabelas da bases de dados, os índices dos dados são construídos
+        apenas após a carga (create_indexes)
         """
-        Empresa().metadata.create_all(self.engine)
-        Estabelecimento().metadata.create_all(self.engine)
-        DadoSimples().metadata.create_all(self.engine)
-        Socio().metadata.create_all(self.engine)
-        Cnae().metadata.create_all(self.engine)
-        Pais().metadata.create_all(self.engine)
-        Municipio().metadata.create_all(self.engine)
-        Qualificacao().metadata.create_all(self.engine)
-        Natureza().metadata.create_all(self.engine)
-        MotivoCadastral().metadata.create_all(self.engine)
-
-    def parse_empresa(self, row: list) -> dict:
-        """ Faz o parse e tratamento da linha do arquivo em um dict compativo com models.Empresa """
-
-        return {
-            'cnpj': row[0] or None,
-            'razao': row[1] or None,
-            'natureza': convert.parse_int(row[2]),
-            'qualificacao_pf': convert.parse_int(row[3]),
-            'capital': convert.parse_float(row[4]),
-            'porte': convert.parse_int(row[5]),
-            'ente_federativo': convert.parse_int(row[6]),
-        }
-
-    def parse_estabelecimento(self, row: list) -> dict:
-        """ Faz o parse e tratamento da linha do arquivo em um dict compativo com models.Estabelecimento """
-
-        cep = convert.only_number(row[18])
-        cep = cep if len(cep) == 8 else None
-
-        # Algumas UF estão com os dados errados vindo da RFB
-        uf = row[19] or None if len(row[19]) <= 2 else None
-
-        return {
-                'cnpj': row[0] or None,
-                'cnpj_ordem': row[1] or None,
-                'cnpj_dv': row[2] or None,
-                'matriz_filial': convert.parse_int(row[3]),
-                'nome': row[4] or None,
-                'situacao': convert.parse_int(row[5]),
-                'data_situacao': convert.parse_date(row[6]),
-                'motivo_situacao': row[7] or None,
-                'cidade_exterior': row[8] or None,
-                'pais': convert.parse_int(row[9]),
-                'inicio_atividade': convert.parse_date(row[10]),
-                'cnae_fiscal': row[11] or None,
-                'cnae_secundario': row[12] or None,
-                'tipo_logradouro': row[13] or None,
-                'logradouro': row[14] or None,
-                'numero': row[15] or None,
-                'complemento': row[16] or None,
-                'bairro': row[17] or None,
-                'cep': cep,
-                'uf': uf,
-                'municipio': convert.parse_int(row[20]),
-                'ddd_1': convert.parse_int(row[21]),
-                'telefone_1': convert.only_number(row[22]),
-                'ddd_2': convert.parse_int(row[23]),
-                'telefone_2': convert.only_number(row[24]),
-                'ddd_fax': convert.parse_int(row[25]),
-                'numero_fax': convert.only_number(row[26]),
-                'email': row[27] or None,
-                'situacao_especial': row[28] or None,
-                'data_situacao_especial': convert.parse_date(row[29]),
-        }
-
-    def parse_dado_simples(self, row: list) -> dict:
-        """ Faz o parse e tratamento da linha do arquivo em um dict compativo com models.DadoSimples """
-
-        return {
-            'cnpj': row[0] or None,
-            'opcao_simples': row[1] or None,
-            'data_opcao_simples': convert.parse_date(row[2]),
-            'data_exclusao': convert.parse_date(row[3]),
-            'opcao_mei': row[4] or None,
-            'data_opcao_mei': convert.parse_date(row[5]),
-            'data_exclusao_mei': convert.parse_date(row[6]),
-        }
-
-    def parse_socio(self, row: list) -> dict:
-        """ Faz o parse e tratamento da linha do arquivo em um dict compativo com models.Socio """
-
-        return {
-            'cnpj': row[0] or None,
-            'identificador_socio': convert.parse_int(row[1]),
-            'nome': row[2] or None,
-            'cpf_cnpj': row[3] or None,
-            'qualificacao': convert.parse_int(row[4]),
-            'data_entrada_sociedade': convert.parse_date(row[5]),
-            'codigo_pais': convert.parse_int(row[6]),
-            'cpf_representante_legal': row[7] or None,
-            'nome_representante_legal': row[8] or None,
-            'qualificacao_representante_legal': convert.parse_int(row[9]),
-            'faixa_etaria': row[10] or None,
-        }
+        if self.partitioned and self.engine.dialect.name != 'postgresql':
+            raise ValueError('O particionamento das tabelas é suportado apenas no PostgreSQL')
 
-    def parse_pais(self, row: list) -> dict:
-        """ Faz o parse e tratamento da linha do arquivo em um dict compativo com models.Pais """
+        tables = self.indexed_tables + (COMPACT_DOMAIN_TABLES if self.compact else DOMAIN_TABLES)
 
-        return {
-            'codigo': convert.parse_int(row[0]),
-            'descricao': row[1] or None
-        }
+        for table in tables:
+            if self.partitioned and table.name in settings.PARTITIONS:
+                partitions.create_table(self.engine, partitions.PartitionScheme(table, settings.PARTITIONS[table.name]))
+            else:
+                create_table(self.engine, table)
+        Checkpoint().metadata.create_all(self.engine)
 
-    def parse_municipio(self, row: list) -> dict:
-        """ Faz o parse e tratamento da linha do arquivo em um dict compativo com models.Municipio """
-
-        return {
-            'codigo': row[0],
-            'descricao': row[1]
-        }
-
-    def parse_qualificacao(self, row: list) -> dict:
-        """ Faz o parse e tratamento da linha do arquivo em um dict compativo com models.Qualificacao """
-
-        return {
-            'codigo': convert.parse_int(row[0]),
-            'descricao': row[1] or None
-        }
-
-    def parse_natureza(self, row: list) -> dict:
-        """ Faz o parse e tratamento da linha do arquivo em um dict compativo com models.Natureza """
-
-        return {
-            'codigo': convert.parse_int(row[0]),
-            'descricao': row[1] or None
-        }
-
-    def parse_cnae(self, row: list) -> dict:
-        """ Faz o parse e tratamento da linha do arquivo em um dict compativo com models.Cnae """
+    def shadow_tables(self, models: list, cnaes_secundarios: bool = False) -> ShadowTables:
+        """
+        Cria a nova geração (utils.shadow) das tabelas dos models, que recebe a recarga
+        enquanto as consultas continuam nas tabelas atuais
+        :param models: Models carregados no populate
+        :param cnaes_secundarios: Recarrega também a tabela estabelecimento_cnaes
+        """
+        tables = [model.__table__ for model in models]
+        if cnaes_secundarios:
+            tables += [CNAE_TABLES[model] for model in models if model in CNAE_TABLES]
 
-        return {
-            'codigo': row[0] or None,
-            'descricao': row[1] or None
-        }
+        shadow = ShadowTables(self.engine, tables)
+        shadow.create()
+        return shadow
 
-    def parse_motivo_cadastral(self, row: list) -> dict:
-        """ Faz o parse e tratamento da linha do arquivo em um dict compativo com models.MotivoCadastral """
+    def drop_indexes(self):
+        """
+        Remove os índices das tabelas de dados antes da carga
+        """
+        drop_indexes(self.engine, self.indexed_tables)
 
-        return {
-            'codigo': convert.parse_int(row[0]),
-            'descricao': row[1] or None
-        }
+    def create_indexes(self, workers: int = settings.INDEX_WORKERS):
+        """
+        Constrói em paralelo os índices das tabelas de dados após a carga
+        :param workers: Quantidade de índices construídos ao mesmo tempo
+        """
+        create_indexes(self.engine, self.indexed_tables, workers)
+
+    # Conversores das linhas dos arquivos em tuplas na ordem das colunas do INSERT,
+    # gerados a partir do layout declarado em utils.fields
+    parse_empresa = staticmethod(compile_converter('parse_empresa', fields.EMPRESA))
+    parse_estabelecimento = staticmethod(compile_converter('parse_estabelecimento', fields.ESTABELECIMENTO))
+    parse_dado_simples = staticmethod(compile_converter('parse_dado_simples', fields.DADO_SIMPLES))
+    parse_socio = staticmethod(compile_converter('parse_socio', fields.SOCIO))
+    parse_pais = staticmethod(compile_converter('parse_pais', fields.CODIGO_INTEIRO))
+    parse_municipio = staticmethod(compile_converter('parse_municipio', fields.CODIGO_INTEIRO))
+    parse_qualificacao = staticmethod(compile_converter('parse_qualificacao', fields.CODIGO_INTEIRO))
+    parse_natureza = staticmethod(compile_converter('parse_natureza', fields.CODIGO_INTEIRO))
+    parse_cnae = staticmethod(compile_converter('parse_cnae', fields.CODIGO_TEXTO))
+    parse_motivo_cadastral = staticmethod(compile_converter('parse_motivo_cadastral', fields.CODIGO_INTEIRO))
+
+    # Conversores do schema compacto, as tabelas de domínio com código inteiro utilizam os mesmos
+    parse_empresa_compacto = staticmethod(compile_converter('parse_empresa_compacto', fields.EMPRESA_COMPACTO))
+    parse_estabelecimento_compacto = staticmethod(
+        compile_converter('parse_estabelecimento_compacto', fields.ESTABELECIMENTO_COMPACTO)
+    )
+    parse_dado_simples_compacto = staticmethod(
+        compile_converter('parse_dado_simples_compacto', fields.DADO_SIMPLES_COMPACTO)
+    )
+    parse_socio_compacto = staticmethod(compile_converter('parse_socio_compacto', fields.SOCIO_COMPACTO))
+    parse_cnae_compacto = staticmethod(compile_converter('parse_cnae_compacto', fields.CODIGO_INTEIRO))
 
     def populate(self,
                  pattern_name: str,
                  qt_column: int,
                  model: DeclarativeMeta,
-                 parse_function: Optional[str] = None) -> None:
+                 parse_function: Optional[str] = None,
+                 delta: bool = False,
+                 workers: Optional[int] = None,
+                 cnaes_secundarios: bool = False,
+                 chunk_size: int = settings.CHUNK_ROWS_INSERT_DATABASE,
+                 shadow: Optional[ShadowTables] = None) -> None:
         """
         Preenche os dados da tabela de motivo cadastral
 
@@ -240,33 +417,265 @@ class ConvertDatabase:
         :param parse_function:
             Nome da função responsável por fazer os parse da informação,
             caso não seja informado, será utilizado baseado no pattern_name
+
+        :param delta:
+            Aplica apenas as diferenças em relação à última importação nas tabelas
+            com chave natural (utils.delta.NATURAL_KEYS), as demais são recarregadas
+
+        :param workers:
+            Quantidade de arquivos importados ao mesmo tempo, cada um com uma sessão
+            própria, caso não seja informado será utilizado o settings.POPULATE_FILE_WORKERS
+
+        :param cnaes_secundarios:
+            Separa o CNAE principal e os secundários de cada estabelecimento na tabela
+            estabelecimento_cnaes, carregada junto com cada bloco. Não suporta o delta
+            nem as tabelas particionadas
+
+        :param chunk_size:
+            Quantidade de linhas de cada bloco inserido, ex.: escolhida pela pré-análise
+            (utils.prescan)
+
+        :param shadow:
+            Carrega as tabelas da nova geração (utils.shadow) no lugar das tabelas atuais,
+            todos os arquivos são importados e o progresso só é gravado na troca das tabelas.
+            Não suporta o delta
         """
 
-        path = Path(self.directory)
-        file_pattern_name = NAMES_PATTERNS[pattern_name]
-        files_csvs = filter(lambda p: p.name.startswith(file_pattern_name) and p.name.endswith('.zip'), path.iterdir())
-        files_csvs = sorted(files_csvs)
+        files_csvs = list_files(self.directory, pattern_name)
         populate_name = pattern_name.replace('_', ' ').upper()
 
         if parse_function is None:
             parse_function = f'parse_{pattern_name}'
 
-        for file in files_csvs:
-            self._execute(
-                populate_name=populate_name,
-                columns=qt_column,
-                parse_function=parse_function,
-                model=model,
-                file=file
-            )
+        delta_tables = None
+        if delta and cnaes_secundarios:
+            raise ValueError('A importação incremental não suporta a tabela estabelecimento_cnaes')
+
+        if delta and shadow is not None:
+            raise ValueError('A importação incremental não suporta a recarga em tabelas sombra')
+
+        if delta:
+            self.loader.flush()
+
+            if model.__tablename__ in NATURAL_KEYS:
+                delta_tables = DeltaTables(model.__table__, getattr(self, parse_function).columns)
+                delta_tables.prepare(self.session)
+            else:
+                # A tabela é recarregada, então o progresso gravado dos arquivos também é descartado
+                self.session.execute(delete(model.__table__))
+                self.session.execute(delete(Checkpoint.__table__).where(
+                    Checkpoint.__table__.c.arquivo.in_([file.name for file in files_csvs])
+                ))
+                self.session.commit()
+
+        if workers is None:
+            workers = settings.POPULATE_FILE_WORKERS.get(pattern_name, 1)
+
+        # Sem a thread de escrita o SQLite não suporta as escritas concorrentes
+        if self.engine.dialect.name == 'sqlite' and not isinstance(self.loader, SqliteWriter):
+            workers = 1
+
+        # Tabela particionada (create_tables): recarga de todas as partições em paralelo,
+        # a importação incremental grava na tabela principal e o PostgreSQL separa as linhas
+        scheme = None if delta or shadow else partitions.table_scheme(self.session, model.__table__)
+        self.session.commit()
+
+        if scheme is not None:
+            if cnaes_secundarios:
+                raise ValueError('As tabelas particionadas não suportam a tabela estabelecimento_cnaes')
+
+            self._load_partitions(scheme, files_csvs, workers, populate_name, qt_column, parse_function,
+                                  chunk_size)
+            PROGRESS.finish(populate_name)
+
+            info = f'[{populate_name}] Finalizado a inserção dos { populate_name }'
+            log.info(info)
+            click.echo(info, nl=True)
+            return
+
+        execute_kwargs = {
+            'populate_name': populate_name,
+            'columns': qt_column,
+            'parse_function': parse_function,
+            'model': model,
+            'delta_tables': delta_tables,
+            'cnaes_secundarios': cnaes_secundarios,
+            'chunk_size': chunk_size,
+            'shadow': shadow
+        }
 
+        if workers <= 1 or len(files_csvs) <= 1:
+            for file in files_csvs:
+                self._execute(file=file, **execute_kwargs)
+        else:
+            self._execute_parallel(files_csvs, min(workers, len(files_csvs)), execute_kwargs)
+
+        if delta_tables is not None:
+            self.loader.flush()
+            result = delta_tables.apply(self.session)
+            info = f'[{populate_name}] Importação incremental: {result["incluidos"]} incluídos, ' \
+                   f'{result["alterados"]} alterados e {result["excluidos"]} excluídos'
+            log.info(info)
+            click.echo(info, nl=True)
+
+        PROGRESS.finish(populate_name)
         info = f'[{populate_name}] Finalizado a inserção dos { populate_name }'
         log.info(info)
         click.echo(info, nl=True)
 
+    def _execute_parallel(self, files: list, workers: int, execute_kwargs: dict) -> None:
+        """
+        Importa os arquivos em threads, cada uma com uma sessão própria da mesma engine,
+        os maiores arquivos primeiro. No primeiro erro os arquivos que ainda não começaram
+        são cancelados e o erro é repassado
+        :param files: Arquivos ZIP do pattern_name
+        :param workers: Quantidade de arquivos importados ao mesmo tempo
+        :param execute_kwargs: Demais parâmetros do _execute
+        """
+
+        def execute(file: PurePath) -> None:
+            convert_database = ConvertDatabase(str(self.engine.url), self.directory, self.loader, self.engine)
+            try:
+                convert_database._execute(file=file, **execute_kwargs)
+            finally:
+                convert_database.session.close()
+
+        files = sorted(files, key=lambda file: file.stat().st_size, reverse=True)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cnpj_file') as executor:
+            futures = [executor.submit(execute, file) for file in files]
+
+            try:
+                for future in futures:
+                    future.result()
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def _load_partitions(self, scheme: partitions.PartitionScheme, files: list, workers: int,
+                         populate_name: str, columns: int, parse_function: str,
+                         chunk_size: int = settings.CHUNK_ROWS_INSERT_DATABASE) -> None:
+        """
+        Recarrega a tabela particionada (partitions.PartitionLoad): os arquivos são lidos em
+        até workers threads e as linhas de cada bloco são separadas por partição. O progresso
+        é gravado apenas após a troca das partições, então uma carga interrompida é refeita
+        por completo e os arquivos já importados são ignorados
+
+        :param scheme: Partições da tabela
+        :param files: Arquivos ZIP do pattern_name
+        :param workers: Quantidade de arquivos lidos ao mesmo tempo
+        :param populate_name: Nome utilizado nas mensagens de log
+        :param columns: Quantidade de colunas que se espera que tenha cada linha
+        :param parse_function: Nome da função responsável por fazer os parse da informação
+        :param chunk_size: Quantidade de linhas de cada bloco
+        """
+        parse_function = getattr(self, parse_function)
+
+        hashes = {file: checkpoint.file_hash(file) for file in files}
+        progress = {file: checkpoint.load(self.session, file, hashes[file]) for file in files}
+        self.session.commit()
+
+        if files and all(checkpoint.is_finished(file, progress[file]) for file in files):
+            for file in files:
+                PROGRESS.skip_file(populate_name, file.name)
+            msg = f'[{populate_name}] Os CSVs já foram importados, ignorando'
+            log.info(msg)
+            click.echo(msg, nl=True)
+            return
+
+        size = estimate_size(chunk_size, len(parse_function.columns))
+        load = partitions.PartitionLoad(self.engine, scheme, parse_function.columns, self.loader)
+        finished = []
+
+        def read(file: PurePath) -> None:
+            msg = f'[{populate_name}] Importando o CSV {file}'
+            log.info(msg)
+            click.echo(msg, nl=True)
+
+            chunks = read_chunks(file, populate_name, columns, parse_function, chunk_size)
+            for chunk, release in reserve(chunks, size):
+                load.put(chunk.rows, on_done=release)
+                if chunk.finished:
+                    finished.append(checkpoint.row(file, chunk.member, hashes[file], chunk.line, True))
+
+        load.start()
+        try:
+            if workers <= 1 or len(files) <= 1:
+                for file in files:
+                    read(file)
+            else:
+                workers = min(workers, len(files))
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cnpj_file') as executor:
+                    futures = [executor.submit(read, file) for file in files]
+                    try:
+                        for future in futures:
+                            future.result()
+                    except Exception:
+                        for future in futures:
+                            future.cancel()
+                        raise
+
+            load.finish()
+        except BaseException:
+            load.abort()
+            raise
+
+        self.loader.insert(self.session, Checkpoint.__table__, checkpoint.COLUMNS, finished)
+        self.session.commit()
+
+    def import_file(self,
+                    file: PurePath,
+                    pattern_name: str,
+                    qt_column: int,
+                    model: DeclarativeMeta,
+                    parse_function: Optional[str] = None,
+                    stream: Optional[GrowingFile] = None,
+                    cnaes_secundarios: bool = False) -> None:
+        """
+        Importa um único arquivo do pattern_name, utilizado na importação durante o download
+
+        :param file:
+            Caminho final do arquivo ZIP
+
+        :param pattern_name:
+            Nome do pattern_name em utils.NAMES_PATTERNS
+
+        :param qt_column:
+            Quantidade de colunas que se espera que tenha cada linha
+
+        :param model:
+            Classe responsável pela manipulação dos dados no banco de dados
+
+        :param parse_function:
+            Nome da função responsável por fazer os parse da informação,
+            caso não seja informado, será utilizado baseado no pattern_name
+
+        :param stream:
+            Arquivo que ainda está sendo baixado, lido sequencialmente enquanto os
+            bytes chegam, caso não seja informado o arquivo já deve estar completo
+
+        :param cnaes_secundarios:
+            Carrega também a tabela estabelecimento_cnaes (populate)
+        """
+
+        self._execute(
+            populate_name=pattern_name.replace('_', ' ').upper(),
+            columns=qt_column,
+            parse_function=parse_function or f'parse_{pattern_name}',
+            model=model,
+            file=file,
+            stream=stream,
+            cnaes_secundarios=cnaes_secundarios
+        )
+
     def _execute(self, file: PurePath, populate_name: str,
                  columns: int, model: DeclarativeMeta,
-                 parse_function: Optional[str] = None):
+                 parse_function: Optional[str] = None,
+                 delta_tables: Optional[DeltaTables] = None,
+                 stream: Optional[GrowingFile] = None,
+                 cnaes_secundarios: bool = False,
+                 chunk_size: int = settings.CHUNK_ROWS_INSERT_DATABASE,
+                 shadow: Optional[ShadowTables] = None):
         """
         Executa o insert no banco de dados
 
@@ -282,32 +691,160 @@ class ConvertDatabase:
         :param parse_function:
             Nome da função responsável por fazer os parse da informação,
             caso não seja informado, será utilizado baseado no pattern_name
+
+        :param delta_tables:
+            Tabelas da importação incremental, as linhas são inseridas na tabela
+            de versão com o hash de cada linha
+
+        :param stream:
+            Arquivo que ainda está sendo baixado (zip_stream.GrowingFile)
+
+        :param cnaes_secundarios:
+            Carrega também a tabela estabelecimento_cnaes, na mesma transação de cada bloco
+
+        :param chunk_size:
+            Quantidade de linhas de cada bloco, ou o tamanho inicial quando o mesmo é
+            ajustado pela latência da gravação (settings.BATCH_ADAPTIVE)
+
+        :param shadow:
+            Tabelas da nova geração que recebem as linhas (utils.shadow), o arquivo é
+            importado por completo e os membros finalizados são gravados apenas na troca
         """
 
+        parse_function = getattr(self, parse_function)
+
+        # A importação incremental recria a tabela de versão a cada execução e a recarga em
+        # tabelas sombra cria uma nova geração, então o progresso só é controlado na importação completa
+        hash_file, progress, members = None, None, None
+        if stream is not None:
+            hash_file = checkpoint.content_hash(stream.size, stream.peek(checkpoint.HASH_SAMPLE_SIZE))
+            progress = checkpoint.load(self.session, file, hash_file)
+            self.session.commit()
+            members = iter_members(stream)
+        elif shadow is not None:
+            hash_file = checkpoint.file_hash(file)
+        elif delta_tables is None:
+            hash_file = checkpoint.file_hash(file)
+            progress = checkpoint.load(self.session, file, hash_file)
+            self.session.commit()
+
+            if checkpoint.is_finished(file, progress):
+                PROGRESS.skip_file(populate_name, file.name)
+                msg = f'[{populate_name}] O CSV {file} já foi importado, ignorando'
+                log.info(msg)
+                click.echo(msg, nl=True)
+                return
+
         msg = f'[{populate_name}] Importando o CSV {file}'
         log.info(msg)
         click.echo(msg, nl=True)
-        rows_cache = []
-        parse_function = getattr(self, parse_function)
 
-        for i, row in enumerate(read_file(file)):
-            if len(row) != columns:
-                msg = f'[{populate_name}] Erro de integridade na leitura do arquivo, linha {i} arquivo {file}! '\
-                      f'Esperado {columns} e encontrado {len(row)}'
-                log.error(msg)
-                raise ValueError(msg)
+        # O parse do próximo bloco é feito enquanto o anterior é gravado. No SQLite a
+        # escrita já é feita na thread do SqliteWriter, que agrupa os blocos em transações
+        # maiores, então o tempo de cada bloco não é medido e o tamanho dos blocos é fixo
+        split_cnaes = fields.cnae_splitter(parse_function.columns) if cnaes_secundarios else None
+        total_columns = len(parse_function.columns) + (len(split_cnaes.columns) if split_cnaes else 0)
+
+        writer, batch = None, None
+        if not isinstance(self.loader, SqliteWriter):
+            if settings.BATCH_ADAPTIVE:
+                # Os blocos ajustados não passam de metade do orçamento de memória
+                maximum = min(settings.BATCH_MAX_ROWS, max_rows(total_columns))
+                batch = BatchController(chunk_size, populate_name, maximum=maximum)
+            writer = ChunkWriter(partial(self._insert, batch=batch))
+            writer.start()
+
+        chunks = read_chunks(file, populate_name, columns, parse_function, batch or chunk_size, resume=progress,
+                             members=members)
+
+        def size():
+            return estimate_size(batch() if batch else chunk_size, total_columns)
+
+        try:
+            for chunk, release in reserve(chunks, size):
+                if shadow is not None:
+                    if chunk.finished:
+                        shadow.finished(checkpoint.row(file, chunk.member, hash_file, chunk.line, True))
+                    children = [(shadow.table(table), columns, rows)
+                                for table, columns, rows in cnae_inserts(model, split_cnaes, chunk.rows) or []]
+                    args = (shadow.table(model.__table__), parse_function.columns, chunk.rows, None, populate_name,
+                            children)
+                elif delta_tables is None:
+                    checkpoint_row = checkpoint.row(file, chunk.member, hash_file, chunk.line, chunk.finished)
+                    children = cnae_inserts(model, split_cnaes, chunk.rows)
+                    args = (model.__table__, parse_function.columns, chunk.rows, checkpoint_row, populate_name,
+                            children)
+                else:
+                    rows = [row + (row_hash(row),) for row in chunk.rows]
+                    args = (delta_tables.stage, parse_function.columns + ('hash',), rows, None, populate_name)
+
+                if writer is None:
+                    self._insert(*args, on_written=release)
+                else:
+                    writer.put(*args, on_done=release)
+        except BaseException:
+            if writer is not None:
+                writer.abort()
+            raise
+
+        if writer is not None:
+            writer.close()
+
+    def _insert(self, table: Table, columns: tuple, rows: list,
+                checkpoint_row: Optional[tuple] = None, dataset: Optional[str] = None,
+                children: Optional[list] = None, on_written: Optional[Callable[[], None]] = None,
+                batch: Optional[BatchController] = None) -> None:
+        """
+        Insere e faz o commit de um bloco de linhas já convertidas
 
-            rows_cache.append(parse_function(row))
+        :param table:
+            Tabela que receberá os dados
 
-            if i > 0 and i % settings.CHUNK_ROWS_INSERT_DATABASE == 0:
-                msg = f'[{populate_name}] Inserindo o registro { i + 1 } do arquivo {file}'
-                log.debug(msg)
-                click.echo(msg, nl=True)
-                self.session.bulk_insert_mappings(model, rows_cache)
-                self.session.commit()
-                rows_cache = []
+        :param columns:
+            Nome das colunas na ordem das tuplas
 
-        # Inserindo os resquícios de dados que podem ter ficado sem ser inseridos
-        if rows_cache:
-            self.session.bulk_insert_mappings(model, rows_cache)
-            self.session.commit()
+        :param rows:
+            Tuplas retornadas pela função de parse
+
+        :param checkpoint_row:
+            Progresso da importação (checkpoint.row), gravado na mesma transação das linhas
+
+        :param dataset:
+            Nome do dataset nas métricas, caso não seja informado será o nome da tabela
+
+        :param children:
+            Blocos de outras tabelas (table, columns, rows) gravados na mesma transação,
+            ex.: estabelecimento_cnaes
+
+        :param on_written:
+            Chamado após a escrita do bloco, mesmo em caso de erro (ex.: liberação do
+            orçamento de memória), no SQLite é chamado pela thread do SqliteWriter
+
+        :param batch:
+            Controle do tamanho dos blocos, recebe o tempo da inserção + commit do bloco
+        """
+        dataset = dataset or table.name
+        inserts = [(table, columns, rows)] + (children or [])
+        if checkpoint_row is not None:
+            inserts.append((Checkpoint.__table__, checkpoint.COLUMNS, [checkpoint_row]))
+
+        start = perf_counter()
+        if isinstance(self.loader, SqliteWriter):
+            self.loader.insert_all(self.session, inserts, on_written)
+        else:
+            try:
+                self.loader.insert_all(self.session, inserts)
+            finally:
+                if on_written is not None:
+                    on_written()
+        inserted = perf_counter()
+        self.session.commit()
+        committed = perf_counter()
+
+        REGISTRY.observe('rfb_insert_latency_seconds', inserted - start, dataset=dataset)
+        REGISTRY.observe('rfb_commit_latency_seconds', committed - inserted, dataset=dataset)
+        REGISTRY.inc('rfb_stage_seconds_total', inserted - start, stage='insert', dataset=dataset)
+        REGISTRY.inc('rfb_stage_seconds_total', committed - inserted, stage='commit', dataset=dataset)
+
+        if batch is not None:
+            batch.observe(len(rows), committed - start)
@@ -0,0 +1,159 @@
+# ------------------------------------------------------------------------------#
+#                                                                               |
+#     IMPORTAÇÃO INCREMENTAL: APLICA APENAS AS DIFERENÇAS ENTRE AS VERSÕES      |
+#                                                                               |
+# ------------------------------------------------------------------------------#
+from hashlib import blake2b
+from logging import getLogger
+
+from sqlalchemy import BigInteger, Column, Index, MetaData, Table
+from sqlalchemy import and_, delete, exists, func, insert, select, text, union
+from sqlalchemy.orm import Session
+
+
+log = getLogger(__name__)
+
+
+# Chave natural de cada tabela que suporta a importação incremental. Quando a chave
+# não é única (ex.: vários sócios por CNPJ), todas as linhas da chave são substituídas
+NATURAL_KEYS = {
+    'empresas': ('cnpj',),
+    'estabelecimentos': ('cnpj', 'cnpj_ordem', 'cnpj_dv'),
+    'socios': ('cnpj',),
+    'dados_simples': ('cnpj',),
+}
+
+
+def row_hash(row: tuple) -> int:
+    """
+    Retorna o hash (64 bits com sinal) do conteúdo da linha
+    :param row: Tupla retornada pela função de parse
+    """
+    digest = blake2b(repr(row).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+class DeltaTables:
+    """
+    Tabelas auxiliares da importação incremental de uma tabela:
+     - <tabela>_delta: nova versão dos dados com o hash de cada linha
+     - <tabela>_hash: índice com a chave natural e o hash das linhas já importadas
+     - <tabela>_delta_chaves: chaves que tiveram alguma alteração
+    As duas últimas têm um único índice com a chave natural completa, utilizado na
+    comparação (_match) com as demais tabelas
+    """
+
+    def __init__(self, table: Table, columns: tuple):
+        """
+        :param table: Tabela de destino dos dados
+        :param columns: Nome das colunas na ordem das tuplas do parse
+        """
+        self.table = table
+        self.columns = columns
+        # No schema compacto (sem o id) a chave primária é a própria chave natural
+        if 'id' in table.c:
+            self.keys = NATURAL_KEYS[table.name]
+        else:
+            self.keys = tuple(table.primary_key.columns.keys())
+
+        metadata = MetaData()
+        self.stage = Table(
+            f'{table.name}_delta', metadata,
+            *[Column(column, table.c[column].type) for column in columns],
+            Column('hash', BigInteger)
+        )
+        self.hashes = Table(
+            f'{table.name}_hash', metadata,
+            *[Column(key, table.c[key].type) for key in self.keys],
+            Column('hash', BigInteger)
+        )
+        Index(f'ix_{self.hashes.name}_chave', *[self.hashes.c[key] for key in self.keys])
+
+        self.changed = Table(
+            f'{table.name}_delta_chaves', metadata,
+            *[Column(key, table.c[key].type) for key in self.keys],
+        )
+        Index(f'ix_{self.changed.name}_chave', *[self.changed.c[key] for key in self.keys])
+
+    def prepare(self, session: Session) -> None:
+        """ Recria a tabela que receberá a nova versão dos dados """
+
+        connection = session.connection()
+        self.stage.drop(connection, checkfirst=True)
+        self.changed.drop(connection, checkfirst=True)
+        self.stage.create(connection)
+        self.hashes.create(connection, checkfirst=True)
+
+        # Tabelas de hash criadas pelas versões anteriores, com um índice por coluna da chave
+        preparer = connection.dialect.identifier_preparer
+        for key in self.keys:
+            connection.execute(text(f'DROP INDEX IF EXISTS {preparer.quote(f"ix_{self.hashes.name}_{key}")}'))
+        for index in self.hashes.indexes:
+            index.create(connection, checkfirst=True)
+        session.commit()
+
+    def _match(self, table: Table, other: Table):
+        """ Condição de igualdade da chave natural entre as tabelas """
+        return and_(*[table.c[key] == other.c[key] for key in self.keys])
+
+    def apply(self, session: Session) -> dict:
+        """
+        Aplica na tabela de destino apenas as inclusões, alterações e exclusões
+        da nova versão, em uma única transação
+        :return: dict com a quantidade de chaves incluídas, alteradas e excluídas
+        """
+        stage, hashes, changed, table = self.stage, self.hashes, self.changed, self.table
+        columns = [table.c[column] for column in self.columns]
+        stage_columns = [stage.c[column] for column in self.columns]
+
+        if session.execute(select(func.count()).select_from(hashes)).scalar() == 0:
+            # Primeira importação incremental, a tabela é recarregada por completo
+            session.execute(delete(table))
+            session.execute(insert(table).from_select(columns, select(*stage_columns)))
+            session.execute(insert(hashes).from_select(
+                self.keys + ('hash',), select(*[stage.c[key] for key in self.keys], stage.c.hash)
+            ))
+            total = session.execute(select(func.count()).select_from(stage)).scalar()
+            result = {'incluidos': total, 'alterados': 0, 'excluidos': 0}
+        else:
+            # Chaves que têm ao menos uma linha (chave + hash) que existe em apenas uma das versões,
+            # ou com outra quantidade de repetições (ex.: um de dois sócios idênticos foi removido)
+            old_keys = [hashes.c[key] for key in self.keys] + [hashes.c.hash]
+            new_keys = [stage.c[key] for key in self.keys] + [stage.c.hash]
+            old = select(*old_keys, func.count().label('linhas')).group_by(*old_keys)
+            new = select(*new_keys, func.count().label('linhas')).group_by(*new_keys)
+            removed = old.except_(new).subquery()
+            added = new.except_(old).subquery()
+
+            changed.create(session.connection())
+            session.execute(insert(changed).from_select(self.keys, union(
+                select(*[removed.c[key] for key in self.keys]),
+                select(*[added.c[key] for key in self.keys]),
+            )))
+
+            total = session.execute(select(func.count()).select_from(changed)).scalar()
+            inserted = session.execute(
+                select(func.count()).select_from(changed).where(~exists().where(self._match(hashes, changed)))
+            ).scalar()
+            deleted = session.execute(
+                select(func.count()).select_from(changed).where(~exists().where(self._match(stage, changed)))
+            ).scalar()
+            result = {'incluidos': inserted, 'alterados': total - inserted - deleted, 'excluidos': deleted}
+
+            session.execute(delete(table).where(exists().where(self._match(changed, table))))
+            session.execute(insert(table).from_select(
+                columns, select(*stage_columns).where(exists().where(self._match(changed, stage)))
+            ))
+            session.execute(delete(hashes).where(exists().where(self._match(changed, hashes))))
+            session.execute(insert(hashes).from_select(
+                self.keys + ('hash',),
+                select(*[stage.c[key] for key in self.keys], stage.c.hash).where(
+                    exists().where(self._match(changed, stage))
+                )
+            ))
+            changed.drop(session.connection())
+
+        self.stage.drop(session.connection())
+        session.commit()
+
+        return result
@@ -6,33 +6,82 @@
 import re
 import os
 import click
+import shutil
 import threading
 
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPException
 from logging import getLogger
-from urllib.request import urlopen
+from typing import Callable, Optional
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
 from urllib.parse import urljoin
 from time import perf_counter, sleep
+from zipfile import BadZipFile, ZipFile
 from rfb.utils import NAMES_PATTERNS
+from rfb.utils.metrics import REGISTRY
+from rfb import settings
 from rfb.settings import MAX_RETRY_DOWNLOAD, URL_BASE_RFB
 
 
 log = getLogger(__name__)
 
+# Erros de rede que fazem a operação ser tentada novamente
+NETWORK_ERRORS = (OSError, HTTPException)
 
-def _get_urls() -> list:
+# Status HTTP que fazem a operação ser tentada novamente, além dos erros do servidor (5xx),
+# os demais erros (ex.: 404, 403) não mudam com uma nova tentativa
+RETRY_STATUS = (408, 429)
+
+
+def _backoff(retry: int) -> float:
+    """ Tempo de espera antes da próxima tentativa """
+    return min(settings.DOWNLOAD_BACKOFF * 2 ** retry, settings.DOWNLOAD_BACKOFF_MAX)
+
+
+def _raise_permanent(error: Exception, msg: str) -> None:
+    """
+    Falha imediatamente com os erros HTTP que não devem ser tentados novamente
+    :param error: Erro da tentativa
+    :param msg: Mensagem do erro
+    """
+    if isinstance(error, HTTPError) and error.code < 500 and error.code not in RETRY_STATUS:
+        msg = f'{msg} ({error}), o erro não será tentado novamente'
+        click.echo(msg, err=True)
+        log.error(msg)
+        raise Exception(msg) from error
+
+
+def _request(url: str, start: Optional[int] = None, end: Optional[int] = None):
+    """
+    Abre a conexão com a url, utilizando o header Range quando informado o início
+    :param url: URL do arquivo
+    :param start: Primeiro byte (inclusive)
+    :param end: Último byte (inclusive), None vai até o final do arquivo
+    """
+    headers = {}
+    if start is not None:
+        headers['Range'] = f'bytes={start}-{"" if end is None else end}'
+
+    return urlopen(Request(url, headers=headers), timeout=settings.DOWNLOAD_TIMEOUT)
+
+
+def _get_urls(url_base: str = URL_BASE_RFB) -> list:
     """ Retorna todas as urls/nomes dos arquivos da receita """
 
     # Baixa a página de download da receita
-    retry = 0
-    while retry < MAX_RETRY_DOWNLOAD:
+    data = None
+    for retry in range(MAX_RETRY_DOWNLOAD):
         try:
-            data = str(urlopen(URL_BASE_RFB).read(), encoding='utf8')
+            with _request(url_base) as response:
+                data = str(response.read(), encoding='utf8')
             break
-        except ConnectionResetError:
-            msg = f'Erro ao recuperar as urls dos arquivos, tenativa {retry + 1}, tentando novamente...'
+        except NETWORK_ERRORS as e:
+            _raise_permanent(e, 'Erro ao recuperar as urls dos arquivos')
+            msg = f'Erro ao recuperar as urls dos arquivos ({e}), tenativa {retry + 1}, tentando novamente...'
             click.echo(msg, err=True)
             log.warning(msg)
-            retry += 1
+            sleep(_backoff(retry))
 
     if not data:
         msg = 'Erro ao recuperar as urls dos arquivos'
@@ -54,106 +103,314 @@ def _get_urls() -> list:
     return urls
 
 
-def _download(url: str, path: str = '', retry_count: int = 0) -> None:
+def _get_info(url: str) -> tuple:
     """
-    Faz o download de algum arquivo
+    Retorna o tamanho do arquivo e se o servidor aceita o download por partes (Range)
+    :param url: URL do arquivo
+    :return: tupla (tamanho ou None, aceita Range)
+    """
+    for retry in range(MAX_RETRY_DOWNLOAD):
+        try:
+            with _request(url, 0, 0) as response:
+                if response.status == 206:  # Content-Range: bytes 0-0/<tamanho>
+                    content_range = response.headers.get('Content-Range', '')
+                    size = content_range.rsplit('/', maxsplit=1)[-1]
+                    return (int(size) if size.isdigit() else None), True
+
+                size = response.headers.get('Content-Length')
+                return (int(size) if size else None), False
+        except NETWORK_ERRORS as e:
+            _raise_permanent(e, f'Erro ao consultar o arquivo {url}')
+            msg = f'Erro ao consultar o arquivo {url} ({e}), tentativa {retry + 1}'
+            log.warning(msg)
+            click.echo(msg, err=True)
+            sleep(_backoff(retry))
+
+    msg = f'Erro ao consultar o arquivo {url}! Número máximo de {MAX_RETRY_DOWNLOAD} tentativas alcançado!'
+    log.error(msg)
+    raise Exception(msg)
+
+
+class _Progress:
+    """ Acompanhamento do download de um arquivo, compartilhado entre as partes """
+
+    factor_convert_mb = 1048576
+
+    def __init__(self, file_name: str, file_size: Optional[int], downloaded: int):
+        self.file_name = file_name
+        self.file_size = file_size
+        self.downloaded = downloaded
+        self.received = 0
+        self.start = perf_counter()
+        self.last_echo = 0
+        self.lock = threading.Lock()
+
+    def update(self, size: int) -> None:
+        if size > 0:
+            REGISTRY.inc('rfb_download_bytes_total', size, arquivo=self.file_name)
+
+        with self.lock:
+            self.downloaded += size
+            self.received += size
+            now = perf_counter()
+
+            # Exibe no máximo uma vez a cada 5 segundos por arquivo
+            if now - self.last_echo < 5:
+                return
+            self.last_echo = now
+
+        velocity = self.received / (now - self.start) / self.factor_convert_mb
+        status = f'Downloading {self.file_name}: {self.downloaded / self.factor_convert_mb:10.2f}'
+        if self.file_size:
+            status += f'/{self.file_size / self.factor_convert_mb:2.2f} MB ' \
+                      f'[{self.downloaded * 100. / self.file_size:3.2f}%]'
+        else:
+            status += ' MB'
+        click.echo(f'{status} [{velocity:.3f} MB/s]')
+
+
+def _discard(url: str, part: str, done: int, progress: _Progress, streaming: bool, reason: str) -> None:
+    """
+    Descarta o arquivo parcial para que o download recomece do início
+    :param url: URL do arquivo
+    :param part: Caminho do arquivo parcial
+    :param done: Bytes já baixados no arquivo parcial
+    :param progress: Acompanhamento do download do arquivo
+    :param streaming: O arquivo parcial já está sendo lido (on_start), os bytes já
+        lidos não podem ser reescritos, então o download falha
+    :param reason: Motivo do recomeço, utilizado nas mensagens
+    """
+    if streaming:
+        msg = f'O download do arquivo {url} precisaria recomeçar do início ({reason}), ' \
+              f'mas o arquivo parcial já está sendo importado'
+        log.error(msg)
+        raise Exception(msg)
+
+    if os.path.exists(part):
+        os.remove(part)
+    progress.update(-done)
+
+
+def _fetch(url: str, part: str, start: int, end: Optional[int], progress: _Progress,
+           streaming: bool = False) -> None:
+    """
+    Baixa o intervalo de bytes [start, end] da url para o arquivo part, retomando
+    a partir do que já existe no arquivo e tentando novamente com espera crescente
+    :param url: URL do arquivo
+    :param part: Caminho do arquivo parcial
+    :param start: Primeiro byte (inclusive)
+    :param end: Último byte (inclusive), None quando o tamanho não é conhecido
+    :param progress: Acompanhamento do download do arquivo
+    :param streaming: O arquivo parcial está sendo lido durante o download (on_start),
+        o download falha no lugar de recomeçar do início
+    """
+    expected = None if end is None else end - start + 1
+
+    for retry in range(MAX_RETRY_DOWNLOAD):
+        done = os.path.getsize(part) if os.path.exists(part) else 0
+        if expected is not None and done == expected:
+            return
+
+        if expected is not None and done > expected:
+            _discard(url, part, done, progress, streaming, f'{done} bytes de {expected} no arquivo parcial')
+            done = 0
+
+        try:
+            try:
+                response = _request(url, start + done, end)
+            except HTTPError as e:
+                # Sem o tamanho do arquivo, o Range a partir do final do arquivo parcial (ex.:
+                # interrompido antes de ser renomeado) é recusado: o arquivo já está completo
+                if e.code != 416 or expected is not None or not done:
+                    raise
+
+                size = e.headers.get('Content-Range', '').rsplit('/', maxsplit=1)[-1]
+                if not size.isdigit() or int(size) == done:
+                    return
+
+                _discard(url, part, done, progress, streaming, f'o servidor informou {size} bytes')
+                raise HTTPException(f'O arquivo parcial de {url} tem {done} bytes e o servidor informou {size}')
+
+            with response:
+                mode = 'ab'
+                if response.status != 206:
+                    if start > 0:
+                        raise HTTPException(f'O servidor não aceitou o download por partes de {url}')
+
+                    # O servidor ignorou o Range, recomeça do início
+                    if done:
+                        _discard(url, part, done, progress, streaming, 'o servidor ignorou o Range')
+                    mode = 'wb'
+
+                with open(part, mode) as file_buffer:
+                    while True:
+                        buffer = response.read(settings.DOWNLOAD_BUFFER_SIZE)
+                        if not buffer:
+                            break
+
+                        file_buffer.write(buffer)
+                        progress.update(len(buffer))
+
+            done = os.path.getsize(part)
+            if expected is None or done == expected:
+                return
+
+            raise HTTPException(f'Conexão encerrada com {done} de {expected} bytes')
+        except NETWORK_ERRORS as e:
+            _raise_permanent(e, f'Erro ao baixar o arquivo {url}')
+            msg = f'Erro ao baixar o arquivo {url} ({e}), tentativa de número {retry + 1}'
+            log.warning(msg)
+            click.echo(msg, err=True)
+            REGISTRY.inc('rfb_download_retries_total', arquivo=progress.file_name)
+            sleep(_backoff(retry))
+
+    msg = f'Erro ao baixar o arquivo {url}! Número máximo de {MAX_RETRY_DOWNLOAD} tentativas alcançado!'
+    click.echo(msg, err=True)
+    log.error(msg)
+    raise Exception(msg)
+
+
+def _verify(path: str) -> None:
+    """
+    Verifica se o arquivo baixado é um ZIP válido (diretório central legível),
+    removendo o mesmo caso contrário para que seja baixado novamente
+    :param path: Caminho do arquivo baixado
+    """
+    try:
+        with ZipFile(path, 'r'):
+            pass
+    except BadZipFile as e:
+        os.remove(path)
+        msg = f'O arquivo {path} baixado não é um ZIP válido ({e}), o mesmo foi removido'
+        log.error(msg)
+        raise Exception(msg) from e
+
+
+def _download(url: str, path: str = '',
+              on_start: Optional[Callable[[str, str, int], None]] = None,
+              on_complete: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Faz o download de algum arquivo, retomando o download parcial existente e
+    dividindo os arquivos grandes em partes baixadas em paralelo
     :param url:
         URL de onde se encontra o arquivo
 
     :param path:
         Caminho raiz aonde será salvo o arquivo
 
-    :param retry_count:
-        Parâmetro para realizar a contagem recursiva da quantidade de
-        tentativas que foi executada, não informar
+    :param on_start:
+        Chamado com (caminho final, caminho parcial, tamanho) quando o arquivo é baixado
+        sequencialmente em uma única parte, permitindo a leitura durante o download.
+        Quando informado, os arquivos não são divididos em partes
+
+    :param on_complete:
+        Chamado com o caminho do arquivo após o download e a verificação do mesmo
+
+    :return: caminho do arquivo baixado
     """
-    def get_length(meta):
-        for k, v in meta._headers:
-            if str(k).lower() == 'content-length':
-                return int(v)
+    file_name = url.split('/')[-1]  # Nome do arquivo
+    dir = os.path.join(path, file_name)
+    if path:
+        os.makedirs(path, exist_ok=True)
 
-        return None
+    file_size, accept_ranges = _get_info(url)
 
-    if retry_count >= MAX_RETRY_DOWNLOAD:
-        msg = f'Erro ao baixar o arquivo {url}! Número máximo de {MAX_RETRY_DOWNLOAD} tentativas alcançado!'
-        click.echo(msg, err=True)
-        log.error(msg)
-        raise Exception(msg)
+    if file_size is not None and os.path.exists(dir) and os.path.getsize(dir) == file_size:
+        msg = f'O arquivo {url} já foi baixado, ignorando'
+        log.info(msg)
+        click.echo(msg)
+        _verify(dir)
+        if on_complete is not None:
+            on_complete(dir)
+        return dir
 
-    file_name = url.split('/')[-1]  # Nome do arquivo
-    url_byte = urlopen(url)
-    meta = url_byte.info()
-    factor_convert_mb = 1048576
-    file_size = get_length(meta)  # Tamanho do arquivo
-    file_size_mb = file_size / factor_convert_mb  # Tamanho do arquivo em byte
+    # A leitura durante o download depende dos bytes chegarem em ordem
+    segments = 1
+    if on_start is None and accept_ranges and file_size and file_size >= settings.DOWNLOAD_SEGMENT_MIN_SIZE:
+        segments = max(settings.DOWNLOAD_SEGMENTS, 1)
 
-    file_size_dl = 0  # tamanho já baixado
-    block_sz = 8192  # Tamanho do buffer de cada download
-    start = perf_counter()
+    if segments == 1:
+        ranges = [(f'{dir}.part', 0, None if file_size is None else file_size - 1)]
+    else:
+        segment_size = -(-file_size // segments)
+        ranges = [
+            (f'{dir}.part{i}', start, min(start + segment_size, file_size) - 1)
+            for i, start in enumerate(range(0, file_size, segment_size))
+        ]
 
-    dir = os.path.join(path, file_name)
-    if path and not os.path.isdir(path):
-        os.mkdir(path)
+    # Se o servidor não aceita Range, o download parcial não pode ser retomado
+    if not accept_ranges and os.path.exists(ranges[0][0]):
+        os.remove(ranges[0][0])
 
-    try:
-        with open(dir, 'wb') as file_buffer:
-
-                while True:
-                    buffer = url_byte.read(block_sz)
-                    if not buffer:
-                        break
-
-                    file_size_dl += len(buffer)
-                    file_size_dl_mb = file_size_dl / factor_convert_mb
-                    file_buffer.write(buffer)
-                    velocity = file_size_dl // (perf_counter() - start) / factor_convert_mb
-                    percent = file_size_dl * 100. / file_size
-                    status = f"\rDownloading {file_name}: {file_size_dl_mb:10.2f}/{file_size_mb:2.2f} MB  [{percent:3.2f}%] " \
-                             f"[{velocity:.3f} Mbps]"
-
-                    click.echo(status, nl=False)
-    except ConnectionResetError:
-        # Ignora essa excessão, pois irá cair no else abaixo e reiniciar o download
-        pass
-    finally:
-        if file_size_dl == file_size:
-            msg = f'Download do arquivo {url} baixado com sucesso com {retry_count + 1} tentativas!'
-            log.info(msg)
-            click.echo(msg)
-        else:  # Então, ocorreu algum erro com o download, recomeça!
-            os.remove(dir)
-            msg = f'Erro ao baixar o arquivo {url}, tamanho baixado: {file_size_dl}, '\
-                  f'tamanho esperado {file_size}, tentativa de número {retry_count + 1}'
-            log.warning(msg)
-            click.echo(msg, err=True)
-            _download(url, path, retry_count=retry_count + 1)
+    downloaded = sum(os.path.getsize(part) for part, _, _ in ranges if os.path.exists(part))
+    progress = _Progress(file_name, file_size, downloaded)
 
+    if len(ranges) == 1:
+        streaming = on_start is not None and accept_ranges and bool(file_size)
+        if streaming:
+            on_start(dir, ranges[0][0], file_size)
+        _fetch(url, *ranges[0], progress, streaming)
+    else:
+        with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix='cnpj_download_part') as executor:
+            futures = [executor.submit(_fetch, url, *segment, progress) for segment in ranges]
+            for future in futures:
+                future.result()
 
-def start_download(path='download'):
+    # Junta as partes no arquivo final
+    if len(ranges) == 1:
+        os.replace(ranges[0][0], dir)
+    else:
+        with open(f'{dir}.part', 'wb') as file_buffer:
+            for part, _, _ in ranges:
+                with open(part, 'rb') as part_buffer:
+                    shutil.copyfileobj(part_buffer, file_buffer, settings.DOWNLOAD_BUFFER_SIZE)
+        os.replace(f'{dir}.part', dir)
+        for part, _, _ in ranges:
+            os.remove(part)
+
+    _verify(dir)
+
+    elapsed = perf_counter() - progress.start
+    REGISTRY.inc('rfb_download_seconds_total', elapsed, arquivo=file_name)
+
+    msg = f'Download do arquivo {url} baixado com sucesso em {elapsed:.1f}s!'
+    log.info(msg)
+    click.echo(msg)
+
+    if on_complete is not None:
+        on_complete(dir)
+    return dir
+
+
+def start_download(path='download', url_base: str = URL_BASE_RFB, workers: int = settings.DOWNLOAD_WORKERS,
+                   on_start: Optional[Callable[[str, str, int], None]] = None,
+                   on_complete: Optional[Callable[[str], None]] = None):
     """
-    Inicia o processo de download em Threads
+    Inicia o processo de download com uma quantidade limitada de arquivos ao mesmo tempo
     :param path: Caminho onde irá salvar os arquivos baixados, default: download
+    :param url_base: URL da página com os arquivos, default: settings.URL_BASE_RFB
+    :param workers: Quantidade máxima de arquivos baixados ao mesmo tempo
+    :param on_start: Chamado no início do download sequencial de cada arquivo (_download)
+    :param on_complete: Chamado com o caminho de cada arquivo baixado e verificado
     :return:
     """
-    file_list = _get_urls()
-    max_threads = len(file_list)
-    thread_name = 'cnpj_download'
-    tsleep = 0.05
+    file_list = _get_urls(url_base)
 
     msg = 'Iniciando o download dos arquivos'
     log.info(msg)
     click.echo(msg)
 
-    for i, file in enumerate(file_list):
-        url = urljoin(URL_BASE_RFB, file)
-        threading.Thread(target=_download, args=[url, path], name=thread_name).start()
-
-    dload_threads = [x.getName() for x in threading.enumerate() if thread_name == x.getName()]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cnpj_download') as executor:
+        futures = [
+            executor.submit(_download, urljoin(url_base, file), path, on_start, on_complete)
+            for file in file_list
+        ]
 
-    while len(dload_threads) >= max_threads:
-        dload_threads = [x.getName() for x in threading.enumerate() if thread_name == x.getName()]
-        sleep(tsleep)
-
-    while dload_threads:
-        dload_threads = [x.getName() for x in threading.enumerate() if thread_name == x.getName()]
-        sleep(tsleep)
+        try:
+            for future in futures:
+                future.result()
+        except Exception:
+            # Cancela os downloads que ainda não começaram
+            for future in futures:
+                future.cancel()
+            raise
@@ -0,0 +1,253 @@
+# ------------------------------------------------------------------------------#
+#                                                                               |
+#        LAYOUT DAS COLUNAS DOS ARQUIVOS DA RFB E CONVERSORES DE LINHAS         |
+#                                                                               |
+# ------------------------------------------------------------------------------#
+from collections import namedtuple
+from operator import itemgetter
+from typing import Callable
+
+from rfb.utils import convert
+
+
+# index: posição da coluna no arquivo da RFB, uma tupla concatena as colunas antes da
+#   conversão (ex.: o CNPJ completo do schema compacto)
+# column: nome da coluna no model
+# converter: função de conversão do valor, None mantém o texto (vazio vira None).
+#   As colunas com poucos valores distintos utilizam os conversores com cache
+#   (parse_code, parse_text, parse_date e parse_uf), que reutilizam o mesmo objeto
+Field = namedtuple('Field', ['index', 'column', 'converter'])
+
+
+EMPRESA = (
+    Field(0, 'cnpj', None),
+    Field(1, 'razao', None),
+    Field(2, 'natureza', convert.parse_code),
+    Field(3, 'qualificacao_pf', convert.parse_code),
+    Field(4, 'capital', convert.parse_float),
+    Field(5, 'porte', convert.parse_code),
+    Field(6, 'ente_federativo', convert.parse_code),
+)
+
+ESTABELECIMENTO = (
+    Field(0, 'cnpj', None),
+    Field(1, 'cnpj_ordem', None),
+    Field(2, 'cnpj_dv', None),
+    Field(3, 'matriz_filial', convert.parse_code),
+    Field(4, 'nome', None),
+    Field(5, 'situacao', convert.parse_code),
+    Field(6, 'data_situacao', convert.parse_date),
+    Field(7, 'motivo_situacao', convert.parse_text),
+    Field(8, 'cidade_exterior', None),
+    Field(9, 'pais', convert.parse_code),
+    Field(10, 'inicio_atividade', convert.parse_date),
+    Field(11, 'cnae_fiscal', convert.parse_text),
+    Field(12, 'cnae_secundario', None),
+    Field(13, 'tipo_logradouro', convert.parse_text),
+    Field(14, 'logradouro', None),
+    Field(15, 'numero', None),
+    Field(16, 'complemento', None),
+    Field(17, 'bairro', None),
+    Field(18, 'cep', convert.parse_cep),
+    Field(19, 'uf', convert.parse_uf),
+    Field(20, 'municipio', convert.parse_code),
+    Field(21, 'ddd_1', convert.parse_int),
+    Field(22, 'telefone_1', convert.only_number),
+    Field(23, 'ddd_2', convert.parse_int),
+    Field(24, 'telefone_2', convert.only_number),
+    Field(25, 'ddd_fax', convert.parse_int),
+    Field(26, 'numero_fax', convert.only_number),
+    Field(27, 'email', None),
+    Field(28, 'situacao_especial', convert.parse_text),
+    Field(29, 'data_situacao_especial', convert.parse_date),
+)
+
+DADO_SIMPLES = (
+    Field(0, 'cnpj', None),
+    Field(1, 'opcao_simples', convert.parse_text),
+    Field(2, 'data_opcao_simples', convert.parse_date),
+    Field(3, 'data_exclusao', convert.parse_date),
+    Field(4, 'opcao_mei', convert.parse_text),
+    Field(5, 'data_opcao_mei', convert.parse_date),
+    Field(6, 'data_exclusao_mei', convert.parse_date),
+)
+
+SOCIO = (
+    Field(0, 'cnpj', None),
+    Field(1, 'identificador_socio', convert.parse_code),
+    Field(2, 'nome', None),
+    Field(3, 'cpf_cnpj', None),
+    Field(4, 'qualificacao', convert.parse_code),
+    Field(5, 'data_entrada_sociedade', convert.parse_date),
+    Field(6, 'codigo_pais', convert.parse_code),
+    Field(7, 'cpf_representante_legal', None),
+    Field(8, 'nome_representante_legal', None),
+    Field(9, 'qualificacao_representante_legal', convert.parse_code),
+    Field(10, 'faixa_etaria', convert.parse_text),
+)
+
+# Layouts do schema compacto (models.compacto): CNPJ, CEP, telefones e códigos inteiros
+EMPRESA_COMPACTO = (
+    Field(0, 'cnpj', convert.parse_int),
+    Field(1, 'razao', None),
+    Field(2, 'natureza', convert.parse_code),
+    Field(3, 'qualificacao_pf', convert.parse_code),
+    Field(4, 'capital', convert.parse_float),
+    Field(5, 'porte', convert.parse_code),
+    Field(6, 'ente_federativo', convert.parse_code),
+)
+
+ESTABELECIMENTO_COMPACTO = (
+    Field((0, 1, 2), 'cnpj_completo', convert.parse_int),
+    Field(0, 'cnpj', convert.parse_int),
+    Field(3, 'matriz_filial', convert.parse_code),
+    Field(4, 'nome', None),
+    Field(5, 'situacao', convert.parse_code),
+    Field(6, 'data_situacao', convert.parse_date),
+    Field(7, 'motivo_situacao', convert.parse_code),
+    Field(8, 'cidade_exterior', None),
+    Field(9, 'pais', convert.parse_code),
+    Field(10, 'inicio_atividade', convert.parse_date),
+    Field(11, 'cnae_fiscal', convert.parse_code),
+    Field(12, 'cnae_secundario', None),
+    Field(13, 'tipo_logradouro', convert.parse_text),
+    Field(14, 'logradouro', None),
+    Field(15, 'numero', None),
+    Field(16, 'complemento', None),
+    Field(17, 'bairro', None),
+    Field(18, 'cep', convert.parse_cep_number),
+    Field(19, 'uf', convert.parse_uf),
+    Field(20, 'municipio', convert.parse_code),
+    Field(21, 'ddd_1', convert.parse_code),
+    Field(22, 'telefone_1', convert.parse_number),
+    Field(23, 'ddd_2', convert.parse_code),
+    Field(24, 'telefone_2', convert.parse_number),
+    Field(25, 'ddd_fax', convert.parse_code),
+    Field(26, 'numero_fax', convert.parse_number),
+    Field(27, 'email', None),
+    Field(28, 'situacao_especial', convert.parse_text),
+    Field(29, 'data_situacao_especial', convert.parse_date),
+)
+
+DADO_SIMPLES_COMPACTO = (
+    Field(0, 'cnpj', convert.parse_int),
+) + DADO_SIMPLES[1:]
+
+SOCIO_COMPACTO = (
+    Field(0, 'cnpj', convert.parse_int),
+    Field(1, 'identificador_socio', convert.parse_code),
+    Field(2, 'nome', None),
+    Field(3, 'cpf_cnpj', None),
+    Field(4, 'qualificacao', convert.parse_code),
+    Field(5, 'data_entrada_sociedade', convert.parse_date),
+    Field(6, 'codigo_pais', convert.parse_code),
+    Field(7, 'cpf_representante_legal', None),
+    Field(8, 'nome_representante_legal', None),
+    Field(9, 'qualificacao_representante_legal', convert.parse_code),
+    Field(10, 'faixa_etaria', convert.parse_code),
+)
+
+# Tabelas de domínio com código inteiro
+CODIGO_INTEIRO = (
+    Field(0, 'codigo', convert.parse_int),
+    Field(1, 'descricao', None),
+)
+
+# Tabelas de domínio com código em texto
+CODIGO_TEXTO = (
+    Field(0, 'codigo', None),
+    Field(1, 'descricao', None),
+)
+
+
+def compile_converter(name: str, fields: tuple) -> Callable[[list], tuple]:
+    """
+    Gera uma função especializada que converte a linha do arquivo em uma tupla
+    na ordem das colunas do INSERT, sem a criação de um dict por linha
+    :param name: Nome da função gerada
+    :param fields: Layout das colunas (tupla de Field)
+    :return: função que recebe a linha do arquivo e retorna a tupla convertida,
+        com o atributo columns contendo o nome das colunas da tupla e o atributo
+        fields com o layout utilizado
+    """
+    namespace = {}
+    arguments = []
+    values = []
+
+    for i, field in enumerate(fields):
+        if isinstance(field.index, tuple):
+            value = ' + '.join(f'row[{index}]' for index in field.index)
+        else:
+            value = f'row[{field.index}]'
+
+        if field.converter is None:
+            values.append(f'({value}) or None')
+        elif hasattr(field.converter, 'cache'):
+            # Conversor com cache (convert.memoize), o valor é buscado direto no dict
+            namespace[f'c{i}'] = field.converter.cache
+            arguments.append(f'c{i}=c{i}')
+            values.append(f'c{i}[{value}]')
+        else:
+            namespace[f'c{i}'] = field.converter
+            arguments.append(f'c{i}=c{i}')
+            values.append(f'c{i}({value})')
+
+    source = f'def {name}(row, {", ".join(arguments)}):\n' \
+             f'    return ({", ".join(values)},)\n'
+    exec(compile(source, f'<rfb.utils.fields.{name}>', 'exec'), namespace)
+
+    function = namespace[name]
+    function.columns = tuple(field.column for field in fields)
+    function.fields = fields
+    function.__doc__ = f'Converte a linha do arquivo na tupla {function.columns}'
+
+    return function
+
+
+# Colunas da tabela estabelecimento_cnaes, na ordem das tuplas do split_cnaes
+ESTABELECIMENTO_CNAE = ('cnpj', 'cnpj_ordem', 'cnpj_dv', 'cnae', 'principal')
+ESTABELECIMENTO_CNAE_COMPACTO = ('cnpj_completo', 'cnae', 'principal')
+
+
+def cnae_splitter(columns: tuple) -> Callable[[list], list]:
+    """
+    Gera a função que separa o CNAE principal e os secundários (separados por vírgula)
+    das linhas já convertidas dos estabelecimentos, no mesmo bloco da carga
+    :param columns: Colunas das tuplas dos estabelecimentos (parse_function.columns),
+        com a coluna cnpj_completo é utilizado o schema compacto
+    :return: função que recebe as tuplas dos estabelecimentos e retorna as tuplas
+        da tabela estabelecimento_cnaes, com o atributo columns contendo o nome das
+        colunas (ESTABELECIMENTO_CNAE ou ESTABELECIMENTO_CNAE_COMPACTO)
+    """
+    compact = 'cnpj_completo' in columns
+    fiscal = columns.index('cnae_fiscal')
+    secondary = columns.index('cnae_secundario')
+
+    if compact:
+        cnpj_completo = columns.index('cnpj_completo')
+        key = lambda row: (row[cnpj_completo],)  # noqa: E731
+        code = convert.parse_code
+    else:
+        key = itemgetter(*(columns.index(column) for column in ('cnpj', 'cnpj_ordem', 'cnpj_dv')))
+        code = str.strip
+
+    def split_cnaes(rows: list) -> list:
+        result = []
+        append = result.append
+
+        for row in rows:
+            establishment = key(row)
+            if row[fiscal]:
+                append(establishment + (row[fiscal], True))
+
+            if row[secondary]:
+                # Os códigos repetidos no mesmo estabelecimento são ignorados após a conversão
+                # (ex.: ' 6201501' e '06201501' geram a mesma chave)
+                for cnae in dict.fromkeys(code(cnae.strip()) for cnae in row[secondary].split(',')):
+                    if cnae:
+                        append(establishment + (cnae, False))
+
+        return result
+
+    split_cnaes.columns = ESTABELECIMENTO_CNAE_COMPACTO if compact else ESTABELECIMENTO_CNAE
+    return split_cnaes
@@ -0,0 +1,88 @@
+# ------------------------------------------------------------------------------#
+#                                                                               |
+#      CRIAÇÃO DAS TABELAS SEM ÍNDICES E CONSTRUÇÃO DOS ÍNDICES APÓS A CARGA     |
+#                                                                               |
+# ------------------------------------------------------------------------------#
+import click
+
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from time import perf_counter
+
+from sqlalchemy import Index, Table, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from rfb import settings
+
+
+log = getLogger(__name__)
+
+
+def create_table(engine: Engine, table: Table) -> None:
+    """
+    Cria a tabela, caso não exista, sem os índices declarados no model, que são
+    construídos apenas após a carga (create_indexes)
+    :param engine: Engine do SQLAlchemy
+    :param table: Tabela que será criada
+    """
+    with engine.begin() as connection:
+        if not inspect(connection).has_table(table.name):
+            connection.execute(CreateTable(table))
+
+
+def drop_indexes(engine: Engine, tables: list) -> None:
+    """
+    Remove os índices declarados nos models antes da carga, manter os índices
+    durante os inserts é bem mais lento do que construí-los ao final
+    :param engine: Engine do SQLAlchemy
+    :param tables: Tabelas que terão os índices removidos
+    """
+    with engine.begin() as connection:
+        for table in tables:
+            for index in table.indexes:
+                index.drop(connection, checkfirst=True)
+
+
+def _create_index(engine: Engine, index: Index) -> float:
+    """ Constrói um índice em uma conexão própria, retornando o tempo gasto """
+
+    start = perf_counter()
+    with engine.begin() as connection:
+        if engine.dialect.name == 'postgresql':
+            connection.execute(text(f"SET maintenance_work_mem = '{settings.INDEX_MAINTENANCE_WORK_MEM}'"))
+        connection.execute(CreateIndex(index, if_not_exists=True))
+
+    return perf_counter() - start
+
+
+def create_indexes(engine: Engine, tables: list, workers: int = settings.INDEX_WORKERS) -> None:
+    """
+    Constrói os índices declarados nos models em paralelo, cada um em uma conexão,
+    e atualiza as estatísticas das tabelas (ANALYZE)
+    :param engine: Engine do SQLAlchemy
+    :param tables: Tabelas que terão os índices construídos, as maiores primeiro
+    :param workers: Quantidade de índices construídos ao mesmo tempo, o SQLite
+        utiliza sempre 1 pois não suporta escritas concorrentes
+    """
+    if engine.dialect.name == 'sqlite':
+        workers = 1
+
+    indexes = [index for table in tables for index in sorted(table.indexes, key=lambda i: i.name)]
+
+    msg = f'Construindo {len(indexes)} índices com {workers} conexões'
+    log.info(msg)
+    click.echo(msg, nl=True)
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='cnpj_index') as executor:
+        futures = {executor.submit(_create_index, engine, index): index for index in indexes}
+
+        for future, index in futures.items():
+            msg = f'Índice {index.name} construído em {future.result():.1f}s'
+            log.info(msg)
+            click.echo(msg, nl=True)
+
+    if engine.dialect.name in ('postgresql', 'sqlite'):
+        with engine.begin() as connection:
+            for table in tables:
+                connection.execute(text(f'ANALYZE {engine.dialect.identifier_preparer.format_table(table)}'))
@@ -0,0 +1,210 @@
+# ------------------------------------------------------------------------------#
+#                                                                               |
+#        ESTRATÉGIAS DE CARGA EM LOTE DOS DADOS NO BANCO DE DADOS               |
+#                                                                               |
+# ------------------------------------------------------------------------------#
+import io
+import sqlite3
+
+from abc import ABC, abstractmethod
+from datetime import date
+from logging import getLogger
+from typing import Iterable
+
+from sqlalchemy import Table
+from sqlalchemy.engine import Dialect
+from sqlalchemy.orm import Session
+
+
+log = getLogger(__name__)
+
+# O executemany direto no driver não passa pelos tipos do SQLAlchemy, então é
+# registrado o mesmo formato utilizado pelo SQLAlchemy para o tipo Date no SQLite
+sqlite3.register_adapter(date, date.isoformat)
+
+
+class Loader(ABC):
+    """
+    Interface das estratégias de carga, as linhas são escritas na transação
+    corrente da sessão e o commit fica a cargo de quem chama
+    """
+
+    @abstractmethod
+    def insert(self, session: Session, table: Table, columns: tuple, rows: list) -> None:
+        """
+        Insere as linhas na transação corrente da sessão
+        :param session: Sessão do SQLAlchemy
+        :param table: Tabela que receberá os dados
+        :param columns: Nome das colunas na ordem das tuplas
+        :param rows: Tuplas que serão inseridas
+        """
+
+    def insert_all(self, session: Session, inserts: list) -> None:
+        """
+        Insere os blocos de várias tabelas na mesma transação
+        :param session: Sessão do SQLAlchemy
+        :param inserts: Lista de tuplas (table, columns, rows)
+        """
+        for table, columns, rows in inserts:
+            self.insert(session, table, columns, rows)
+
+    def flush(self) -> None:
+        """ As linhas são escritas na transação da sessão, não há nada pendente """
+
+
+class ExecutemanyLoader(Loader):
+    """
+    Carga utilizando o executemany do driver com um INSERT posicional,
+    compatível com qualquer SGBD suportado pela biblioteca
+    """
+
+    # Marcador dos parâmetros posicionais de acordo com o paramstyle do driver
+    PLACEHOLDERS = {
+        'qmark': lambda i: '?',
+        'format': lambda i: '%s',
+        'pyformat': lambda i: '%s',
+        'numeric': lambda i: f':{i + 1}',
+    }
+
+    def __init__(self):
+        self._statements = {}
+
+    def _get_statement(self, dialect: Dialect, table: Table, columns: tuple) -> str:
+        """ Retorna o INSERT da tabela, montado apenas uma vez """
+
+        key = (table.name, columns)
+        if key not in self._statements:
+            placeholder = self.PLACEHOLDERS[dialect.paramstyle]
+            preparer = dialect.identifier_preparer
+            table_name = preparer.format_table(table)
+            columns_name = ', '.join(preparer.quote(column) for column in columns)
+            values = ', '.join(placeholder(i) for i in range(len(columns)))
+            self._statements[key] = f'INSERT INTO {table_name} ({columns_name}) VALUES ({values})'
+
+        return self._statements[key]
+
+    def insert(self, session: Session, table: Table, columns: tuple, rows: list) -> None:
+        """
+        Insere as linhas na transação corrente da sessão
+        :param session: Sessão do SQLAlchemy
+        :param table: Tabela que receberá os dados
+        :param columns: Nome das colunas na ordem das tuplas
+        :param rows: Tuplas que serão inseridas
+        """
+        if not rows:
+            return
+
+        connection = session.connection()
+        if connection.dialect.paramstyle in self.PLACEHOLDERS:
+            statement = self._get_statement(connection.dialect, table, columns)
+            connection.exec_driver_sql(statement, rows)
+        else:  # paramstyle named, exige um dict por linha
+            connection.execute(table.insert(), [dict(zip(columns, row)) for row in rows])
+
+
+class OrmLoader(Loader):
+    """
+    Carga utilizando o bulk_insert_mappings do SQLAlchemy, com um dict por linha (o
+    caminho original da carga). Mantida como referência da comparação no benchmark.py
+    """
+
+    def __init__(self, models: Iterable = ()):
+        """
+        :param models: Models das tabelas carregadas, as tabelas sem um model (ex.: as
+            tabelas sombra) utilizam o INSERT do SQLAlchemy com os mesmos dicts
+        """
+        self.models = {model.__table__.name: model for model in models}
+
+    def insert(self, session: Session, table: Table, columns: tuple, rows: list) -> None:
+        """
+        Insere as linhas na transação corrente da sessão
+        :param session: Sessão do SQLAlchemy
+        :param table: Tabela que receberá os dados
+        :param columns: Nome das colunas na ordem das tuplas
+        :param rows: Tuplas que serão inseridas
+        """
+        if not rows:
+            return
+
+        mappings = [dict(zip(columns, row)) for row in rows]
+        model = self.models.get(table.name)
+        if model is not None and model.__table__ is table:
+            session.bulk_insert_mappings(model, mappings)
+        else:
+            session.connection().execute(table.insert(), mappings)
+
+
+class PostgresCopyLoader(Loader):
+    """
+    Carga utilizando o COPY ... FROM STDIN (formato texto) do PostgreSQL direto
+    na conexão DBAPI, evitando o bind de parâmetros linha a linha do INSERT
+    """
+
+    # Substituições exigidas pelo formato texto do COPY
+    ESCAPES = str.maketrans({
+        '\\': '\\\\',
+        '\t': '\\t',
+        '\n': '\\n',
+        '\r': '\\r',
+    })
+
+    def _format_value(self, value) -> str:
+        """ Converte o valor para a representação do formato texto do COPY """
+
+        if value is None:
+            return '\\N'
+
+        if isinstance(value, str):
+            return value.translate(self.ESCAPES)
+
+        if isinstance(value, date):
+            return value.isoformat()
+
+        return str(value)
+
+    def insert(self, session: Session, table: Table, columns: tuple, rows: list) -> None:
+        """
+        Envia as linhas via COPY na transação corrente da sessão
+        :param session: Sessão do SQLAlchemy
+        :param table: Tabela que receberá os dados
+        :param columns: Nome das colunas na ordem das tuplas
+        :param rows: Tuplas que serão inseridas
+        """
+        if not rows:
+            return
+
+        connection = session.connection()
+        preparer = connection.dialect.identifier_preparer
+
+        table_name = preparer.format_table(table)
+        columns_name = ', '.join(preparer.quote(column) for column in columns)
+        sql = f'COPY {table_name} ({columns_name}) FROM STDIN'
+
+        format_value = self._format_value
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join([format_value(value) for value in row]))
+            buffer.write('\n')
+        buffer.seek(0)
+
+        cursor = connection.connection.cursor()
+        try:
+            if hasattr(cursor, 'copy_expert'):  # psycopg2
+                cursor.copy_expert(sql, buffer)
+            else:  # psycopg 3
+                with cursor.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+        finally:
+            cursor.close()
+
+
+def get_loader(dialect_name: str) -> Loader:
+    """
+    Retorna a estratégia de carga mais rápida disponível para o SGBD
+    :param dialect_name: Nome do dialeto do SQLAlchemy (engine.dialect.name)
+    """
+    if dialect_name == 'postgresql':
+        log.info('Utilizando o COPY do PostgreSQL para a carga dos dados')
+        return PostgresCopyLoader()
+
+    return ExecutemanyLoader()
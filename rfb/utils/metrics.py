@@ -0,0 +1,261 @@
+# ------------------------------------------------------------------------------#
+#                                                                               |
+#     MÉTRICAS DA IMPORTAÇÃO POR ETAPA, EXPORTADAS PARA O PROMETHEUS E JSON     |
+#                                                                               |
+# ------------------------------------------------------------------------------#
+import io
+import os
+import json
+import threading
+
+from bisect import bisect_left
+from logging import getLogger
+from time import perf_counter
+from typing import Optional
+
+from rfb import settings
+
+
+log = getLogger(__name__)
+
+# Tipo e descrição de cada métrica
+DEFINITIONS = {
+    'rfb_bytes_decompressed_total': ('counter', 'Bytes descompactados dos CSVs'),
+    'rfb_rows_parsed_total': ('counter', 'Linhas convertidas pelas funções de parse'),
+    'rfb_rows_quoted_total': ('counter', 'Linhas separadas pela leitura com aspas (utils.tokenizer)'),
+    'rfb_stage_seconds_total': ('counter', 'Tempo gasto em cada etapa da importação'),
+    'rfb_insert_latency_seconds': ('histogram', 'Tempo de inserção de cada bloco de linhas'),
+    'rfb_commit_latency_seconds': ('histogram', 'Tempo do commit de cada bloco de linhas'),
+    'rfb_download_bytes_total': ('counter', 'Bytes recebidos no download'),
+    'rfb_download_seconds_total': ('counter', 'Tempo do download de cada arquivo'),
+    'rfb_download_retries_total': ('counter', 'Novas tentativas do download'),
+}
+
+
+class _Histogram:
+    """ Histograma com buckets cumulativos no formato do Prometheus """
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.
+        self.max = 0.
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def cumulative(self) -> list:
+        total, result = 0, []
+        for bucket, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bucket, total))
+        return result
+
+
+class Metrics:
+    """ Registro das métricas, compartilhado entre as threads """
+
+    def __init__(self, buckets: tuple = settings.METRICS_LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """ Incrementa o contador name com os labels informados """
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """ Registra um valor no histograma name com os labels informados """
+        key = self._key(name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = _Histogram(self.buckets)
+            self.histograms[key].observe(value)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def to_prometheus(self) -> str:
+        """ Retorna as métricas no formato texto do Prometheus (textfile collector) """
+
+        def labels_text(labels, extra=()):
+            items = [f'{label}="{value}"' for label, value in labels + tuple(extra)]
+            return '{' + ','.join(items) + '}' if items else ''
+
+        lines = []
+        with self.lock:
+            for name, (kind, description) in DEFINITIONS.items():
+                counters = [(labels, value) for (key, labels), value in self.counters.items() if key == name]
+                histograms = [(labels, value) for (key, labels), value in self.histograms.items() if key == name]
+                if not counters and not histograms:
+                    continue
+
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} {kind}')
+
+                for labels, value in sorted(counters):
+                    lines.append(f'{name}{labels_text(labels)} {value}')
+
+                for labels, histogram in sorted(histograms, key=lambda item: item[0]):
+                    for bucket, count in histogram.cumulative():
+                        lines.append(f'{name}_bucket{labels_text(labels, [("le", bucket)])} {count}')
+                    lines.append(f'{name}_bucket{labels_text(labels, [("le", "+Inf")])} {histogram.count}')
+                    lines.append(f'{name}_sum{labels_text(labels)} {histogram.sum}')
+                    lines.append(f'{name}_count{labels_text(labels)} {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> dict:
+        """ Resumo das métricas por dataset e por arquivo baixado """
+
+        datasets, downloads = {}, {}
+        with self.lock:
+            for (name, labels), value in self.counters.items():
+                labels = dict(labels)
+                if 'dataset' in labels:
+                    dataset = datasets.setdefault(labels['dataset'], {'etapas_segundos': {}})
+                    if name == 'rfb_stage_seconds_total':
+                        dataset['etapas_segundos'][labels['stage']] = round(value, 3)
+                    else:
+                        dataset[name[len('rfb_'):-len('_total')]] = value
+                elif 'arquivo' in labels:
+                    download = downloads.setdefault(labels['arquivo'], {})
+                    download[name[len('rfb_download_'):-len('_total')]] = value
+
+            for (name, labels), histogram in self.histograms.items():
+                dataset = datasets.setdefault(dict(labels)['dataset'], {'etapas_segundos': {}})
+                dataset[name[len('rfb_'):]] = {
+                    'quantidade': histogram.count,
+                    'media': round(histogram.sum / histogram.count, 6) if histogram.count else None,
+                    'maximo': round(histogram.max, 6),
+                }
+
+        for dataset in datasets.values():
+            seconds = sum(dataset['etapas_segundos'].values())
+            rows = dataset.get('rows_parsed', 0)
+            dataset['linhas_por_segundo'] = round(rows / seconds) if seconds and rows else None
+
+        for download in downloads.values():
+            seconds, size = download.get('seconds', 0), download.get('bytes', 0)
+            download['mb_por_segundo'] = round(size / seconds / 1048576, 3) if seconds else None
+
+        return {'datasets': datasets, 'downloads': downloads}
+
+
+# Registro global utilizado pela importação e pelo download
+REGISTRY = Metrics()
+
+
+class TimedReader(io.RawIOBase):
+    """
+    Leitura de um membro do ZIP acumulando o tempo de descompactação e os bytes
+    descompactados, utilizado com um io.BufferedReader para que a medição
+    aconteça apenas a cada bloco e não a cada linha
+    """
+
+    def __init__(self, file):
+        super().__init__()
+        self.file = file
+        self.elapsed = 0.
+        self.size = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        start = perf_counter()
+        data = self.file.read(len(buffer))
+        size = len(data)
+        buffer[:size] = data
+
+        self.elapsed += perf_counter() - start
+        self.size += size
+        return size
+
+    def take(self) -> tuple:
+        """ Retorna (segundos, bytes) acumulados desde a última chamada """
+        result = self.elapsed, self.size
+        self.elapsed, self.size = 0., 0
+        return result
+
+
+def timed_lines(lines) -> tuple:
+    """
+    Envolve as linhas de um membro do ZIP para medir a descompactação, quando o
+    membro for um arquivo (ZipFile.open). Nos demais casos (ex.: leitura durante o
+    download) a descompactação fica incluída na etapa decode
+    :return: tupla (linhas, TimedReader ou None)
+    """
+    if hasattr(lines, 'read'):
+        reader = TimedReader(lines)
+        return io.BufferedReader(reader, settings.METRICS_READ_BUFFER_SIZE), reader
+    return lines, None
+
+
+class MetricsExporter(threading.Thread):
+    """
+    Grava periodicamente as métricas no arquivo do textfile collector do Prometheus
+    e, ao final, o resumo em JSON
+    """
+
+    def __init__(self, prometheus_path: Optional[str] = None, json_path: Optional[str] = None,
+                 interval: float = settings.METRICS_INTERVAL, registry: Metrics = REGISTRY):
+        """
+        :param prometheus_path: Arquivo .prom lido pelo node_exporter (--collector.textfile.directory)
+        :param json_path: Arquivo com o resumo gravado ao final da execução
+        :param interval: Intervalo (segundos) entre as gravações do arquivo do Prometheus
+        :param registry: Registro das métricas
+        """
+        super().__init__(name='cnpj_metrics', daemon=True)
+        self.prometheus_path = prometheus_path
+        self.json_path = json_path
+        self.interval = interval
+        self.registry = registry
+        self.started = perf_counter()
+        self._finished = threading.Event()
+
+    @staticmethod
+    def _write(path: str, content: str) -> None:
+        """ Grava o arquivo de forma atômica, evitando a leitura de um arquivo incompleto """
+        temp = f'{path}.tmp'
+        with open(temp, 'w', encoding='utf-8') as file:
+            file.write(content)
+        os.replace(temp, path)
+
+    def write_prometheus(self) -> None:
+        if self.prometheus_path:
+            self._write(self.prometheus_path, self.registry.to_prometheus())
+
+    def run(self) -> None:
+        while not self._finished.wait(self.interval):
+            try:
+                self.write_prometheus()
+            except OSError as e:
+                log.warning(f'Erro ao gravar as métricas em {self.prometheus_path}: {e}')
+
+    def close(self) -> None:
+        """ Finaliza a thread e grava as métricas finais """
+        self._finished.set()
+        if self.is_alive():
+            self.join()
+
+        self.write_prometheus()
+        if self.json_path:
+            summary = self.registry.summary()
+            summary['segundos'] = round(perf_counter() - self.started, 3)
+            self._write(self.json_path, json.dumps(summary, indent=2, ensure_ascii=False))
@@ -0,0 +1,184 @@
+# ------------------------------------------------------------------------------#
+#                                                                               |
+#       EXPORTAÇÃO DOS DADOS PARA ARQUIVOS PARQUET, SEM O USO DO BANCO          |
+#                                                                               |
+# ------------------------------------------------------------------------------#
+import os
+import click
+
+from logging import getLogger
+from typing import Optional
+
+from sqlalchemy.orm.decl_api import DeclarativeMeta
+
+from rfb import settings
+from rfb.utils import convert
+from rfb.utils.convert_database import ConvertDatabase, list_files, read_chunks
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+log = getLogger(__name__)
+
+# Colunas de texto com poucos valores distintos, gravadas com dictionary encoding
+DICTIONARY_COLUMNS = {
+    'uf', 'motivo_situacao', 'cnae_fiscal', 'tipo_logradouro', 'situacao_especial',
+    'opcao_simples', 'opcao_mei', 'faixa_etaria',
+}
+
+# Colunas inteiras que não são códigos e podem não caber em 16 bits
+INT32_COLUMNS = {'ddd_1', 'ddd_2', 'ddd_fax'}
+
+# Coluna utilizada no particionamento, quando existir na tabela
+PARTITION_COLUMN = 'uf'
+
+# Nome da partição dos registros sem UF (convenção do Hive)
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+
+def _arrow_type(column: str, converter):
+    """ Retorna o tipo da coluna no Parquet a partir do conversor do layout (utils.fields) """
+
+    if column in DICTIONARY_COLUMNS:
+        return pa.dictionary(pa.int32(), pa.string())
+    if converter in (convert.parse_int, convert.parse_code):
+        return pa.int32() if column in INT32_COLUMNS else pa.int16()
+    if converter is convert.parse_float:
+        return pa.float64()
+    if converter is convert.parse_date:
+        return pa.date32()
+    return pa.string()
+
+
+class _PartitionWriter:
+    """ Arquivo Parquet de uma partição, gravado em row groups de tamanho limitado """
+
+    def __init__(self, path: str, schema, row_group_rows: int, compression: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.schema = schema
+        self.row_group_rows = row_group_rows
+        self.writer = pq.ParquetWriter(path, schema, compression=compression)
+        self.rows = []
+
+    def write(self, rows: list) -> None:
+        self.rows.extend(rows)
+
+        while len(self.rows) >= self.row_group_rows:
+            self._flush(self.rows[:self.row_group_rows])
+            self.rows = self.rows[self.row_group_rows:]
+
+    def _flush(self, rows: list) -> None:
+        columns = list(zip(*rows))
+        arrays = []
+
+        for i, field in enumerate(self.schema):
+            if pa.types.is_dictionary(field.type):
+                arrays.append(pa.array(columns[i], pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(columns[i], field.type))
+
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema), row_group_size=self.row_group_rows)
+
+    def close(self) -> None:
+        if self.rows:
+            self._flush(self.rows)
+            self.rows = []
+        self.writer.close()
+
+
+class ParquetExport:
+    """
+    Exporta os arquivos da RFB para Parquet utilizando as mesmas funções de leitura e
+    parse da carga no banco. Cada dataset é gravado em <destino>/<tabela>/ e as tabelas
+    com UF são particionadas em <destino>/<tabela>/uf=<UF>/
+    """
+
+    def __init__(self, directory: str, output: str,
+                 row_group_rows: int = settings.PARQUET_ROW_GROUP_ROWS,
+                 compression: str = settings.PARQUET_COMPRESSION):
+        """
+        :param directory: Diretório onde está os arquivos ZIP
+        :param output: Diretório de destino dos arquivos Parquet
+        :param row_group_rows: Quantidade máxima de linhas de cada row group
+        :param compression: Compressão dos arquivos Parquet
+        """
+        if pa is None:
+            raise ImportError('A exportação para Parquet exige o pyarrow, instale com: pip install pyarrow')
+
+        self.directory = directory
+        self.output = output
+        self.row_group_rows = row_group_rows
+        self.compression = compression
+
+    def export(self,
+               pattern_name: str,
+               qt_column: int,
+               model: DeclarativeMeta,
+               parse_function: Optional[str] = None) -> None:
+        """
+        Exporta os arquivos do pattern_name, mesmos parâmetros do ConvertDatabase.populate
+
+        :param pattern_name:
+            Nome do pattern_name em utils.NAMES_PATTERNS
+
+        :param qt_column:
+            Quantidade de colunas que se espera que tenha cada linha
+
+        :param model:
+            Model da tabela, utilizado no nome do dataset
+
+        :param parse_function:
+            Nome da função responsável por fazer os parse da informação,
+            caso não seja informado, será utilizado baseado no pattern_name
+        """
+
+        populate_name = pattern_name.replace('_', ' ').upper()
+        parse_function = getattr(ConvertDatabase, parse_function or f'parse_{pattern_name}')
+        layout = parse_function.fields
+        dataset = os.path.join(self.output, model.__tablename__)
+
+        columns = parse_function.columns
+        partition = columns.index(PARTITION_COLUMN) if PARTITION_COLUMN in columns else None
+        schema = pa.schema([
+            (field.column, _arrow_type(field.column, field.converter))
+            for i, field in enumerate(layout) if i != partition
+        ])
+
+        writers = {}
+        total = 0
+
+        try:
+            for file in list_files(self.directory, pattern_name):
+                msg = f'[{populate_name}] Exportando o CSV {file} para Parquet'
+                log.info(msg)
+                click.echo(msg, nl=True)
+
+                for chunk in read_chunks(file, populate_name, qt_column, parse_function):
+                    total += len(chunk.rows)
+
+                    if partition is None:
+                        groups = {None: chunk.rows}
+                    else:
+                        groups = {}
+                        for row in chunk.rows:
+                            groups.setdefault(row[partition], []).append(row[:partition] + row[partition + 1:])
+
+                    for key, rows in groups.items():
+                        if key not in writers:
+                            path = dataset if partition is None else \
+                                os.path.join(dataset, f'{PARTITION_COLUMN}={key or NULL_PARTITION}')
+                            writers[key] = _PartitionWriter(
+                                os.path.join(path, 'part-0.parquet'), schema, self.row_group_rows, self.compression
+                            )
+                        writers[key].write(rows)
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+        info = f'[{populate_name}] Finalizado a exportação de {total} linhas em {len(writers)} arquivos Parquet'
+        log.info(info)
+        click.echo(info, nl=True)
@@ -0,0 +1,421 @@
+# ------------------------------------------------------------------------------#
+#                                                                               |
+#     PARTICIONAMENTO DECLARATIVO DO POSTGRESQL E CARGA POR PARTIÇÃO            |
+#                                                                               |
+# ------------------------------------------------------------------------------#
+import click
+
+from bisect import bisect_right
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from logging import getLogger
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Optional
+
+from sqlalchemy import Column, Integer, MetaData, Table, UniqueConstraint, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.schema import CreateTable
+
+from rfb import settings
+from rfb.utils.buffer import ChunkWriter
+from rfb.utils.metrics import REGISTRY
+
+
+log = getLogger(__name__)
+
+# Partições da estratégia por UF, EX são os estabelecimentos no exterior
+UFS = (
+    'AC', 'AL', 'AM', 'AP', 'BA', 'CE', 'DF', 'ES', 'EX', 'GO', 'MA', 'MG', 'MS', 'MT', 'PA',
+    'PB', 'PE', 'PI', 'PR', 'RJ', 'RN', 'RO', 'RR', 'RS', 'SC', 'SE', 'SP', 'TO',
+)
+
+# Partição de uma tabela
+#  name: nome da tabela da partição
+#  bound: limites da partição no CREATE TABLE ... PARTITION OF e no ATTACH PARTITION
+#  check: condição equivalente aos limites, evita a verificação das linhas no ATTACH
+Partition = namedtuple('Partition', ['name', 'bound', 'check'])
+
+
+def _literal(value) -> str:
+    return str(value) if isinstance(value, int) else f"'{value}'"
+
+
+class PartitionScheme:
+    """
+    Partições de uma tabela de acordo com a coluna informada em settings.PARTITIONS:
+     - uf: uma partição (LIST) para cada UF
+     - cnpj: PARTITION_CNPJ_RANGES faixas (RANGE) de mesmo tamanho do CNPJ base
+    As linhas sem uma partição (ex.: UF vazia) ficam na partição <tabela>_default.
+    A separação das linhas (split) segue as mesmas regras do PostgreSQL, então as
+    linhas podem ser gravadas direto na tabela de cada partição
+    """
+
+    def __init__(self, table: Table, column: str, ranges: int = settings.PARTITION_CNPJ_RANGES):
+        """
+        :param table: Tabela do model (schema padrão ou compacto)
+        :param column: Coluna da partição, uf ou cnpj
+        :param ranges: Quantidade de faixas do CNPJ base
+        """
+        self.table = table
+        self.column = column
+
+        if column == 'uf':
+            self.strategy = 'LIST'
+            self.key = column
+            self.partitions = [
+                Partition(f'{table.name}_{uf.lower()}', f"FOR VALUES IN ('{uf}')", f"{column} = '{uf}'")
+                for uf in UFS
+            ]
+            positions = {uf: i for i, uf in enumerate(UFS)}
+            default = len(self.partitions)
+            self.route = lambda value: positions.get(value, default)
+        elif column == 'cnpj':
+            # No schema padrão o CNPJ base é texto com 8 dígitos, comparado byte a byte (COLLATE "C")
+            step = 10 ** 8 // ranges
+            if isinstance(table.c[column].type, Integer):
+                self.key, expression = column, column
+                bounds = [i * step for i in range(1, ranges)]
+            else:
+                self.key = expression = f'{column} COLLATE "C"'
+                bounds = [f'{i * step:08d}' for i in range(1, ranges)]
+
+            self.strategy = 'RANGE'
+            self.partitions = []
+            for i in range(ranges):
+                lower = 'MINVALUE' if i == 0 else _literal(bounds[i - 1])
+                upper = 'MAXVALUE' if i == ranges - 1 else _literal(bounds[i])
+                check = [f'{column} IS NOT NULL']
+                if i > 0:
+                    check.append(f'{expression} >= {lower}')
+                if i < ranges - 1:
+                    check.append(f'{expression} < {upper}')
+                self.partitions.append(Partition(
+                    f'{table.name}_{i:02d}', f'FOR VALUES FROM ({lower}) TO ({upper})', ' AND '.join(check)
+                ))
+
+            default = len(self.partitions)
+            self.route = lambda value: default if value is None else bisect_right(bounds, value)
+        else:
+            raise ValueError(f'Coluna de partição não suportada: {column}, utilize uf ou cnpj')
+
+        self.partitions.append(Partition(f'{table.name}_default', 'DEFAULT', None))
+
+    def split(self, rows: list, position: int) -> dict:
+        """
+        Separa as linhas por partição
+        :param rows: Tuplas retornadas pela função de parse
+        :param position: Posição da coluna da partição nas tuplas
+        :return: dict com a posição da partição em partitions e as linhas da mesma
+        """
+        route = self.route
+        groups = {}
+        for row in rows:
+            index = route(row[position])
+            if index in groups:
+                groups[index].append(row)
+            else:
+                groups[index] = [row]
+        return groups
+
+    def parent(self) -> Table:
+        """
+        Tabela particionada: o PostgreSQL exige a coluna da partição nas chaves únicas,
+        então a chave primária do model passa a ser uma chave única junto com a coluna
+        da partição, que continua aceitando as linhas sem valor (partição default)
+        """
+        columns = []
+        for column in self.table.c:
+            if column is self.autoincrement:
+                columns.append(Column(column.name, column.type, nullable=False,
+                                      server_default=text(f"nextval('{self.sequence}')")))
+            else:
+                columns.append(Column(column.name, column.type, nullable=column.nullable))
+
+        return Table(
+            self.table.name, MetaData(), *columns,
+            UniqueConstraint(*self.keys, name=f'{self.table.name}_chave'),
+            postgresql_partition_by=f'{self.strategy} ({self.key})'
+        )
+
+    @property
+    def autoincrement(self) -> Optional[Column]:
+        """ Coluna gerada pelo SERIAL (id), None quando a chave é a natural (schema compacto) """
+
+        keys = list(self.table.primary_key.columns)
+        if len(keys) == 1 and isinstance(keys[0].type, Integer) and keys[0].autoincrement in ('auto', True):
+            return keys[0]
+        return None
+
+    @property
+    def sequence(self) -> Optional[str]:
+        """ Sequência do id, a mesma criada pelo SERIAL na tabela sem partições """
+
+        if self.autoincrement is None:
+            return None
+        return f'{self.table.name}_{self.autoincrement.name}_seq'
+
+    @property
+    def keys(self) -> list:
+        """ Colunas da chave única da tabela particionada e de cada partição """
+
+        keys = [column.name for column in self.table.primary_key.columns]
+        if self.column not in keys:
+            keys.append(self.column)
+        return keys
+
+
+def create_table(engine: Engine, scheme: PartitionScheme) -> None:
+    """
+    Cria a tabela particionada e as partições que ainda não existem, os índices
+    declarados no model são criados na tabela principal após a carga e o PostgreSQL
+    os replica em cada partição
+    :param engine: Engine do SQLAlchemy (PostgreSQL)
+    :param scheme: Partições da tabela
+    """
+    preparer = engine.dialect.identifier_preparer
+    table = preparer.quote(scheme.table.name)
+
+    with engine.begin() as connection:
+        kind = connection.execute(text('SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)'),
+                                  {'name': scheme.table.name}).scalar()
+        if kind is None:
+            if scheme.sequence is not None:
+                connection.execute(text(f'CREATE SEQUENCE IF NOT EXISTS {preparer.quote(scheme.sequence)}'))
+            connection.execute(CreateTable(scheme.parent()))
+            if scheme.sequence is not None:
+                column = preparer.quote(scheme.autoincrement.name)
+                connection.execute(text(f'ALTER SEQUENCE {preparer.quote(scheme.sequence)} '
+                                        f'OWNED BY {table}.{column}'))
+        elif kind != 'p':
+            raise ValueError(f'A tabela {scheme.table.name} já existe sem particionamento, '
+                             f'remova a mesma para que seja criada particionada')
+
+        for partition in scheme.partitions:
+            connection.execute(text(
+                f'CREATE TABLE IF NOT EXISTS {preparer.quote(partition.name)} PARTITION OF {table} {partition.bound}'
+            ))
+
+
+def table_scheme(session: Session, table: Table) -> Optional[PartitionScheme]:
+    """
+    Retorna as partições da tabela caso a mesma tenha sido criada particionada
+    :param session: Sessão do SQLAlchemy
+    :param table: Tabela do model
+    :return: PartitionScheme ou None quando a tabela não é particionada
+    """
+    if session.bind.dialect.name != 'postgresql' or table.name not in settings.PARTITIONS:
+        return None
+
+    key = session.execute(text('SELECT pg_get_partkeydef(to_regclass(:name))'), {'name': table.name}).scalar()
+    if key is None:
+        return None
+
+    scheme = PartitionScheme(table, settings.PARTITIONS[table.name])
+    names = set(session.execute(text(
+        'SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+        'WHERE pg_inherits.inhparent = to_regclass(:name)'
+    ), {'name': table.name}).scalars())
+
+    # O COLLATE só aparece quando é diferente do padrão do banco de dados
+    strategy, _, expression = key.partition(' ')
+    expected = {partition.name for partition in scheme.partitions}
+    if strategy != scheme.strategy or not expression.startswith(f'({scheme.column}') or names != expected:
+        raise ValueError(f'As partições da tabela {table.name} ({key}) não correspondem ao settings.PARTITIONS, '
+                         f'recrie a tabela')
+    return scheme
+
+
+def _countdown(count: int, callback: Optional[Callable[[], None]]) -> Optional[Callable[[], None]]:
+    """ Retorna uma função que executa o callback apenas na última das count chamadas """
+
+    if callback is None:
+        return None
+
+    pending, lock = [count], Lock()
+
+    def release():
+        with lock:
+            pending[0] -= 1
+            done = pending[0] == 0
+        if done:
+            callback()
+
+    return release
+
+
+class PartitionLoad:
+    """
+    Recarga de uma tabela particionada sem interromper as consultas: as linhas são
+    separadas por partição e gravadas em uma tabela nova de cada partição
+    (<partição>_carga) por PARTITION_WORKERS conexões em paralelo. Ao final as chaves
+    e os índices existentes são construídos nas tabelas novas e cada partição é
+    trocada pela nova (DETACH/ATTACH) em uma transação curta, uma de cada vez
+    """
+
+    def __init__(self, engine: Engine, scheme: PartitionScheme, columns: tuple, loader,
+                 workers: int = settings.PARTITION_WORKERS):
+        """
+        :param engine: Engine do SQLAlchemy (PostgreSQL)
+        :param scheme: Partições da tabela (table_scheme)
+        :param columns: Nome das colunas na ordem das tuplas do parse
+        :param loader: Estratégia de carga (utils.loader), compartilhada entre as conexões
+        :param workers: Quantidade de conexões gravando as partições ao mesmo tempo
+        """
+        self.engine = engine
+        self.scheme = scheme
+        self.columns = columns
+        self.loader = loader
+        self.position = columns.index(scheme.column)
+        self.preparer = engine.dialect.identifier_preparer
+
+        metadata = MetaData()
+        self.stages = [
+            Table(f'{partition.name}_carga', metadata, *[Column(column.name, column.type) for column in scheme.table.c])
+            for partition in scheme.partitions
+        ]
+
+        workers = max(workers, 1)
+        self.sessions = [sessionmaker(bind=engine)() for _ in range(workers)]
+        self.writers = [
+            ChunkWriter(partial(self._write, session), queue_size=settings.PARTITION_QUEUE_SIZE,
+                        name=f'cnpj_partition_{i}')
+            for i, session in enumerate(self.sessions)
+        ]
+
+    def _quote(self, name: str) -> str:
+        return self.preparer.quote(name)
+
+    def start(self) -> None:
+        """ Recria as tabelas novas de cada partição e inicia as conexões de escrita """
+
+        table = self._quote(self.scheme.table.name)
+        with self.engine.begin() as connection:
+            for stage in self.stages:
+                connection.execute(text(f'DROP TABLE IF EXISTS {self._quote(stage.name)}'))
+                connection.execute(text(f'CREATE TABLE {self._quote(stage.name)} (LIKE {table} INCLUDING DEFAULTS)'))
+
+        for writer in self.writers:
+            writer.start()
+
+    def _write(self, session: Session, index: int, rows: list) -> None:
+        """ Grava as linhas de uma partição na conexão da thread de escrita """
+
+        dataset = self.scheme.table.name
+        start = perf_counter()
+        self.loader.insert(session, self.stages[index], self.columns, rows)
+        inserted = perf_counter()
+        session.commit()
+        committed = perf_counter()
+
+        REGISTRY.observe('rfb_insert_latency_seconds', inserted - start, dataset=dataset)
+        REGISTRY.observe('rfb_commit_latency_seconds', committed - inserted, dataset=dataset)
+        REGISTRY.inc('rfb_stage_seconds_total', inserted - start, stage='insert', dataset=dataset)
+        REGISTRY.inc('rfb_stage_seconds_total', committed - inserted, stage='commit', dataset=dataset)
+
+    def put(self, rows: list, on_done: Optional[Callable[[], None]] = None) -> None:
+        """
+        Separa o bloco por partição e envia cada parte para a conexão com a menor fila,
+        uma mesma partição pode ser gravada por várias conexões (ex.: SP)
+        :param rows: Tuplas retornadas pela função de parse
+        :param on_done: Chamado após a escrita de todas as partes do bloco (ex.: liberação
+            do orçamento de memória)
+        """
+        groups = self.scheme.split(rows, self.position)
+        if not groups:
+            if on_done is not None:
+                on_done()
+            return
+
+        release = _countdown(len(groups), on_done)
+        for index, group in groups.items():
+            writer = min(self.writers, key=lambda w: w.queue.qsize())
+            writer.put(index, group, on_done=release)
+
+    def _prepare(self, index: int) -> None:
+        """
+        Constrói a chave única, os índices que existem na tabela particionada, a condição
+        dos limites da partição e as estatísticas na tabela nova de uma partição
+        """
+        stage, partition = self.stages[index], self.scheme.partitions[index]
+        name = self._quote(stage.name)
+        keys = ', '.join(self._quote(key) for key in self.scheme.keys)
+
+        with self.engine.begin() as connection:
+            existing = set(connection.execute(text('SELECT indexname FROM pg_indexes WHERE tablename = :name'),
+                                              {'name': self.scheme.table.name}).scalars())
+
+            connection.execute(text(f'SET maintenance_work_mem = \'{settings.INDEX_MAINTENANCE_WORK_MEM}\''))
+            connection.execute(text(f'ALTER TABLE {name} ADD CONSTRAINT {self._quote(stage.name + "_chave")} '
+                                    f'UNIQUE ({keys})'))
+
+            # O ATTACH reaproveita os índices equivalentes aos da tabela particionada
+            for model_index in sorted(self.scheme.table.indexes, key=lambda i: i.name):
+                if model_index.name in existing:
+                    columns = ', '.join(self._quote(column.name) for column in model_index.columns)
+                    connection.execute(text(f'CREATE INDEX ON {name} ({columns})'))
+
+            if partition.check is not None:
+                connection.execute(text(f'ALTER TABLE {name} ADD CONSTRAINT {self._quote(stage.name + "_limites")} '
+                                        f'CHECK ({partition.check})'))
+
+            connection.execute(text(f'ANALYZE {name}'))
+
+    def _swap(self, index: int) -> None:
+        """ Troca a partição pela tabela nova, as consultas aguardam apenas esta transação """
+
+        stage, partition = self.stages[index], self.scheme.partitions[index]
+        table, old, new = self._quote(self.scheme.table.name), self._quote(partition.name), self._quote(stage.name)
+
+        with self.engine.begin() as connection:
+            connection.execute(text(f'ALTER TABLE {table} DETACH PARTITION {old}'))
+            connection.execute(text(f'DROP TABLE {old}'))
+            connection.execute(text(f'ALTER TABLE {new} RENAME TO {old}'))
+            connection.execute(text(f'ALTER INDEX {self._quote(stage.name + "_chave")} '
+                                    f'RENAME TO {self._quote(partition.name + "_chave")}'))
+            connection.execute(text(f'ALTER TABLE {table} ATTACH PARTITION {old} {partition.bound}'))
+            if partition.check is not None:
+                connection.execute(text(f'ALTER TABLE {old} DROP CONSTRAINT {self._quote(stage.name + "_limites")}'))
+
+    def finish(self) -> None:
+        """
+        Aguarda a escrita das linhas pendentes, prepara as tabelas novas em paralelo e
+        troca as partições uma de cada vez. Em caso de erro antes das trocas as partições
+        continuam com os dados anteriores
+        """
+        for writer in self.writers:
+            writer.close()
+        self._close_sessions()
+
+        name = self.scheme.table.name
+        msg = f'[{name}] Construindo as chaves de {len(self.stages)} partições com {len(self.writers)} conexões'
+        log.info(msg)
+        click.echo(msg, nl=True)
+
+        with ThreadPoolExecutor(max_workers=len(self.writers), thread_name_prefix='cnpj_partition') as executor:
+            list(executor.map(self._prepare, range(len(self.stages))))
+
+        for index, partition in enumerate(self.scheme.partitions):
+            start = perf_counter()
+            self._swap(index)
+            msg = f'[{name}] Partição {partition.name} substituída em {perf_counter() - start:.1f}s'
+            log.info(msg)
+            click.echo(msg, nl=True)
+
+    def abort(self) -> None:
+        """ Descarta a carga, as partições continuam com os dados anteriores """
+
+        for writer in self.writers:
+            if writer.is_alive():
+                writer.abort()
+        self._close_sessions()
+
+        with self.engine.begin() as connection:
+            for stage in self.stages:
+                connection.execute(text(f'DROP TABLE IF EXISTS {self._quote(stage.name)}'))
+
+    def _close_sessions(self) -> None:
+        for session in self.sessions:
+            session.close()
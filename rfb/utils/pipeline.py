@@ -0,0 +1,202 @@
+# ------------------------------------------------------------------------------#
+#                                                                               |
+#    PIPELINE EM PROCESSOS: LEITURA/PARSE EM PARALELO E ESCRITA NO BANCO        |
+#                                                                               |
+# ------------------------------------------------------------------------------#
+import click
+import multiprocessing
+
+from logging import getLogger
+from multiprocessing.connection import wait
+from multiprocessing.process import BaseProcess
+
+from rfb import settings
+from rfb.utils import checkpoint
+from rfb.utils import fields
+from rfb.utils.convert_database import ConvertDatabase, cnae_inserts, list_files, read_chunks
+from rfb.utils.sqlite_writer import SqliteWriter
+
+
+log = getLogger(__name__)
+
+
+def _parser(tasks: multiprocessing.Queue, batches: list) -> None:
+    """
+    Processo de leitura: descompacta e faz o parse de arquivos inteiros,
+    enviando os blocos de linhas para o processo de escrita do arquivo
+    :param tasks: Fila com os arquivos que serão lidos
+    :param batches: Fila de cada processo de escrita com os blocos prontos para a inserção
+    """
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+
+        (file, populate_name, columns, model, parse_function, hash_file, progress, cnaes_secundarios, chunk_size,
+         writer) = task
+        msg = f'[{populate_name}] Importando o CSV {file}'
+        log.info(msg)
+        click.echo(msg, nl=True)
+
+        parse_function = getattr(ConvertDatabase, parse_function)
+        split_cnaes = fields.cnae_splitter(parse_function.columns) if cnaes_secundarios else None
+
+        for chunk in read_chunks(file, populate_name, columns, parse_function, chunk_size, resume=progress):
+            checkpoint_row = checkpoint.row(file, chunk.member, hash_file, chunk.line, chunk.finished)
+            children = cnae_inserts(model, split_cnaes, chunk.rows)
+            batches[writer].put((model, parse_function.columns, chunk.rows, checkpoint_row, children))
+
+
+def _writer(database_url: str, directory: str, batches: multiprocessing.Queue) -> None:
+    """
+    Processo de escrita: insere no banco de dados os blocos recebidos, na ordem em que
+    foram lidos, o que mantém o checkpoint de cada arquivo correto
+    :param database_url: URL de conexão com o banco de dados
+    :param directory: Diretório onde está os arquivos CSV
+    :param batches: Fila do processo com os blocos prontos para a inserção
+    """
+    convert_database = ConvertDatabase(database_url, directory)
+
+    sqlite_writer = None
+    if convert_database.engine.dialect.name == 'sqlite':
+        sqlite_writer = SqliteWriter(convert_database.engine)
+        sqlite_writer.start()
+        convert_database.loader = sqlite_writer
+
+    while True:
+        batch = batches.get()
+        if batch is None:
+            break
+
+        model, columns, rows, checkpoint_row, children = batch
+        convert_database._insert(model.__table__, columns, rows, checkpoint_row, children=children)
+
+    if sqlite_writer is not None:
+        sqlite_writer.close()
+
+
+def _wait(processes: list, watch: list) -> None:
+    """
+    Aguarda a finalização dos processos, interrompendo tudo caso algum
+    processo (inclusive os de watch) termine com erro
+    :param processes: Processos que serão aguardados
+    :param watch: Demais processos que são monitorados
+    """
+    def failed(process: BaseProcess):
+        return process.exitcode not in (None, 0)
+
+    pending = list(processes)
+    while pending:
+        wait([process.sentinel for process in pending + watch if process.is_alive()], timeout=1)
+
+        for process in processes + watch:
+            if failed(process):
+                for other in processes + watch:
+                    other.kill()
+
+                msg = f'O processo {process.name} foi finalizado com o código {process.exitcode}'
+                log.error(msg)
+                raise RuntimeError(msg)
+
+        pending = [process for process in pending if process.is_alive()]
+
+
+def assign_writers(sizes: list, writers: int) -> list:
+    """
+    Escolhe o processo de escrita de cada arquivo, todos os blocos de um arquivo são gravados
+    pelo mesmo processo e na ordem da leitura. Com blocos de um mesmo arquivo em processos
+    diferentes um bloco posterior poderia ser gravado antes de um anterior e, após uma
+    interrupção, a retomada (checkpoint.load, última linha gravada) descartaria as linhas
+    do bloco anterior
+    :param sizes: Tamanho de cada arquivo, dos maiores para os menores
+    :param writers: Quantidade de processos de escrita
+    :return: índice do processo de escrita de cada arquivo, o de menos bytes atribuídos
+    """
+    assigned = [0] * writers
+    result = []
+    for size in sizes:
+        writer = assigned.index(min(assigned))
+        assigned[writer] += size
+        result.append(writer)
+    return result
+
+
+def run(database_url: str, directory: str, params: list, workers: int) -> None:
+    """
+    Executa a importação com processos de leitura/parse independentes dos
+    processos de escrita, evitando o GIL no parse dos arquivos
+    :param database_url: URL de conexão com o banco de dados
+    :param directory: Diretório onde está os arquivos CSV
+    :param params: Parâmetros de cada populate (pattern_name, qt_column, model, parse_function,
+        cnaes_secundarios e chunk_size)
+    :param workers: Quantidade de processos de leitura/parse
+    """
+    # O pipeline é executado em uma thread do Scheduler e o fork a partir de uma
+    # thread herda o estado das demais, então os processos são sempre iniciados do zero
+    context = multiprocessing.get_context('spawn')
+    tasks = context.Queue()
+
+    # O progresso já gravado de cada arquivo é lido antes, os processos de leitura não acessam o banco
+    session = ConvertDatabase(database_url, directory).session
+
+    # Os maiores arquivos são os primeiros, evitando que um arquivo grande fique para o final
+    files = []
+    for param in params:
+        populate_name = param['pattern_name'].replace('_', ' ').upper()
+        parse_function = param.get('parse_function') or f'parse_{param["pattern_name"]}'
+
+        for file in list_files(directory, param['pattern_name']):
+            hash_file = checkpoint.file_hash(file)
+            progress = checkpoint.load(session, file, hash_file)
+
+            if checkpoint.is_finished(file, progress):
+                msg = f'[{populate_name}] O CSV {file} já foi importado, ignorando'
+                log.info(msg)
+                click.echo(msg, nl=True)
+                continue
+
+            files.append((file, populate_name, param['qt_column'], param['model'], parse_function,
+                          hash_file, progress, param.get('cnaes_secundarios', False),
+                          param.get('chunk_size', settings.CHUNK_ROWS_INSERT_DATABASE)))
+
+    session.close()
+
+    qt_writers = 1 if database_url.startswith('sqlite') else min(workers, settings.PIPELINE_MAX_WRITERS)
+    batches = [context.Queue(maxsize=max(settings.PIPELINE_QUEUE_SIZE // qt_writers, 1)) for _ in range(qt_writers)]
+
+    files = sorted(files, key=lambda t: t[0].stat().st_size, reverse=True)
+    for task, writer in zip(files, assign_writers([task[0].stat().st_size for task in files], qt_writers)):
+        tasks.put(task + (writer,))
+
+    for _ in range(workers):
+        tasks.put(None)
+
+    msg = f'Iniciando o pipeline com {workers} processos de leitura e {qt_writers} de escrita ' \
+          f'para {len(files)} arquivos'
+    log.info(msg)
+    click.echo(msg)
+
+    parsers = [
+        context.Process(target=_parser, args=[tasks, batches], name=f'cnpj_parser_{i}')
+        for i in range(workers)
+    ]
+    writers = [
+        context.Process(target=_writer, args=[database_url, directory, batches[i]], name=f'cnpj_writer_{i}')
+        for i in range(qt_writers)
+    ]
+
+    for process in parsers + writers:
+        process.start()
+
+    _wait(parsers, writers)
+
+    for queue in batches:
+        queue.put(None)
+
+    _wait(writers, [])
+
+    for param in params:
+        populate_name = param['pattern_name'].replace('_', ' ').upper()
+        info = f'[{populate_name}] Finalizado a inserção dos { populate_name }'
+        log.info(info)
+        click.echo(info, nl=True)
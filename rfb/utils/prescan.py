@@ -0,0 +1,148 @@
+# ------------------------------------------------------------------------------#
+#                                                                               |
+#       PRÉ-ANÁLISE DOS ARQUIVOS PARA O AJUSTE DOS BLOCOS E DO PARALELISMO      |
+#                                                                               |
+# ------------------------------------------------------------------------------#
+import click
+import math
+
+from collections import namedtuple
+from logging import getLogger
+from pathlib import PurePath
+from zipfile import ZipFile, ZipInfo
+
+from rfb import settings
+from rfb.utils.convert_database import files_size, list_files
+from rfb.utils.progress import PROGRESS
+
+
+log = getLogger(__name__)
+
+# Resultado da pré-análise de um dataset
+#  pattern_name: nome do pattern_name em utils.NAMES_PATTERNS
+#  files: dict com o nome de cada arquivo ZIP e as linhas estimadas
+#  compressed, uncompressed: tamanho (bytes) compactado e descompactado dos arquivos
+#  rows: linhas estimadas de todos os arquivos
+#  row_bytes: tamanho médio (bytes) de cada linha do CSV
+#  chunk_rows: linhas de cada bloco inserido no banco de dados
+#  workers: quantidade de arquivos importados ao mesmo tempo
+DatasetStats = namedtuple('DatasetStats', [
+    'pattern_name', 'files', 'compressed', 'uncompressed', 'rows', 'row_bytes', 'chunk_rows', 'workers'
+])
+
+# Última pré-análise de cada pattern_name, utilizada na ordem da importação (weight)
+STATS = {}
+
+
+def _sample(zip_file: ZipFile, info: ZipInfo) -> tuple:
+    """
+    Lê o início do membro do ZIP
+    :return: tupla (bytes lidos, linhas lidas, indica se o membro foi lido por completo)
+    """
+    with zip_file.open(info, mode='r') as content:
+        data = content.read(settings.PRESCAN_SAMPLE_SIZE)
+
+    lines = data.count(b'\n')
+    complete = len(data) >= info.file_size
+    if complete and data and not data.endswith(b'\n'):
+        lines += 1
+    return len(data), lines, complete
+
+
+def chunk_rows(row_bytes: float, rows: int) -> int:
+    """
+    Linhas de cada bloco: PRESCAN_CHUNK_BYTES do CSV, entre PRESCAN_MIN_CHUNK_ROWS e
+    PRESCAN_MAX_CHUNK_ROWS, então as tabelas de domínio são lidas em um único bloco
+    e as linhas largas (ex.: estabelecimentos) ficam em blocos menores
+    :param row_bytes: Tamanho médio (bytes) de cada linha do CSV
+    :param rows: Linhas estimadas do dataset
+    """
+    size = int(settings.PRESCAN_CHUNK_BYTES // max(row_bytes, 1))
+    size = max(settings.PRESCAN_MIN_CHUNK_ROWS, min(size, settings.PRESCAN_MAX_CHUNK_ROWS))
+    return max(min(size, rows + 1), 1)
+
+
+def file_workers(files: int, uncompressed: int) -> int:
+    """
+    Arquivos importados ao mesmo tempo: um para cada PRESCAN_BYTES_PER_WORKER
+    descompactados, até PRESCAN_MAX_FILE_WORKERS
+    :param files: Quantidade de arquivos do dataset
+    :param uncompressed: Tamanho descompactado (bytes) dos arquivos
+    """
+    workers = math.ceil(uncompressed / settings.PRESCAN_BYTES_PER_WORKER)
+    return max(min(workers, files, settings.PRESCAN_MAX_FILE_WORKERS), 1)
+
+
+def scan(directory: str, pattern_name: str) -> DatasetStats:
+    """
+    Estima as linhas dos arquivos do pattern_name a partir do diretório central dos ZIPs
+    (tamanhos descompactados, sem descompactar) e do início de cada membro
+    :param directory: Diretório onde está os arquivos ZIP
+    :param pattern_name: Nome do pattern_name em utils.NAMES_PATTERNS
+    """
+    files, compressed, uncompressed = {}, 0, 0
+    sample_bytes, sample_lines = 0, 0
+
+    for file in list_files(directory, pattern_name):
+        rows = 0
+        with ZipFile(file, 'r') as zip_file:
+            for info in zip_file.infolist():
+                size, lines, complete = _sample(zip_file, info)
+                sample_bytes += size
+                sample_lines += lines
+                if complete:
+                    rows += lines
+                elif lines:
+                    rows += round(info.file_size * lines / size)
+
+                compressed += info.compress_size
+                uncompressed += info.file_size
+
+        files[PurePath(file).name] = rows
+
+    rows = sum(files.values())
+    row_bytes = sample_bytes / sample_lines if sample_lines else 0.
+    return DatasetStats(pattern_name, files, compressed, uncompressed, rows, round(row_bytes, 1),
+                        chunk_rows(row_bytes, rows), file_workers(len(files), uncompressed))
+
+
+def scan_all(directory: str, params: list) -> dict:
+    """
+    Faz a pré-análise de cada pattern_name, ajustando os parâmetros do populate (chunk_size
+    e workers, mantendo os já informados) e o total do progresso da importação
+    :param directory: Diretório onde está os arquivos ZIP
+    :param params: Parâmetros repassados para o ConvertDatabase.populate
+    :return: dict com o pattern_name e o DatasetStats
+    """
+    result = {}
+    for param in params:
+        stats = scan(directory, param['pattern_name'])
+        result[stats.pattern_name] = stats
+
+        param['chunk_size'] = stats.chunk_rows
+        param.setdefault('workers', stats.workers)
+
+        populate_name = stats.pattern_name.replace('_', ' ').upper()
+        PROGRESS.set_total(populate_name, stats.files)
+
+        msg = f'[{populate_name}] Pré-análise: {len(stats.files)} arquivos, ' \
+              f'{stats.compressed / 1048576:.1f}MB compactados e {stats.uncompressed / 1048576:.1f}MB ' \
+              f'descompactados, ~{stats.rows} linhas de {stats.row_bytes:.0f} bytes. Blocos de ' \
+              f'{param["chunk_size"]} linhas e {param["workers"]} arquivos ao mesmo tempo'
+        log.info(msg)
+        click.echo(msg, nl=True)
+
+    STATS.update(result)
+    return result
+
+
+def weight(directory: str, pattern_name: str) -> int:
+    """
+    Peso da importação do pattern_name no Scheduler: o tamanho descompactado da
+    pré-análise ou, sem a mesma, o tamanho compactado dos arquivos
+    :param directory: Diretório onde está os arquivos ZIP
+    :param pattern_name: Nome do pattern_name em utils.NAMES_PATTERNS
+    """
+    if pattern_name in STATS:
+        return STATS[pattern_name].uncompressed
+    return files_size(directory, pattern_name)
@@ -0,0 +1,126 @@
+# ------------------------------------------------------------------------------#
+#                                                                               |
+#       PROGRESSO DA IMPORTAÇÃO E TEMPO RESTANTE A PARTIR DA PRÉ-ANÁLISE        |
+#                                                                               |
+# ------------------------------------------------------------------------------#
+import click
+import threading
+
+from logging import getLogger
+from time import monotonic
+
+from rfb import settings
+
+
+log = getLogger(__name__)
+
+
+def _duration(seconds: float) -> str:
+    """ Formata o tempo restante, ex.: 1h05m, 3m20s, 45s """
+
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f'{seconds // 3600}h{seconds % 3600 // 60:02d}m'
+    if seconds >= 60:
+        return f'{seconds // 60}m{seconds % 60:02d}s'
+    return f'{seconds}s'
+
+
+class Progress:
+    """
+    Progresso de todos os datasets importados ao mesmo tempo, a partir das linhas
+    estimadas de cada arquivo na pré-análise (utils.prescan). Sem a pré-análise
+    nenhum progresso é exibido. Compartilhado entre as threads
+    """
+
+    def __init__(self, interval: float = settings.PROGRESS_INTERVAL):
+        """
+        :param interval: Intervalo mínimo (segundos) entre as mensagens de progresso
+        """
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.files = {}
+        self.totals = {}
+        self.done = {}
+        self.processed = 0
+        self.started = None
+        self.last = 0.
+
+    def set_total(self, dataset: str, files: dict) -> None:
+        """
+        Informa as linhas estimadas de cada arquivo do dataset
+        :param dataset: Nome do dataset (populate_name)
+        :param files: dict com o nome do arquivo ZIP e as linhas estimadas
+        """
+        with self.lock:
+            self.files[dataset] = dict(files)
+            self.totals[dataset] = sum(files.values())
+            self.done.setdefault(dataset, 0)
+
+    def skip(self, dataset: str, rows: int) -> None:
+        """ Linhas já importadas em uma execução anterior (retomada), não entram na velocidade """
+
+        with self.lock:
+            if dataset in self.totals:
+                self.done[dataset] += rows
+
+    def skip_file(self, dataset: str, name: str) -> None:
+        """ Arquivo já importado por completo em uma execução anterior """
+
+        with self.lock:
+            if dataset in self.totals:
+                self.done[dataset] += self.files[dataset].get(name, 0)
+
+    def advance(self, dataset: str, rows: int) -> None:
+        """
+        Registra as linhas lidas de um bloco, exibindo o progresso a cada interval segundos
+        :param dataset: Nome do dataset (populate_name)
+        :param rows: Quantidade de linhas do bloco
+        """
+        with self.lock:
+            if dataset not in self.totals:
+                return
+
+            now = monotonic()
+            if self.started is None:
+                self.started = self.last = now
+
+            self.done[dataset] += rows
+            self.processed += rows
+
+            if now - self.last < self.interval:
+                return
+            self.last = now
+            msg = self._status(now)
+
+        log.info(msg)
+        click.echo(msg, nl=True)
+
+    def finish(self, dataset: str) -> None:
+        """ Ajusta o total estimado do dataset para as linhas efetivamente lidas """
+
+        with self.lock:
+            if dataset in self.totals:
+                self.totals[dataset] = self.done[dataset]
+
+    def _status(self, now: float) -> str:
+        total, done = sum(self.totals.values()), sum(self.done.values())
+        percent = min(done / total, 1.) * 100 if total else 100.
+
+        elapsed = now - self.started
+        rate = self.processed / elapsed if elapsed > 0 else 0.
+        remaining = f'restante ~{_duration(max(total - done, 0) / rate)}' if rate else 'restante desconhecido'
+
+        datasets = ', '.join(
+            f'{dataset} {min(self.done[dataset] / self.totals[dataset], 1.) * 100:.0f}%'
+            for dataset in sorted(self.totals) if self.totals[dataset] and self.done[dataset] < self.totals[dataset]
+        )
+        return f'Progresso: {percent:.1f}% ({done} de ~{total} linhas), {rate:.0f} linhas/s, {remaining}' + \
+            (f' [{datasets}]' if datasets else '')
+
+
+# Progresso global da importação em threads
+PROGRESS = Progress()
@@ -0,0 +1,138 @@
+# ------------------------------------------------------------------------------#
+#                                                                               |
+#     EXECUÇÃO DAS ETAPAS (DOWNLOAD, IMPORTAÇÃO, ÍNDICES) COM DEPENDÊNCIAS      |
+#                                                                               |
+# ------------------------------------------------------------------------------#
+import click
+import heapq
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import count
+from logging import getLogger
+from time import perf_counter
+from typing import Callable, Iterable, Optional, Union
+
+
+log = getLogger(__name__)
+
+
+class Task:
+    """ Etapa agendada no Scheduler """
+
+    def __init__(self, name: str, function: Callable, args: tuple, kwargs: dict,
+                 depends: tuple, weight: Union[float, Callable[[], float]]):
+        self.name = name
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.depends = depends
+        self.weight = weight
+        self.dependents = []
+        self.pending = len(depends)
+        self.error = None
+        self.done = False
+
+    def __repr__(self):
+        return f'Task({self.name!r})'
+
+
+class Scheduler:
+    """
+    Executa as etapas em um pool limitado de threads respeitando as dependências
+    entre elas (ex.: download -> importação -> índices). Entre as etapas prontas,
+    as de maior peso (ex.: tamanho dos arquivos) são executadas primeiro.
+
+    Caso alguma etapa falhe, as que dependem dela não são executadas, nenhuma
+    etapa nova é iniciada e o primeiro erro é repassado ao final do run
+    """
+
+    def __init__(self):
+        self.tasks = []
+
+    def add(self, name: str, function: Callable, *args,
+            depends: Iterable[Task] = (),
+            weight: Union[float, Callable[[], float]] = 0,
+            **kwargs) -> Task:
+        """
+        Agenda uma etapa
+        :param name: Nome utilizado nas mensagens de log
+        :param function: Função executada com args e kwargs
+        :param depends: Etapas que precisam terminar antes desta
+        :param weight: Prioridade entre as etapas prontas (maior primeiro), pode ser uma
+            função calculada apenas quando a etapa fica pronta (ex.: tamanho dos arquivos
+            que só existem após o download)
+        :return: a etapa, utilizada nas dependências das próximas
+        """
+        task = Task(name, function, args, kwargs, tuple(depends), weight)
+        for depend in task.depends:
+            depend.dependents.append(task)
+        self.tasks.append(task)
+        return task
+
+    @staticmethod
+    def _run_task(task: Task) -> float:
+        start = perf_counter()
+        task.function(*task.args, **task.kwargs)
+        return perf_counter() - start
+
+    def run(self, workers: int = 1) -> None:
+        """
+        Executa todas as etapas agendadas, aguardando o término de todas
+        :param workers: Quantidade máxima de etapas executadas ao mesmo tempo
+        """
+        order = count()
+        ready = []
+
+        def push(task: Task) -> None:
+            weight = task.weight() if callable(task.weight) else task.weight
+            heapq.heappush(ready, (-weight, next(order), task))
+
+        for task in self.tasks:
+            if not task.pending:
+                push(task)
+
+        error: Optional[BaseException] = None
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='cnpj_task') as executor:
+            while ready or running:
+                while ready and len(running) < workers and error is None:
+                    _, _, task = heapq.heappop(ready)
+                    running[executor.submit(self._run_task, task)] = task
+
+                if not running:
+                    break
+
+                # Bloqueia até alguma etapa terminar
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    task = running.pop(future)
+                    task.done = True
+
+                    try:
+                        elapsed = future.result()
+                    except Exception as e:
+                        task.error = e
+                        error = error or e
+                        msg = f'Erro na etapa {task.name}: {e}'
+                        log.exception(msg)
+                        click.echo(msg, err=True)
+                        continue
+
+                    msg = f'Etapa {task.name} finalizada em {elapsed:.1f}s'
+                    log.info(msg)
+                    click.echo(msg, nl=True)
+
+                    for dependent in task.dependents:
+                        dependent.pending -= 1
+                        if not dependent.pending:
+                            push(dependent)
+
+        if error is not None:
+            skipped = [task.name for task in self.tasks if not task.done]
+            if skipped:
+                msg = f'Etapas não executadas devido ao erro: {", ".join(skipped)}'
+                log.error(msg)
+                click.echo(msg, err=True)
+            raise error
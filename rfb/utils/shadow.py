@@ -0,0 +1,217 @@
+# ------------------------------------------------------------------------------#
+#                                                                               |
+#     RECARGA EM TABELAS SOMBRA E TROCA ATÔMICA, SEM INDISPONIBILIDADE          |
+#                                                                               |
+# ------------------------------------------------------------------------------#
+import click
+import re
+
+from datetime import datetime
+from logging import getLogger
+from threading import Lock
+from time import perf_counter
+from typing import Optional
+
+from sqlalchemy import Index, MetaData, Table, delete, inspect, insert, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from rfb import settings
+from rfb.models import Checkpoint
+from rfb.utils import checkpoint
+from rfb.utils.indexes import create_indexes
+
+
+log = getLogger(__name__)
+
+# SGBDs suportados, o SQLite não renomeia índices e tem os mesmos construídos na troca
+DIALECTS = ('postgresql', 'sqlite')
+
+
+class ShadowTables:
+    """
+    Recarga das tabelas sem afetar as consultas, em quatro etapas:
+     - create: cria uma nova geração <tabela>_v<geração> de cada tabela (UNLOGGED no PostgreSQL)
+     - populate(shadow=...): carrega as tabelas da nova geração, as tabelas atuais não são alteradas
+     - prepare: torna as tabelas LOGGED, constrói os índices e atualiza as estatísticas (ANALYZE)
+     - swap: em uma única transação renomeia as tabelas atuais para <tabela>_antiga_v<geração>
+       e as da nova geração para o nome das atuais, gravando o progresso dos arquivos
+       (checkpoints). A geração anterior é removida após o commit
+    As consultas utilizam as tabelas atuais, com os índices, até o commit da troca
+    """
+
+    def __init__(self, engine: Engine, tables: list, generation: Optional[str] = None):
+        """
+        :param engine: Engine do SQLAlchemy (PostgreSQL ou SQLite)
+        :param tables: Tabelas dos models que serão recarregadas
+        :param generation: Identificador da nova geração, caso não seja informado
+            será utilizada a data e hora atual (AAAAMMDDHHMMSS)
+        """
+        if engine.dialect.name not in DIALECTS:
+            raise ValueError('A recarga em tabelas sombra é suportada apenas no PostgreSQL e no SQLite')
+
+        self.engine = engine
+        self.generation = generation or datetime.now().strftime('%Y%m%d%H%M%S')
+        self.tables = list(tables)
+        self.indexes = True
+        self.checkpoints = []
+        self.lock = Lock()
+
+        # Cópias das tabelas com os índices dos models renomeados, os nomes são únicos no banco
+        # de dados (os nomes gerados pelo index=True na cópia utilizariam o nome da geração)
+        metadata = MetaData()
+        self.shadows = {}
+        for table in self.tables:
+            shadow = table.to_metadata(metadata, name=f'{table.name}_v{self.generation}')
+            shadow.indexes.clear()
+            for index in table.indexes:
+                Index(f'{index.name}_v{self.generation}', *[shadow.c[column.name] for column in index.columns],
+                      unique=index.unique)
+            self.shadows[table.name] = shadow
+
+    def _quote(self, name: str) -> str:
+        return self.engine.dialect.identifier_preparer.quote(name)
+
+    def table(self, table: Table) -> Table:
+        """ Retorna a tabela da nova geração que recebe os dados da tabela informada """
+        return self.shadows[table.name]
+
+    def _leftovers(self, connection: Connection, table: Table) -> list:
+        """ Tabelas de gerações anteriores que não foram removidas (ex.: recarga interrompida) """
+
+        pattern = re.compile(rf'{re.escape(table.name)}_(antiga_)?v\d{{14}}')
+        return [name for name in inspect(connection).get_table_names() if pattern.fullmatch(name)]
+
+    def create(self) -> None:
+        """
+        Remove as sobras de recargas anteriores e cria as tabelas da nova geração, sem índices.
+        No SQLite ativa o journal_mode WAL (gravado no arquivo do banco), sem o mesmo a escrita
+        da carga e a transação da troca bloqueiam as consultas
+        """
+        if self.engine.dialect.name == 'sqlite':
+            with self.engine.connect() as connection:
+                connection.exec_driver_sql('PRAGMA journal_mode = WAL')
+
+        with self.engine.begin() as connection:
+            for table in self.tables:
+                for name in self._leftovers(connection, table):
+                    log.info(f'Removendo a tabela {name} de uma recarga anterior')
+                    connection.execute(text(f'DROP TABLE {self._quote(name)}'))
+
+                ddl = str(CreateTable(self.shadows[table.name]).compile(dialect=self.engine.dialect))
+                if self.engine.dialect.name == 'postgresql':
+                    ddl = ddl.replace('CREATE TABLE', 'CREATE UNLOGGED TABLE', 1)
+                connection.execute(text(ddl))
+
+        msg = f'Recarregando {len(self.tables)} tabelas na geração v{self.generation}'
+        log.info(msg)
+        click.echo(msg, nl=True)
+
+    def finished(self, row: tuple) -> None:
+        """
+        Registra um membro importado por completo, gravado na tabela de checkpoints apenas
+        na troca das tabelas. Chamado pelas threads da importação
+        :param row: Linha da tabela de checkpoints (checkpoint.row)
+        """
+        with self.lock:
+            self.checkpoints.append(row)
+
+    def prepare(self, indexes: bool = True, workers: int = settings.INDEX_WORKERS) -> None:
+        """
+        Prepara as tabelas da nova geração para as consultas, ainda com o nome da geração
+        :param indexes: Constrói os índices declarados nos models
+        :param workers: Quantidade de índices construídos ao mesmo tempo
+        """
+        self.indexes = indexes
+        tables = list(self.shadows.values())
+
+        if self.engine.dialect.name == 'sqlite':
+            msg = 'No SQLite os índices não podem ser renomeados, então são construídos na troca das tabelas'
+            log.info(msg)
+            click.echo(msg, nl=True)
+            return
+
+        # O SET LOGGED reescreve a tabela, então é feito antes da construção dos índices
+        for shadow in tables:
+            start = perf_counter()
+            with self.engine.begin() as connection:
+                connection.execute(text(f'ALTER TABLE {self._quote(shadow.name)} SET LOGGED'))
+            log.info(f'Tabela {shadow.name} gravada no WAL em {perf_counter() - start:.1f}s')
+
+        if indexes:
+            create_indexes(self.engine, tables, workers)
+        else:
+            with self.engine.begin() as connection:
+                for shadow in tables:
+                    connection.execute(text(f'ANALYZE {self._quote(shadow.name)}'))
+
+    def _rename_indexes(self, connection: Connection, table: Table, old: str) -> None:
+        """ Libera o nome dos índices atuais e renomeia os da nova geração (PostgreSQL) """
+
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            connection.execute(text(f'ALTER INDEX IF EXISTS {self._quote(index.name)} '
+                                    f'RENAME TO {self._quote(f"{index.name}_{old}")}'))
+            if self.indexes:
+                connection.execute(text(f'ALTER INDEX {self._quote(f"{index.name}_v{self.generation}")} '
+                                        f'RENAME TO {self._quote(index.name)}'))
+
+    def _sqlite_indexes(self, connection: Connection, table: Table) -> None:
+        """ Constrói os índices com os nomes dos models e atualiza as estatísticas (SQLite) """
+
+        if self.indexes:
+            for index in sorted(table.indexes, key=lambda i: i.name):
+                connection.execute(CreateIndex(index))
+        connection.execute(text(f'ANALYZE {self._quote(table.name)}'))
+
+    def _checkpoints(self, connection: Connection) -> None:
+        """ Substitui o progresso dos arquivos importados na nova geração """
+
+        table = Checkpoint.__table__
+        files = sorted({row[0] for row in self.checkpoints})
+        if files:
+            connection.execute(delete(table).where(table.c.arquivo.in_(files)))
+            connection.execute(insert(table), [dict(zip(checkpoint.COLUMNS, row)) for row in self.checkpoints])
+
+    def swap(self) -> None:
+        """
+        Troca as tabelas atuais pelas da nova geração em uma única transação e remove a
+        geração anterior. No PostgreSQL a transação apenas renomeia as tabelas e os índices.
+        No SQLite a geração anterior é removida e todos os índices são construídos dentro da
+        própria transação (o SQLite não renomeia índices), que mantém o lock de escrita durante
+        toda a construção: com o journal_mode WAL (create) as consultas continuam na geração
+        anterior até o commit, as demais escritas aguardam
+        """
+        old = f'antiga_v{self.generation}'
+        sqlite = self.engine.dialect.name == 'sqlite'
+
+        start = perf_counter()
+        with self.engine.begin() as connection:
+            # O driver do SQLite não inicia a transação antes dos comandos DDL
+            if sqlite:
+                connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+            for table in self.tables:
+                shadow = self.shadows[table.name]
+                if sqlite:
+                    connection.execute(text(f'DROP TABLE IF EXISTS {self._quote(table.name)}'))
+                else:
+                    connection.execute(text(f'ALTER TABLE IF EXISTS {self._quote(table.name)} '
+                                            f'RENAME TO {self._quote(f"{table.name}_{old}")}'))
+                connection.execute(text(f'ALTER TABLE {self._quote(shadow.name)} RENAME TO {self._quote(table.name)}'))
+
+                if sqlite:
+                    self._sqlite_indexes(connection, table)
+                else:
+                    self._rename_indexes(connection, table, old)
+
+            self._checkpoints(connection)
+
+        msg = f'Tabelas da geração v{self.generation} em uso, troca feita em {perf_counter() - start:.1f}s'
+        log.info(msg)
+        click.echo(msg, nl=True)
+
+        if not sqlite:
+            for table in self.tables:
+                with self.engine.begin() as connection:
+                    connection.execute(text(f'DROP TABLE IF EXISTS {self._quote(f"{table.name}_{old}")}'))
+                log.info(f'Tabela {table.name}_{old} da geração anterior removida')
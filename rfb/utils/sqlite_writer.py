@@ -0,0 +1,180 @@
+# ------------------------------------------------------------------------------#
+#                                                                               |
+#        ESCRITA ÚNICA NO SQLITE ALIMENTADA PELAS THREADS DE LEITURA            |
+#                                                                               |
+# ------------------------------------------------------------------------------#
+import click
+import threading
+
+from logging import getLogger
+from queue import Queue, Full
+from typing import Callable, Optional
+from time import perf_counter
+
+from sqlalchemy import Table
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from rfb import settings
+from rfb.utils.metrics import REGISTRY
+
+
+log = getLogger(__name__)
+
+
+class SqliteWriter(threading.Thread):
+    """
+    Thread com a única conexão de escrita no SQLite. As threads de leitura
+    apenas fazem o parse dos arquivos e enviam os blocos de linhas por uma fila,
+    que são gravados com executemany em transações grandes
+    """
+
+    def __init__(self, engine: Engine,
+                 rows_per_transaction: int = settings.SQLITE_ROWS_PER_TRANSACTION,
+                 queue_size: int = settings.SQLITE_QUEUE_SIZE):
+        """
+        :param engine: Engine do SQLAlchemy apontando para o SQLite
+        :param rows_per_transaction: Quantidade de linhas por transação
+        :param queue_size: Quantidade máxima de blocos aguardando a escrita
+        """
+        super().__init__(name='cnpj_sqlite_writer', daemon=True)
+        self.engine = engine
+        self.rows_per_transaction = rows_per_transaction
+        self.queue = Queue(maxsize=queue_size)
+        self.error = None
+        self._statements = {}
+
+    def _get_statement(self, table: Table, columns: tuple) -> str:
+        """ Retorna o INSERT preparado da tabela, montado apenas uma vez """
+
+        key = (table.name, columns)
+        if key not in self._statements:
+            preparer = self.engine.dialect.identifier_preparer
+            table_name = preparer.format_table(table)
+            columns_name = ', '.join(preparer.quote(column) for column in columns)
+            values = ', '.join('?' for _ in columns)
+            self._statements[key] = f'INSERT INTO {table_name} ({columns_name}) VALUES ({values})'
+
+        return self._statements[key]
+
+    def _put(self, item) -> None:
+        """ Envia o item para a fila sem bloquear indefinidamente caso a escrita tenha falhado """
+
+        while True:
+            if self.error is not None:
+                raise RuntimeError('A escrita no SQLite foi interrompida por um erro') from self.error
+
+            try:
+                self.queue.put(item, timeout=1)
+                break
+            except Full:
+                continue
+
+    def insert(self, session: Session, table: Table, columns: tuple, rows: list) -> None:
+        """
+        Envia as linhas para a fila de escrita, mesma interface dos loaders
+        :param session: Não utilizado, a escrita é feita na conexão da thread
+        :param table: Tabela que receberá os dados
+        :param columns: Nome das colunas na ordem das tuplas
+        :param rows: Tuplas que serão inseridas
+        """
+        if not rows:
+            return
+
+        self._put(([(table, columns, rows)], None))
+
+    def insert_all(self, session: Session, inserts: list,
+                   on_written: Optional[Callable[[], None]] = None) -> None:
+        """
+        Envia os blocos de várias tabelas para serem gravados na mesma transação
+        :param session: Não utilizado, a escrita é feita na conexão da thread
+        :param inserts: Lista de tuplas (table, columns, rows)
+        :param on_written: Chamado pela thread de escrita após a gravação dos blocos,
+            mesmo em caso de erro (ex.: liberação do orçamento de memória)
+        """
+        try:
+            self._put((inserts, on_written))
+        except RuntimeError:
+            if on_written is not None:
+                on_written()
+            raise
+
+    def flush(self) -> None:
+        """ Aguarda a escrita e o commit de todos os blocos enviados até o momento """
+
+        event = threading.Event()
+        self._put(event)
+
+        while not event.wait(timeout=1):
+            if self.error is not None:
+                raise RuntimeError('A escrita no SQLite foi interrompida por um erro') from self.error
+
+    @staticmethod
+    def _commit(connection) -> None:
+        start = perf_counter()
+        connection.commit()
+        REGISTRY.observe('rfb_commit_latency_seconds', perf_counter() - start, dataset='sqlite_writer')
+
+    def run(self) -> None:
+        connection = self.engine.raw_connection()
+        cursor = connection.cursor()
+        pending = 0
+
+        try:
+            for pragma, value in settings.SQLITE_PRAGMAS.items():
+                cursor.execute(f'PRAGMA {pragma} = {value}')
+
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+
+                if isinstance(item, threading.Event):  # flush
+                    self._commit(connection)
+                    pending = 0
+                    item.set()
+                    continue
+
+                inserts, on_written = item
+                try:
+                    for table, columns, rows in inserts:
+                        if rows:
+                            start = perf_counter()
+                            cursor.executemany(self._get_statement(table, columns), rows)
+                            REGISTRY.inc('rfb_stage_seconds_total', perf_counter() - start,
+                                         stage='write', dataset='sqlite_writer')
+                            pending += len(rows)
+                finally:
+                    if on_written is not None:
+                        on_written()
+
+                if pending >= self.rows_per_transaction:
+                    self._commit(connection)
+                    pending = 0
+
+            self._commit(connection)
+        except Exception as e:
+            self.error = e
+            msg = f'Erro na escrita do SQLite: {e}'
+            log.error(msg)
+            click.echo(msg, err=True)
+            connection.rollback()
+
+            # Esvazia a fila para não bloquear as threads de leitura
+            while not self.queue.empty():
+                item = self.queue.get_nowait()
+                if isinstance(item, tuple) and item[1] is not None:
+                    item[1]()
+        finally:
+            cursor.close()
+            connection.close()
+
+    def close(self) -> None:
+        """ Aguarda a escrita de todos os blocos pendentes e finaliza a thread """
+
+        if self.error is None:
+            self.queue.put(None)
+        self.join()
+
+        if self.error is not None:
+            raise RuntimeError('A escrita no SQLite foi interrompida por um erro') from self.error
@@ -0,0 +1,151 @@
+# ------------------------------------------------------------------------------#
+#                                                                               |
+#        IMPORTAÇÃO DOS ARQUIVOS AO MESMO TEMPO EM QUE SÃO BAIXADOS             |
+#                                                                               |
+# ------------------------------------------------------------------------------#
+import click
+import threading
+
+from logging import getLogger
+from pathlib import PurePath
+from queue import Queue
+
+from rfb import settings
+from rfb.settings import URL_BASE_RFB
+from rfb.utils import NAMES_PATTERNS
+from rfb.utils import download
+from rfb.utils.convert_database import ConvertDatabase
+from rfb.utils.sqlite_writer import SqliteWriter
+from rfb.utils.zip_stream import GrowingFile
+
+
+log = getLogger(__name__)
+
+
+class StreamImport:
+    """
+    Importa cada arquivo assim que o download do mesmo começa (leitura sequencial do
+    arquivo parcial) ou termina, sem aguardar o download de todos os arquivos
+    """
+
+    def __init__(self, database_url: str, directory: str, params: list, threads: bool = True,
+                 stream: bool = True):
+        """
+        :param database_url: URL de conexão com o banco de dados
+        :param directory: Diretório onde os arquivos serão baixados
+        :param params: Parâmetros do ConvertDatabase.import_file de cada pattern_name,
+            com o model já importado
+        :param threads: Importa vários arquivos ao mesmo tempo
+        :param stream: Importa o arquivo enquanto o mesmo é baixado, caso contrário
+            apenas após o término do download
+        """
+        self.database_url = database_url
+        self.directory = directory
+        self.params = params
+        self.importers = settings.DOWNLOAD_WORKERS if threads else 1
+        self.stream = stream
+        self.queue = Queue()
+        self.streamed = set()
+        self.streams = {}  # Arquivos ainda sendo baixados
+        self.errors = []
+        self.lock = threading.Lock()
+
+    def _get_params(self, path: PurePath) -> dict:
+        """ Retorna os parâmetros do pattern_name do arquivo """
+
+        for param in self.params:
+            if path.name.startswith(NAMES_PATTERNS[param['pattern_name']]):
+                return param
+
+        raise ValueError(f'O arquivo {path} não pertence a nenhum dos dados importados')
+
+    def _on_start(self, path: str, part: str, size: int) -> None:
+        """ O download sequencial do arquivo começou, a importação já pode ser iniciada """
+
+        stream = GrowingFile(part, size, path)
+        with self.lock:
+            self.streamed.add(path)
+            self.streams[path] = stream
+        self.queue.put((path, stream))
+
+    def _on_complete(self, path: str) -> None:
+        """ O download do arquivo terminou, importa caso ainda não esteja sendo importado """
+
+        with self.lock:
+            if path in self.streamed:
+                self.streams.pop(path, None)
+                return
+        self.queue.put((path, None))
+
+    def _import(self, loader) -> None:
+        """ Importa os arquivos da fila até receber o sinal de término (None) """
+
+        convert_database = ConvertDatabase(self.database_url, self.directory, loader)
+
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            path, stream = item
+            try:
+                if self.errors:
+                    continue  # Após um erro os arquivos restantes não são importados
+
+                convert_database.import_file(PurePath(path), stream=stream, **self._get_params(PurePath(path)))
+            except Exception as e:
+                msg = f'Erro na importação do arquivo {path}: {e}'
+                log.error(msg)
+                click.echo(msg, err=True)
+                self.errors.append(e)
+            finally:
+                if stream is not None:
+                    stream.close()
+
+    def run(self, url_base: str = URL_BASE_RFB) -> None:
+        """
+        Baixa e importa os arquivos
+        :param url_base: URL da página com os arquivos, default: settings.URL_BASE_RFB
+        """
+
+        # O SQLite não suporta escritas concorrentes, então as threads apenas fazem
+        # a leitura dos arquivos e uma única thread faz a escrita no banco
+        sqlite_writer = None
+        if self.database_url.startswith('sqlite'):
+            sqlite_writer = SqliteWriter(ConvertDatabase(self.database_url, self.directory).engine)
+            sqlite_writer.start()
+
+        importers = [
+            threading.Thread(target=self._import, args=[sqlite_writer], name='cnpj_stream_import')
+            for _ in range(self.importers)
+        ]
+        for importer in importers:
+            importer.start()
+
+        try:
+            download.start_download(
+                self.directory, url_base,
+                on_start=self._on_start if self.stream else None,
+                on_complete=self._on_complete
+            )
+        except Exception as e:
+            # Interrompe a leitura dos arquivos que não terminaram de ser baixados
+            with self.lock:
+                for stream in self.streams.values():
+                    stream.abort(e)
+            raise
+        finally:
+            for _ in importers:
+                self.queue.put(None)
+            for importer in importers:
+                importer.join()
+
+            if sqlite_writer is not None:
+                sqlite_writer.close()
+
+        if self.errors:
+            raise self.errors[0]
+
+        msg = 'Finalizado o download e a importação dos arquivos'
+        log.info(msg)
+        click.echo(msg, nl=True)
@@ -0,0 +1,197 @@
+# ------------------------------------------------------------------------------#
+#                                                                               |
+#     GERADOR DE ARQUIVOS SINTÉTICOS NO MESMO LAYOUT DOS ARQUIVOS DA RFB        |
+#                                                                               |
+# ------------------------------------------------------------------------------#
+import os
+import random
+
+from datetime import date, timedelta
+from zipfile import ZIP_DEFLATED, ZipFile
+
+from rfb import settings
+from rfb.utils import NAMES_PATTERNS
+
+
+# Distribuições aproximadas dos dados reais
+UFS = {
+    'SP': 28, 'MG': 11, 'RJ': 8, 'RS': 6.5, 'PR': 6.5, 'BA': 5, 'SC': 5, 'GO': 3.5, 'PE': 3, 'CE': 3,
+    'DF': 2, 'ES': 2, 'PA': 2, 'MT': 2, 'MS': 1.5, 'MA': 1.5, 'PB': 1.5, 'RN': 1.5, 'AM': 1, 'AL': 1,
+    'PI': 1, 'SE': 0.8, 'RO': 0.8, 'TO': 0.6, 'AC': 0.3, 'AP': 0.3, 'RR': 0.3, 'EX': 0.1,
+}
+SITUACOES = {'02': 45, '08': 40, '04': 10, '01': 4, '03': 1}
+NATUREZAS = {'2135': 45, '2062': 35, '2305': 6, '3999': 4, '2240': 3, '2046': 2, '1244': 1, '2143': 1}
+PORTES = {'01': 70, '05': 20, '03': 8, '00': 2}
+QUALIFICACOES = {'49': 60, '05': 15, '22': 15, '16': 5, '10': 5}
+CNAES = [
+    '4781400', '5611201', '9602501', '4712100', '4399103', '8211300', '4930202', '4744099',
+    '5620104', '7319002', '9430800', '4520001', '4723700', '8599699', '4321500', '1412601',
+    '4789099', '7490104', '6201501', '8630504', '4110700', '4751201', '9511800', '4530703',
+]
+MOTIVOS = {'00': 55, '01': 25, '71': 10, '63': 5, '21': 5}
+TIPOS_LOGRADOURO = {'RUA': 70, 'AVENIDA': 18, 'TRAVESSA': 4, 'ESTRADA': 3, 'RODOVIA': 2, 'ALAMEDA': 2, 'PRACA': 1}
+NOMES = ['JOSÉ', 'MARIA', 'JOÃO', 'ANTÔNIO', 'FRANCISCA', 'ANA', 'LUIZ', 'PAULO', 'CARLOS', 'LÚCIA',
+         'MÁRCIO', 'SEBASTIÃO', 'CONCEIÇÃO', 'RAIMUNDO', 'FÁTIMA', 'PEDRO', 'JÚLIA', 'GABRIEL']
+SOBRENOMES = ['SILVA', 'SANTOS', 'OLIVEIRA', 'SOUZA', 'RODRIGUES', 'FERREIRA', 'ALVES', 'PEREIRA',
+              'LIMA', 'GOMES', 'COSTA', 'RIBEIRO', 'MARTINS', 'CARVALHO', 'ARAÚJO', 'CONCEIÇÃO']
+ATIVIDADES = ['COMÉRCIO', 'SERVIÇOS', 'TRANSPORTES', 'CONSTRUÇÕES', 'ALIMENTOS', 'CONFECÇÕES',
+              'TECNOLOGIA', 'REPRESENTAÇÕES', 'PAPELARIA', 'AUTO PEÇAS', 'MATERIAIS ELÉTRICOS']
+SUFIXOS = {'2135': '', '2062': ' LTDA', '2305': ' EIRELI', '3999': '', '2240': ' SS', '2046': ' S.A.',
+           '1244': '', '2143': ' COOPERATIVA'}
+BAIRROS = ['CENTRO', 'JARDIM AMÉRICA', 'VILA NOVA', 'SÃO JOSÉ', 'BELA VISTA', 'SANTA CRUZ', 'BOA VISTA',
+           'PLANALTO', 'INDUSTRIAL', 'JARDIM PAULISTA', 'CIDADE NOVA', 'SÃO FRANCISCO']
+
+# Quantidade de códigos das tabelas de domínio
+DOMAIN_ROWS = 100
+
+
+class _Random(random.Random):
+    """ random.Random com as escolhas ponderadas utilizadas pelo gerador """
+
+    def weighted(self, weights: dict) -> str:
+        return self.choices(list(weights), list(weights.values()))[0]
+
+    def maybe(self, probability: float, value: str) -> str:
+        return value if self.random() < probability else ''
+
+    def date(self, start: int = 1960, end: int = 2023) -> str:
+        day = date(start, 1, 1) + timedelta(days=self.randrange((end - start) * 365))
+        return day.strftime('%Y%m%d')
+
+    def digits(self, size: int) -> str:
+        return ''.join(self.choices('0123456789', k=size))
+
+    def name(self) -> str:
+        return f'{self.choice(NOMES)} {self.choice(SOBRENOMES)} {self.choice(SOBRENOMES)}'
+
+
+def _write(directory: str, file_name: str, lines) -> int:
+    """
+    Grava as linhas no layout da RFB ("valor";"valor") dentro de um ZIP
+    :return: quantidade de linhas gravadas
+    """
+    total = 0
+    member = f'{file_name.upper()}.CSV'
+
+    with ZipFile(os.path.join(directory, f'{file_name}.zip'), 'w', ZIP_DEFLATED) as zip_file:
+        with zip_file.open(member, 'w') as content:
+            buffer = []
+            for line in lines:
+                buffer.append('"' + '";"'.join(line) + '"\n')
+                total += 1
+
+                if len(buffer) >= 10_000:
+                    content.write(''.join(buffer).encode(settings.ENCODING))
+                    buffer = []
+
+            content.write(''.join(buffer).encode(settings.ENCODING))
+
+    return total
+
+
+def _empresas(rnd: _Random, cnpjs: range):
+    for cnpj in cnpjs:
+        natureza = rnd.weighted(NATUREZAS)
+        if natureza == '2135':
+            razao = f'{rnd.name()} {rnd.digits(11)}'
+        else:
+            razao = f'{rnd.choice(SOBRENOMES)} {rnd.choice(ATIVIDADES)}{SUFIXOS[natureza]}'
+
+        capital = f'{rnd.lognormvariate(9, 2):.2f}'.replace('.', ',')
+        yield (f'{cnpj:08d}', razao, natureza, rnd.weighted(QUALIFICACOES), capital,
+               rnd.weighted(PORTES), rnd.maybe(0.001, 'UNIÃO'))
+
+
+def _estabelecimentos(rnd: _Random, cnpjs: range, municipios: list):
+    for cnpj in cnpjs:
+        # Cerca de 10% das empresas têm filiais
+        quantity = 1 + (rnd.randrange(1, 4) if rnd.random() < 0.1 else 0)
+
+        for ordem in range(1, quantity + 1):
+            uf = rnd.weighted(UFS)
+            situacao = rnd.weighted(SITUACOES)
+            secondary = ','.join(rnd.sample(CNAES, rnd.choice([0, 0, 1, 2, 3, 5])))
+            ddd = rnd.digits(2)
+
+            yield (
+                f'{cnpj:08d}', f'{ordem:04d}', rnd.digits(2), '1' if ordem == 1 else '2',
+                rnd.maybe(0.4, f'{rnd.choice(SOBRENOMES)} {rnd.choice(ATIVIDADES)}'),
+                situacao, rnd.date(2005), rnd.weighted(MOTIVOS) if situacao != '02' else '00',
+                rnd.maybe(0.001, 'BUENOS AIRES'), rnd.maybe(0.001, '063'), rnd.date(),
+                rnd.choice(CNAES), secondary, rnd.weighted(TIPOS_LOGRADOURO),
+                f'{rnd.choice(NOMES)} {rnd.choice(SOBRENOMES)}', rnd.choice([rnd.digits(3), 'S/N']),
+                rnd.maybe(0.3, f'SALA {rnd.digits(2)}'), rnd.choice(BAIRROS), rnd.digits(8),
+                uf, rnd.choice(municipios), ddd, rnd.digits(8), rnd.maybe(0.2, ddd),
+                rnd.maybe(0.2, rnd.digits(8)), rnd.maybe(0.05, ddd), rnd.maybe(0.05, rnd.digits(8)),
+                rnd.maybe(0.5, f'contato{cnpj}@exemplo.com.br'), rnd.maybe(0.001, 'RECUPERACAO JUDICIAL'),
+                rnd.maybe(0.001, rnd.date(2015)),
+            )
+
+
+def _socios(rnd: _Random, cnpjs: range):
+    for cnpj in cnpjs:
+        for _ in range(rnd.choice([0, 1, 1, 1, 2, 2, 3])):
+            identificador = rnd.choices(['2', '1', '3'], [90, 8, 2])[0]
+            if identificador == '1':
+                nome, documento = f'{rnd.choice(SOBRENOMES)} PARTICIPACOES LTDA', rnd.digits(14)
+            else:
+                nome, documento = rnd.name(), f'***{rnd.digits(6)}**' if identificador == '2' else ''
+
+            yield (
+                f'{cnpj:08d}', identificador, nome, documento, rnd.weighted(QUALIFICACOES), rnd.date(1980),
+                '105' if identificador == '3' else '', '***000000**', rnd.maybe(0.02, rnd.name()),
+                '00', str(rnd.randrange(1, 10)),
+            )
+
+
+def _simples(rnd: _Random, cnpjs: range):
+    for cnpj in cnpjs:
+        if rnd.random() < 0.6:
+            mei = rnd.random() < 0.4
+            yield (
+                f'{cnpj:08d}', 'S', rnd.date(2007), rnd.maybe(0.3, rnd.date(2010)),
+                'S' if mei else 'N', rnd.date(2009) if mei else '', rnd.maybe(0.2, rnd.date(2012)) if mei else '',
+            )
+
+
+def generate(directory: str, rows: int = 100_000, files: int = 2, seed: int = 0) -> dict:
+    """
+    Gera arquivos ZIP sintéticos com o mesmo layout e nomes dos arquivos da RFB
+    :param directory: Diretório onde os arquivos serão gravados
+    :param rows: Quantidade de empresas, os demais arquivos são proporcionais
+        (~1,1 estabelecimento, ~1,3 sócio e ~0,6 opção pelo simples por empresa)
+    :param files: Quantidade de arquivos de empresas, estabelecimentos e sócios
+    :param seed: Semente do gerador, a mesma semente gera os mesmos arquivos
+    :return: dict com o nome do arquivo e a quantidade de linhas
+    """
+    os.makedirs(directory, exist_ok=True)
+    rnd = _Random(seed)
+    result = {}
+
+    codes = [f'{code:04d}' for code in range(1, DOMAIN_ROWS + 1)]
+    domains = {
+        'cnae': [(cnae, f'ATIVIDADE {cnae}') for cnae in CNAES],
+        'motivo_cadastral': [(code, f'MOTIVO {code}') for code in MOTIVOS],
+        'municipio': [(code, f'MUNICÍPIO {code}') for code in codes],
+        'natureza': [(code, f'NATUREZA {code}') for code in NATUREZAS],
+        'pais': [(f'{code:03d}', f'PAÍS {code}') for code in range(1, DOMAIN_ROWS + 1)],
+        'qualificacao': [(code, f'QUALIFICAÇÃO {code}') for code in QUALIFICACOES],
+    }
+    for pattern_name, lines in domains.items():
+        result[NAMES_PATTERNS[pattern_name]] = _write(directory, NAMES_PATTERNS[pattern_name], lines)
+
+    size = -(-rows // files)
+    for i, start in enumerate(range(0, rows, size)):
+        cnpjs = range(start, min(start + size, rows))
+        for pattern_name, lines in (
+            ('empresa', _empresas(rnd, cnpjs)),
+            ('estabelecimento', _estabelecimentos(rnd, cnpjs, codes)),
+            ('socio', _socios(rnd, cnpjs)),
+        ):
+            file_name = f'{NAMES_PATTERNS[pattern_name]}{i}'
+            result[file_name] = _write(directory, file_name, lines)
+
+    result[NAMES_PATTERNS['dado_simples']] = _write(directory, NAMES_PATTERNS['dado_simples'],
+                                                    _simples(rnd, range(rows)))
+
+    return result
@@ -0,0 +1,153 @@
+# ------------------------------------------------------------------------------#
+#                                                                               |
+#        LEITURA DAS COLUNAS DOS CSVs DA RFB ("valor";"valor") EM BLOCOS        |
+#                                                                               |
+# ------------------------------------------------------------------------------#
+import re
+import codecs
+
+from functools import partial
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Optional, Union
+
+from rfb import settings
+
+
+# Um campo entre aspas, onde as aspas que não são seguidas pelo separador ou pelo final
+# da linha fazem parte do valor, ou um campo sem aspas. Seguido pelo separador ou pelo
+# final da linha. A RFB não escapa as aspas, então as aspas duplicadas ("") são mantidas
+# como estão, assim como na separação simples (ex.: "NOME "X"" é NOME "X")
+FIELD = re.compile(r'"((?:[^"]|"(?!;|\Z))*)"(;|\Z)|([^;"]*)(;|\Z)')
+
+
+def iter_text(source: Union[Iterable[bytes], object]) -> Iterator[str]:
+    """
+    Decodifica o conteúdo em blocos grandes, sem decodificar linha a linha
+    :param source: Arquivo aberto (com o método read) ou blocos de bytes
+        (ex.: zip_stream.iter_members durante o download)
+    :return: blocos de texto, sem os caracteres NUL
+    """
+    if hasattr(source, 'read'):
+        source = iter(partial(source.read, settings.TOKENIZER_BLOCK_SIZE), b'')
+
+    decoder = codecs.getincrementaldecoder(settings.ENCODING)(errors='replace')
+    for block in source:
+        text = decoder.decode(block)
+        if '\0' in text:
+            text = text.replace('\0', '')
+        if text:
+            yield text
+
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+
+def iter_lines(texts: Iterable[str]) -> Iterator[str]:
+    """ Separa os blocos de texto em linhas, sem o \\n """
+    rest = ''
+
+    for text in texts:
+        lines = (rest + text).split('\n')
+        rest = lines.pop()
+        yield from lines
+
+    if rest:
+        yield rest
+
+
+def split_quoted(record: str) -> Optional[list]:
+    """
+    Separa as colunas de um registro respeitando as aspas, utilizado apenas nos
+    registros em que a separação simples não encontrou a quantidade de colunas
+    :param record: Registro completo, podendo conter quebras de linha dentro dos campos
+    :return: colunas do registro ou None caso o registro esteja incompleto
+        (ex.: o campo continua na próxima linha)
+    """
+    row = []
+    position = 0
+
+    while True:
+        match = FIELD.match(record, position)
+        if match is None:
+            return None
+
+        quoted, separator, plain, plain_separator = match.groups()
+        if quoted is not None:
+            row.append(quoted)
+        else:
+            row.append(plain)
+            separator = plain_separator
+
+        position = match.end()
+        if not separator:
+            return row if position == len(record) else None
+
+
+def _split_record(line: str, lines: Iterator[str], columns: int) -> list:
+    """
+    Separa um registro que não tem a quantidade de colunas esperada na separação
+    simples: campos com aspas, com o separador escapado ou com quebras de linha
+    :param line: Primeira linha do registro
+    :param lines: Próximas linhas do arquivo, consumidas caso o registro continue
+    :param columns: Quantidade de colunas esperada
+    :return: colunas do registro, caso não seja possível separar retorna a separação
+        simples para que o erro de integridade seja informado na leitura
+    """
+    record = line
+
+    for _ in range(settings.TOKENIZER_MAX_LINES):
+        row = record[1:-1].split('";"')
+        if len(row) == columns:
+            return row
+
+        row = split_quoted(record)
+        if row is not None and len(row) == columns:
+            return row
+
+        # O registro continua na próxima linha (quebra de linha dentro de um campo)
+        if row is None or len(row) < columns:
+            following = next(lines, None)
+            if following is None:
+                break
+            record = f'{record}\n{following.rstrip()}'
+            continue
+
+        break
+
+    return line[1:-1].split('";"')
+
+
+def tokenize(source, skip: int = 0, columns: Optional[int] = None,
+             on_quoted: Optional[Callable[[], None]] = None) -> Iterator[list]:
+    """
+    Retorna as colunas de cada registro de um CSV da RFB. O conteúdo é lido e
+    decodificado em blocos e cada linha é separada por '";"', apenas os registros que
+    não têm a quantidade de colunas esperada passam pela separação com aspas
+    :param source: Arquivo aberto (com o método read) ou blocos de bytes
+    :param skip: Quantidade de registros iniciais que serão descartados
+    :param columns: Quantidade de colunas esperada, caso não seja informada é
+        utilizada apenas a separação simples
+    :param on_quoted: Chamado a cada registro (após os descartados) separado pela
+        separação com aspas, ex.: contagem nas métricas
+    :return: lista na qual cada elemento representa uma coluna do registro
+    """
+    lines = iter_lines(iter_text(source))
+
+    def records():
+        position = 0
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+
+            row = line[1:-1].split('";"')
+            if columns is not None and len(row) != columns:
+                row = _split_record(line, lines, columns)
+                if on_quoted is not None and position >= skip and len(row) == columns:
+                    on_quoted()
+
+            position += 1
+            yield row
+
+    return islice(records(), skip, None)
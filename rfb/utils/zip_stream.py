@@ -0,0 +1,204 @@
+# ------------------------------------------------------------------------------#
+#                                                                               |
+#     LEITURA SEQUENCIAL DE ZIP ENQUANTO O ARQUIVO AINDA ESTÁ SENDO BAIXADO     |
+#                                                                               |
+# ------------------------------------------------------------------------------#
+import os
+import struct
+import threading
+import zlib
+
+from typing import Iterator, Optional
+from zipfile import BadZipFile
+
+
+LOCAL_HEADER = struct.Struct('<4s5HL2L2H')
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+DATA_DESCRIPTOR_SIGNATURE = b'PK\x07\x08'
+ZIP64_EXTRA_ID = 0x0001
+
+# Tamanho dos blocos lidos do arquivo/descompactados
+BLOCK_SIZE = 1024 * 1024
+
+
+class GrowingFile:
+    """
+    Arquivo somente leitura que ainda está sendo escrito pelo download, a leitura
+    aguarda a chegada dos bytes até completar o tamanho esperado do arquivo
+    """
+
+    def __init__(self, path: str, size: int, final_path: Optional[str] = None, poll: float = 0.2):
+        """
+        :param path: Caminho do arquivo parcial (.part) do download
+        :param size: Tamanho final do arquivo
+        :param final_path: Caminho do arquivo após o término do download, utilizado
+            caso o arquivo parcial já tenha sido renomeado
+        :param poll: Intervalo (segundos) entre as verificações de novos bytes
+        """
+        self.path = path
+        self.final_path = final_path
+        self.size = size
+        self.poll = poll
+        self.position = 0
+        self.error = None
+        self._arrived = threading.Event()
+        self._file = None
+
+    def abort(self, error: Exception) -> None:
+        """ Interrompe a leitura, o download do arquivo falhou """
+        self.error = error
+        self._arrived.set()
+
+    def _open(self):
+        """ Abre o arquivo parcial ou, se o download já terminou, o arquivo final """
+
+        for path in (self.path, self.final_path):
+            if path is None:
+                continue
+            try:
+                return open(path, 'rb')
+            except FileNotFoundError:
+                continue
+
+        return None
+
+    def _wait(self, position: int) -> None:
+        """ Aguarda até que o arquivo tenha ao menos position bytes """
+
+        while True:
+            if self.error is not None:
+                raise BadZipFile(f'O download do arquivo {self.path} falhou') from self.error
+
+            if self._file is None:
+                self._file = self._open()
+
+            if self._file is not None and os.fstat(self._file.fileno()).st_size >= position:
+                return
+
+            self._arrived.wait(self.poll)
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            size = self.size - self.position
+
+        end = min(self.position + size, self.size)
+        self._wait(end)
+
+        self._file.seek(self.position)
+        data = self._file.read(end - self.position)
+        self.position += len(data)
+        return data
+
+    def peek(self, size: int) -> bytes:
+        """ Retorna os próximos bytes sem avançar a posição de leitura """
+        position = self.position
+        data = self.read(size)
+        self.position = position
+        return data
+
+    def read_exactly(self, size: int) -> bytes:
+        data = self.read(size)
+        if len(data) != size:
+            raise BadZipFile(f'Fim inesperado do arquivo {self.path}')
+        return data
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+
+def _iter_deflate(file: GrowingFile, remaining: Optional[int], crc: int, name: str):
+    """
+    Descompacta o conteúdo de um membro, retornando os blocos descompactados e
+    devolvendo para o arquivo os bytes lidos além do final do membro
+    """
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    checksum = 0
+
+    while not decompressor.eof:
+        size = BLOCK_SIZE if remaining is None else min(BLOCK_SIZE, remaining)
+        data = file.read(size)
+        if not data:
+            raise BadZipFile(f'Fim inesperado do membro {name} em {file.path}')
+
+        if remaining is not None:
+            remaining -= len(data)
+
+        block = decompressor.decompress(data)
+        if block:
+            checksum = zlib.crc32(block, checksum)
+            yield block
+
+    # Volta a posição para o início dos bytes que não pertencem a este membro
+    file.position -= len(decompressor.unused_data)
+
+    if crc is not None and checksum != crc:
+        raise BadZipFile(f'CRC inválido no membro {name} em {file.path}')
+
+
+def _iter_stored(file: GrowingFile, remaining: int, crc: int, name: str):
+    """ Retorna os blocos de um membro sem compressão """
+    checksum = 0
+
+    while remaining:
+        block = file.read_exactly(min(BLOCK_SIZE, remaining))
+        remaining -= len(block)
+        checksum = zlib.crc32(block, checksum)
+        yield block
+
+    if checksum != crc:
+        raise BadZipFile(f'CRC inválido no membro {name} em {file.path}')
+
+
+def iter_members(file: GrowingFile) -> Iterator[tuple]:
+    """
+    Percorre os membros do ZIP a partir dos cabeçalhos locais, sem depender do
+    diretório central que fica no final do arquivo
+    :param file: Arquivo que está sendo baixado
+    :return: tuplas (nome do membro, iterador dos blocos descompactados do membro),
+        as linhas são separadas pelo utils.tokenizer
+    """
+    while file.position < file.size:
+        signature = file.read_exactly(4)
+        file.position -= 4
+        if signature != LOCAL_HEADER_SIGNATURE:
+            break  # Início do diretório central
+
+        (_, _, flags, method, _, _, crc, compressed_size, size,
+         name_length, extra_length) = LOCAL_HEADER.unpack(file.read_exactly(LOCAL_HEADER.size))
+        name = file.read_exactly(name_length).decode('utf-8' if flags & 0x800 else 'cp437')
+        extra = file.read_exactly(extra_length)
+
+        # Extensão ZIP64 com os tamanhos de 8 bytes
+        zip64 = False
+        while len(extra) >= 4:
+            extra_id, length = struct.unpack('<2H', extra[:4])
+            if extra_id == ZIP64_EXTRA_ID:
+                zip64 = True
+                values = extra[4:4 + length]
+                if size == 0xFFFFFFFF and len(values) >= 8:
+                    size, values = struct.unpack('<Q', values[:8])[0], values[8:]
+                if compressed_size == 0xFFFFFFFF and len(values) >= 8:
+                    compressed_size = struct.unpack('<Q', values[:8])[0]
+            extra = extra[4 + length:]
+
+        has_descriptor = bool(flags & 0x08)
+        if method == 8:
+            blocks = _iter_deflate(file, None if has_descriptor else compressed_size,
+                                   None if has_descriptor else crc, name)
+        elif method == 0 and not has_descriptor:
+            blocks = _iter_stored(file, compressed_size, crc, name)
+        else:
+            raise BadZipFile(f'Método de compressão {method} não suportado na leitura durante o download')
+
+        yield name, blocks
+
+        # Garante que o membro foi lido por completo antes de seguir para o próximo
+        for _ in blocks:
+            pass
+
+        if has_descriptor:
+            descriptor = file.read_exactly(4)
+            if descriptor != DATA_DESCRIPTOR_SIGNATURE:
+                file.position -= 4
+            file.read_exactly(20 if zip64 else 12)
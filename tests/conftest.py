@@ -0,0 +1,11 @@
+import pytest
+
+from rfb.utils.synthetic import generate
+
+
+@pytest.fixture(scope='session')
+def synthetic_directory(tmp_path_factory):
+    """ Arquivos sintéticos (rfb.utils.synthetic) com 200 empresas, compartilhados entre os testes """
+    directory = tmp_path_factory.mktemp('sintetico')
+    generate(str(directory), 200, 1)
+    return directory
@@ -0,0 +1,16 @@
+from rfb import settings
+from rfb.utils.buffer import MemoryBudget, estimate_size, max_rows
+
+
+def test_max_rows_keeps_two_chunks_in_the_budget():
+    budget = MemoryBudget(settings.BUFFER_MEMORY_BUDGET)
+
+    rows = max_rows(30, budget)
+
+    assert 2 * estimate_size(rows, 30) <= budget.limit
+    assert 2 * estimate_size(rows + 1, 30) > budget.limit
+    assert rows < settings.BATCH_MAX_ROWS
+
+
+def test_max_rows_with_a_budget_smaller_than_a_row():
+    assert max_rows(30, MemoryBudget(1)) == 1
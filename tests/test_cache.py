@@ -0,0 +1,60 @@
+import pytest
+
+from rfb.utils import cache
+from rfb.utils.cache import MISSING, TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.]
+    monkeypatch.setattr(cache, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_values_expire_after_the_ttl(clock):
+    ttl_cache = TTLCache(maxsize=10, ttl=60)
+    ttl_cache.set('a', 1)
+    ttl_cache.set('b', None)
+
+    clock[0] += 59
+    assert ttl_cache.get('a') == 1
+    # O None também é guardado (ex.: CNPJ inexistente)
+    assert ttl_cache.get('b') is None
+
+    clock[0] += 2
+    assert ttl_cache.get('a') is MISSING
+    assert len(ttl_cache) == 1
+    assert (ttl_cache.hits, ttl_cache.misses) == (2, 1)
+
+
+def test_discards_the_least_recently_used_keys(clock):
+    ttl_cache = TTLCache(maxsize=2, ttl=60)
+    ttl_cache.set('a', 1)
+    ttl_cache.set('b', 2)
+    assert ttl_cache.get('a') == 1
+
+    ttl_cache.set('c', 3)
+
+    assert ttl_cache.get('b') is MISSING
+    assert ttl_cache.get('a') == 1
+    assert ttl_cache.get('c') == 3
+
+
+def test_maxsize_zero_disables_the_cache(clock):
+    ttl_cache = TTLCache(maxsize=0, ttl=60)
+    ttl_cache.set('a', 1)
+
+    assert ttl_cache.get('a') is MISSING
+    assert len(ttl_cache) == 0
+
+
+def test_delete_and_clear(clock):
+    ttl_cache = TTLCache(maxsize=10, ttl=60)
+    for key in 'abc':
+        ttl_cache.set(key, key)
+
+    ttl_cache.delete(['a', 'x'])
+    assert ttl_cache.get('a') is MISSING and ttl_cache.get('b') == 'b'
+
+    ttl_cache.clear()
+    assert len(ttl_cache) == 0
@@ -0,0 +1,74 @@
+from pathlib import Path
+from zipfile import ZIP_DEFLATED, ZipFile
+
+import pytest
+
+from sqlalchemy import func, select
+
+from rfb import settings
+from rfb.models import Empresa
+from rfb.utils import checkpoint
+from rfb.utils.convert_database import ConvertDatabase
+from rfb.utils.loader import ExecutemanyLoader, Loader
+
+ROWS = 250
+CHUNK = 100
+
+
+class CrashingLoader(ExecutemanyLoader):
+    """ Interrompe a importação antes da gravação do bloco informado """
+
+    def __init__(self, crash_at: int):
+        super().__init__()
+        self.crash_at = crash_at
+        self.calls = 0
+
+    def insert_all(self, session, inserts):
+        self.calls += 1
+        if self.calls == self.crash_at:
+            raise RuntimeError('Importação interrompida')
+        super().insert_all(session, inserts)
+
+
+def _write_empresas(path: Path) -> None:
+    with ZipFile(path, 'w', ZIP_DEFLATED) as zip_file:
+        for member in range(2):
+            lines = (f'"{member}{cnpj:07d}";"EMPRESA";"2062";"49";"1000,00";"01";""\n' for cnpj in range(ROWS))
+            zip_file.writestr(f'EMPRESAS{member}.CSV', ''.join(lines).encode(settings.ENCODING))
+
+
+def test_loader_is_abstract():
+    with pytest.raises(TypeError):
+        Loader()
+
+
+def test_resumes_from_the_last_committed_chunk(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(settings, 'BATCH_ADAPTIVE', False)
+    directory = tmp_path / 'dados'
+    directory.mkdir()
+    file = directory / 'Empresas0.zip'
+    _write_empresas(file)
+    database_url = f'sqlite:///{tmp_path / "db.sqlite3"}'
+    ConvertDatabase(database_url, str(directory)).create_tables()
+
+    # Três blocos no primeiro membro (100, 100 e 50 linhas), a falha é no segundo bloco do segundo membro
+    crashed = ConvertDatabase(database_url, str(directory), CrashingLoader(crash_at=5))
+    with pytest.raises(RuntimeError):
+        crashed.populate('empresa', 7, Empresa, chunk_size=CHUNK)
+    crashed.session.close()
+
+    resumed = ConvertDatabase(database_url, str(directory))
+    progress = checkpoint.load(resumed.session, file, checkpoint.file_hash(file))
+    assert progress == {'EMPRESAS0.CSV': (ROWS, True), 'EMPRESAS1.CSV': (CHUNK, False)}
+    capsys.readouterr()
+
+    resumed.populate('empresa', 7, Empresa, chunk_size=CHUNK)
+
+    output = capsys.readouterr().out
+    assert f'Retomando o CSV EMPRESAS1.CSV do arquivo {file} a partir da linha {CHUNK + 1}' in output
+    assert 'Retomando o CSV EMPRESAS0.CSV' not in output
+
+    total, distinct = resumed.session.execute(select(func.count(), func.count(Empresa.cnpj.distinct()))).one()
+    assert total == distinct == 2 * ROWS
+    assert checkpoint.is_finished(file, checkpoint.load(resumed.session, file, checkpoint.file_hash(file)))
+    resumed.session.close()
@@ -0,0 +1,88 @@
+import json
+from functools import partial
+
+import pytest
+
+from rfb import cnpj_index, settings
+from rfb.cnpj_index import CnpjIndex, _write_run, build
+from rfb.utils import convert_database
+from rfb.utils.convert_database import ConvertDatabase, list_files, read_chunks
+
+
+def _rows(directory, pattern_name: str, qt_column: int) -> list:
+    """ Linhas do dataset com o mesmo parse do índice, as datas no formato ISO """
+    parse_function = getattr(ConvertDatabase, f'parse_{pattern_name}')
+    rows = []
+    for file in list_files(directory, pattern_name):
+        for chunk in read_chunks(file, pattern_name, qt_column, parse_function):
+            rows.extend(json.loads(json.dumps(row, default=cnpj_index._json_default)) for row in chunk.rows)
+    return [dict(zip(parse_function.columns, row)) for row in rows]
+
+
+@pytest.fixture(scope='module')
+def index_path(synthetic_directory, tmp_path_factory):
+    path = tmp_path_factory.mktemp('indice') / 'cnpj.idx'
+    build(str(synthetic_directory), str(path))
+    return path
+
+
+def test_lookup_existing_and_missing_cnpj(synthetic_directory, index_path):
+    estabelecimento = _rows(synthetic_directory, 'estabelecimento', 30)[0]
+    empresa = {row['cnpj']: row for row in _rows(synthetic_directory, 'empresa', 7)}[estabelecimento['cnpj']]
+    cnpj = estabelecimento['cnpj'] + estabelecimento['cnpj_ordem'] + estabelecimento['cnpj_dv']
+
+    with CnpjIndex(str(index_path)) as index:
+        found = index.lookup(f'{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}')
+
+        assert found['estabelecimento'] == estabelecimento
+        assert found['empresa'] == empresa
+        assert index.lookup('00000000000000') is None
+        assert index.lookup('99999999999999') is None
+        with pytest.raises(ValueError, match='CNPJ inválido'):
+            index.lookup('12345678')
+
+
+def test_refresh_after_a_rebuild(synthetic_directory, tmp_path):
+    path = tmp_path / 'cnpj.idx'
+    build(str(synthetic_directory), str(path))
+
+    with CnpjIndex(str(path)) as index:
+        metadata = index.metadata
+        assert index.refresh() is False
+
+        build(str(synthetic_directory), str(path))
+
+        assert index.refresh() is True
+        assert index.refresh() is False
+        assert index.metadata == metadata
+        estabelecimento = _rows(synthetic_directory, 'estabelecimento', 30)[-1]
+        cnpj = estabelecimento['cnpj'] + estabelecimento['cnpj_ordem'] + estabelecimento['cnpj_dv']
+        assert index.lookup(cnpj)['estabelecimento'] == estabelecimento
+
+    assert not (tmp_path / 'cnpj.idx.tmp').exists()
+
+
+def test_merge_of_several_runs(synthetic_directory, index_path, tmp_path, monkeypatch):
+    # Blocos pequenos para que cada seção seja gravada em vários arquivos temporários
+    monkeypatch.setattr(settings, 'CNPJ_INDEX_RUN_SIZE', 7)
+    monkeypatch.setattr(convert_database, 'read_chunks', partial(read_chunks, chunk_size=10))
+    runs = []
+
+    def write_run(entries, directory):
+        runs.append(len(entries))
+        return _write_run(entries, directory)
+
+    monkeypatch.setattr(cnpj_index, '_write_run', write_run)
+    path = tmp_path / 'cnpj.idx'
+
+    metadata = build(str(synthetic_directory), str(path))
+
+    assert len(runs) > len(cnpj_index.SECTIONS)
+    assert sum(runs) == sum(info['count'] for info in metadata['secoes'].values())
+    # A intercalação dos blocos resulta no mesmo índice do build com um único bloco por seção
+    assert path.read_bytes() == index_path.read_bytes()
+
+    with CnpjIndex(str(path)) as index:
+        for estabelecimento in _rows(synthetic_directory, 'estabelecimento', 30):
+            cnpj = estabelecimento['cnpj'] + estabelecimento['cnpj_ordem'] + estabelecimento['cnpj_dv']
+            assert index.lookup(cnpj)['estabelecimento'] == estabelecimento
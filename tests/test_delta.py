@@ -0,0 +1,82 @@
+from pathlib import Path
+from zipfile import ZIP_DEFLATED, ZipFile
+
+import pytest
+
+from sqlalchemy import select
+
+from rfb import settings
+from rfb.models import Empresa, Estabelecimento, Socio
+from rfb.utils.convert_database import ConvertDatabase
+from rfb.utils.delta import DeltaTables
+
+
+def _write(directory: Path, name: str, rows: list) -> None:
+    lines = ''.join(';'.join(f'"{value}"' for value in row) + '\n' for row in rows)
+    with ZipFile(directory / f'{name}0.zip', 'w', ZIP_DEFLATED) as zip_file:
+        zip_file.writestr(f'{name.upper()}0.CSV', lines.encode(settings.ENCODING))
+
+
+def _empresa(cnpj: str, razao_social: str) -> tuple:
+    return cnpj, razao_social, '2062', '49', '1000,00', '01', ''
+
+
+def _socio(cnpj: str, nome: str) -> tuple:
+    return cnpj, '2', nome, '***123456**', '49', '20200101', '', '', '', '0', '4'
+
+
+@pytest.fixture
+def database(tmp_path):
+    directory = tmp_path / 'dados'
+    directory.mkdir()
+    convert_database = ConvertDatabase(f'sqlite:///{tmp_path / "db.sqlite3"}', str(directory))
+    convert_database.create_tables()
+    yield convert_database, directory
+    convert_database.session.close()
+    convert_database.engine.dispose()
+
+
+def _populate(convert_database: ConvertDatabase, pattern_name: str, columns: int, model, name) -> list:
+    convert_database.populate(pattern_name, columns, model, delta=True)
+    query = select(model.cnpj, name).order_by(model.cnpj, name)
+    return [tuple(row) for row in convert_database.session.execute(query)]
+
+
+def test_applies_inserts_updates_and_deletes(database, capsys):
+    convert_database, directory = database
+
+    _write(directory, 'Empresas', [_empresa('00000001', 'A'), _empresa('00000002', 'B'), _empresa('00000003', 'C')])
+    first = _populate(convert_database, 'empresa', 7, Empresa, Empresa.razao)
+    assert first == [('00000001', 'A'), ('00000002', 'B'), ('00000003', 'C')]
+
+    _write(directory, 'Empresas', [_empresa('00000001', 'A'), _empresa('00000002', 'B2'), _empresa('00000004', 'D')])
+    second = _populate(convert_database, 'empresa', 7, Empresa, Empresa.razao)
+
+    assert second == [('00000001', 'A'), ('00000002', 'B2'), ('00000004', 'D')]
+    assert '1 incluídos, 1 alterados e 1 excluídos' in capsys.readouterr().out
+
+    # Sem alterações, nada é aplicado
+    assert _populate(convert_database, 'empresa', 7, Empresa, Empresa.razao) == second
+    assert '0 incluídos, 0 alterados e 0 excluídos' in capsys.readouterr().out
+
+
+def test_removing_one_of_two_identical_rows(database, capsys):
+    convert_database, directory = database
+
+    _write(directory, 'Socios', [_socio('00000001', 'JOSE'), _socio('00000001', 'JOSE'), _socio('00000002', 'ANA')])
+    assert len(_populate(convert_database, 'socio', 11, Socio, Socio.nome)) == 3
+
+    _write(directory, 'Socios', [_socio('00000001', 'JOSE'), _socio('00000002', 'ANA')])
+    rows = _populate(convert_database, 'socio', 11, Socio, Socio.nome)
+
+    assert rows == [('00000001', 'JOSE'), ('00000002', 'ANA')]
+    assert '0 incluídos, 1 alterados e 0 excluídos' in capsys.readouterr().out
+
+
+def test_key_tables_have_one_index_with_the_whole_key():
+    delta_tables = DeltaTables(Estabelecimento.__table__, ConvertDatabase.parse_estabelecimento.columns)
+
+    for table in (delta_tables.hashes, delta_tables.changed):
+        assert [[column.name for column in index.columns] for index in table.indexes] == [
+            ['cnpj', 'cnpj_ordem', 'cnpj_dv']
+        ]
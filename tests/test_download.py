@@ -0,0 +1,231 @@
+import io
+import os
+import random
+import re
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from zipfile import ZIP_STORED, ZipFile
+
+import pytest
+
+from rfb import settings
+from rfb.utils import download
+
+
+def _payload(size: int = 256 * 1024) -> bytes:
+    buffer = io.BytesIO()
+    with ZipFile(buffer, 'w', ZIP_STORED) as zip_file:
+        zip_file.writestr('EMPRESAS0.CSV', random.Random(0).randbytes(size))
+    return buffer.getvalue()
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Servidor de teste no lugar da RFB. Configurado pelos atributos do servidor:
+     - ranges: aceita o header Range (206), caso contrário sempre envia o arquivo inteiro (200)
+     - drops: quantidade de respostas cortadas no meio do corpo
+     - known_size: envia o Content-Length e o tamanho no Content-Range
+     - range_limit: quantidade de requisições em que o Range é aceito, None em todas
+     - errors: status HTTP de erro enviados, um por requisição, antes das respostas normais
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        payload = server.payload
+        requested = self.headers.get('Range')
+        with server.lock:
+            server.requests.append(requested)
+            ranges = server.ranges and (server.range_limit is None or len(server.requests) <= server.range_limit)
+            error = server.errors.pop(0) if server.errors else None
+
+        if error:
+            self.send_error(error)
+            return
+
+        start, end = 0, len(payload) - 1
+        if requested and ranges:
+            first, last = re.fullmatch(r'bytes=(\d+)-(\d*)', requested).groups()
+            start, end = int(first), int(last) if last else len(payload) - 1
+            if start >= len(payload):
+                self.send_response(416)
+                if server.known_size:
+                    self.send_header('Content-Range', f'bytes */{len(payload)}')
+                self.end_headers()
+                return
+
+        body = payload[start:end + 1]
+        total = len(payload) if server.known_size else '*'
+        self.send_response(206 if requested and ranges else 200)
+        if requested and ranges:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{total}')
+        # Sem o tamanho do arquivo, apenas um intervalo com o último byte tem o tamanho da resposta
+        if server.known_size or requested and ranges and not requested.endswith('-'):
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        with server.lock:
+            drop = len(body) > 1 and server.drops > 0
+            if drop:
+                server.drops -= 1
+
+        if drop:
+            # Conexão encerrada no meio da transferência
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(settings, 'DOWNLOAD_BACKOFF', 0)
+    monkeypatch.setattr(download, 'MAX_RETRY_DOWNLOAD', 5)
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.payload = _payload()
+    httpd.requests = []
+    httpd.ranges = True
+    httpd.drops = 0
+    httpd.known_size = True
+    httpd.range_limit = None
+    httpd.errors = []
+    httpd.lock = threading.Lock()
+
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _url(server) -> str:
+    return f'http://127.0.0.1:{server.server_address[1]}/Empresas0.zip'
+
+
+def _read(path: str) -> bytes:
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+def test_resumes_with_range_after_dropped_connections(server, tmp_path):
+    server.drops = 2
+
+    path = download._download(_url(server), str(tmp_path))
+
+    assert _read(path) == server.payload
+    # Após cada queda o download continua a partir do último byte recebido
+    resumed = [int(r.split('=')[1].split('-')[0]) for r in server.requests[1:] if r]
+    assert len(resumed) == 3 and resumed[0] == 0 and 0 < resumed[1] < resumed[2] < len(server.payload)
+    assert os.listdir(tmp_path) == ['Empresas0.zip']
+
+
+def test_restarts_when_the_server_ignores_range(server, tmp_path):
+    server.ranges = False
+    server.drops = 1
+
+    path = download._download(_url(server), str(tmp_path))
+
+    assert _read(path) == server.payload
+    assert os.listdir(tmp_path) == ['Empresas0.zip']
+
+
+def test_merges_segments_downloaded_in_parallel(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'DOWNLOAD_SEGMENT_MIN_SIZE', 1024)
+    monkeypatch.setattr(settings, 'DOWNLOAD_SEGMENTS', 4)
+    server.drops = 3
+
+    path = download._download(_url(server), str(tmp_path))
+
+    assert os.path.getsize(path) == len(server.payload)
+    assert _read(path) == server.payload
+    assert os.listdir(tmp_path) == ['Empresas0.zip']
+
+
+def test_unknown_size_with_complete_part_file(server, tmp_path):
+    server.known_size = False
+    part = tmp_path / 'Empresas0.zip.part'
+    part.write_bytes(server.payload)
+
+    path = download._download(_url(server), str(tmp_path))
+
+    assert _read(path) == server.payload
+    # Consulta do tamanho e um único pedido a partir do final do arquivo parcial (416)
+    assert len(server.requests) == 2
+
+
+def test_unknown_size_resumes_from_part_file(server, tmp_path):
+    server.known_size = False
+    part = tmp_path / 'Empresas0.zip.part'
+    part.write_bytes(server.payload[:1000])
+
+    path = download._download(_url(server), str(tmp_path))
+
+    assert _read(path) == server.payload
+    assert server.requests[1] == 'bytes=1000-'
+
+
+def test_streamed_file_is_not_rewritten_when_the_server_stops_honouring_range(server, tmp_path):
+    # Consulta do tamanho e a primeira parte com o Range, cortada no meio, e uma nova tentativa sem o Range
+    server.range_limit = 2
+    server.drops = 1
+    started = []
+
+    with pytest.raises(Exception, match='já está sendo importado'):
+        download._download(_url(server), str(tmp_path), on_start=lambda *args: started.append(args))
+
+    assert len(started) == 1
+    part = tmp_path / 'Empresas0.zip.part'
+    received = part.read_bytes()
+    assert 0 < len(received) < len(server.payload) and server.payload.startswith(received)
+    assert len(server.requests) == 3
+
+
+def test_restarts_when_the_server_stops_honouring_range_without_streaming(server, tmp_path):
+    server.range_limit = 2
+    server.drops = 1
+
+    path = download._download(_url(server), str(tmp_path))
+
+    assert _read(path) == server.payload
+
+
+def test_retries_server_errors_and_throttling(server, tmp_path):
+    server.errors = [503, 429, 408, 500]
+
+    path = download._download(_url(server), str(tmp_path))
+
+    assert _read(path) == server.payload
+    assert server.errors == []
+
+
+@pytest.mark.parametrize('status', [404, 403])
+def test_fails_immediately_on_client_errors(server, tmp_path, status):
+    server.errors = [status] * 5
+
+    with pytest.raises(Exception, match=f'HTTP Error {status}.*não será tentado novamente'):
+        download._download(_url(server), str(tmp_path))
+
+    assert len(server.requests) == 1
+
+
+def test_fails_immediately_on_client_errors_after_the_size(server, tmp_path, monkeypatch):
+    # Consulta do tamanho com sucesso e o erro no download do arquivo
+    get_info = download._get_info
+
+    def get_info_then_fail(url):
+        info = get_info(url)
+        server.errors = [404] * 5
+        return info
+
+    monkeypatch.setattr(download, '_get_info', get_info_then_fail)
+
+    with pytest.raises(Exception, match='Erro ao baixar o arquivo .*HTTP Error 404'):
+        download._download(_url(server), str(tmp_path))
+
+    assert len(server.requests) == 2
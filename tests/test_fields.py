@@ -0,0 +1,19 @@
+from rfb.utils import fields
+
+
+def test_cnae_splitter_ignores_repeated_codes_after_parsing():
+    split_cnaes = fields.cnae_splitter(('cnpj_completo', 'cnae_fiscal', 'cnae_secundario'))
+
+    rows = split_cnaes([(191, 4751201, '6201501, 6201501,06201501,4751201')])
+
+    assert rows == [(191, 4751201, True), (191, 6201501, False), (191, 4751201, False)]
+    # Chave primária (cnpj_completo, cnae, principal) sem repetições
+    assert len(set(rows)) == len(rows)
+
+
+def test_cnae_splitter_strips_codes_before_deduplicating():
+    split_cnaes = fields.cnae_splitter(('cnpj', 'cnpj_ordem', 'cnpj_dv', 'cnae_fiscal', 'cnae_secundario'))
+
+    rows = split_cnaes([('00000000', '0001', '91', '4751201', '6201501, 6201501 ,6202300')])
+
+    assert [row[3] for row in rows] == ['4751201', '6201501', '6202300']
@@ -0,0 +1,22 @@
+import pytest
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from rfb.models import Pais
+from rfb.utils.loader import ExecutemanyLoader, OrmLoader
+
+ROWS = [(1, 'AFEGANISTAO'), (2, 'ALBANIA'), (3, None)]
+
+
+@pytest.mark.parametrize('loader', [ExecutemanyLoader(), OrmLoader([Pais]), OrmLoader()])
+def test_loaders_insert_the_same_rows(loader):
+    engine = create_engine('sqlite://', future=True)
+    Pais.__table__.create(engine)
+
+    with Session(engine) as session:
+        loader.insert(session, Pais.__table__, ('codigo', 'descricao'), ROWS)
+        loader.insert(session, Pais.__table__, ('codigo', 'descricao'), [])
+        session.commit()
+
+        assert session.execute(select(Pais.codigo, Pais.descricao).order_by(Pais.codigo)).all() == ROWS
@@ -0,0 +1,92 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import textwrap
+
+from pathlib import Path
+from zipfile import ZIP_DEFLATED, ZipFile
+
+from rfb.utils.pipeline import assign_writers
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+ROWS = 30_000
+
+# Executado como módulo principal dos processos do pipeline (spawn), então as configurações
+# e a interrupção valem também nos processos de leitura e de escrita
+SCRIPT = textwrap.dedent('''
+    import os
+    import sys
+
+    from rfb import settings
+    settings.SQLITE_ROWS_PER_TRANSACTION = 2_000
+
+    from rfb.utils.sqlite_writer import SqliteWriter
+
+    CRASH_AFTER = int(os.environ.get('CRASH_AFTER', '0'))
+    commits = []
+    _commit = SqliteWriter._commit
+
+    def commit(connection):
+        _commit(connection)
+        commits.append(1)
+        if CRASH_AFTER and len(commits) >= CRASH_AFTER:
+            os._exit(1)  # Queda do processo de escrita após o commit, no meio do arquivo
+
+    SqliteWriter._commit = staticmethod(commit)
+
+    if __name__ == '__main__':
+        from rfb.models import Empresa
+        from rfb.utils import pipeline
+        from rfb.utils.convert_database import ConvertDatabase
+
+        database_url, directory = sys.argv[1:]
+        ConvertDatabase(database_url, directory).create_tables()
+        params = [{'pattern_name': 'empresa', 'qt_column': 7, 'model': Empresa, 'chunk_size': 1_000}]
+        pipeline.run(database_url, directory, params, 1)
+''')
+
+
+def _write_empresas(directory: Path) -> None:
+    with ZipFile(directory / 'Empresas0.zip', 'w', ZIP_DEFLATED) as zip_file:
+        lines = (f'"{cnpj:08d}";"EMPRESA {cnpj}";"2062";"49";"1000,00";"01";""\n' for cnpj in range(ROWS))
+        zip_file.writestr('EMPRESAS0.CSV', ''.join(lines).encode('ISO-8859-1'))
+
+
+def _run(script: Path, database: Path, directory: Path, crash_after: int = 0) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=str(ROOT), CRASH_AFTER=str(crash_after))
+    return subprocess.run([sys.executable, str(script), f'sqlite:///{database}', str(directory)],
+                          cwd=directory, env=env, capture_output=True, timeout=300)
+
+
+def test_assign_writers_keeps_each_file_in_one_writer():
+    assert assign_writers([100, 90, 50, 40, 10], 2) == [0, 1, 1, 0, 0]
+    assert assign_writers([30, 20, 10], 1) == [0, 0, 0]
+    assert assign_writers([], 4) == []
+
+
+def test_resume_after_writer_crash_loads_every_row_once(tmp_path):
+    directory = tmp_path / 'dados'
+    directory.mkdir()
+    _write_empresas(directory)
+    database = tmp_path / 'db.sqlite3'
+    script = tmp_path / 'importar.py'
+    script.write_text(SCRIPT)
+
+    crashed = _run(script, database, directory, crash_after=3)
+    assert crashed.returncode != 0
+
+    with sqlite3.connect(database) as connection:
+        loaded, = connection.execute('SELECT count(*) FROM empresas').fetchone()
+        finished, = connection.execute('SELECT count(*) FROM checkpoints WHERE finalizado').fetchone()
+    assert 0 < loaded < ROWS
+    assert finished == 0
+
+    resumed = _run(script, database, directory)
+    assert resumed.returncode == 0, resumed.stderr.decode()
+
+    with sqlite3.connect(database) as connection:
+        total, distinct = connection.execute('SELECT count(*), count(DISTINCT cnpj) FROM empresas').fetchone()
+    assert total == distinct == ROWS
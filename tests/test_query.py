@@ -0,0 +1,115 @@
+import json
+import threading
+
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+
+from sqlalchemy import func, select
+
+from main import PARAMS, load_model
+from rfb import settings
+from rfb.models import Estabelecimento
+from rfb.query import CompanyQuery, serve
+from rfb.utils.cache import TTLCache
+from rfb.utils.convert_database import ConvertDatabase
+
+
+@pytest.fixture(scope='module')
+def query(synthetic_directory, tmp_path_factory):
+    database_url = f'sqlite:///{tmp_path_factory.mktemp("consulta") / "db.sqlite3"}'
+    convert_database = ConvertDatabase(database_url, str(synthetic_directory))
+    convert_database.create_tables()
+    for param in PARAMS:
+        convert_database.populate(param['pattern_name'], param['qt_column'], load_model(param['model']))
+    convert_database.session.close()
+
+    return CompanyQuery(database_url, cache=TTLCache(maxsize=100, ttl=60))
+
+
+@pytest.fixture(scope='module')
+def establishments(query):
+    """ CNPJ base com mais de um estabelecimento e os CNPJs completos do mesmo """
+    table = Estabelecimento.__table__
+    with query.engine.connect() as connection:
+        base = connection.execute(
+            select(table.c.cnpj).group_by(table.c.cnpj).having(func.count() > 1).order_by(table.c.cnpj)
+        ).scalars().first()
+        rows = connection.execute(select(table.c.cnpj, table.c.cnpj_ordem, table.c.cnpj_dv).where(
+            table.c.cnpj == base
+        )).all()
+    return base, sorted(''.join(row) for row in rows)
+
+
+def test_get_companies_by_base_full_and_missing_cnpj(query, establishments):
+    base, full = establishments
+    formatted = f'{full[0][:2]}.{full[0][2:5]}.{full[0][5:8]}/{full[0][8:12]}-{full[0][12:]}'
+
+    companies = query.get_companies([base, formatted, '99999999'])
+
+    assert list(companies) == [base, full[0], '99999999']
+    assert companies['99999999'] is None
+
+    company = companies[base]
+    assert company['cnpj'] == base
+    assert sorted(row['cnpj'] for row in company['estabelecimentos']) == full
+    assert [row['cnpj'] for row in companies[full[0]]['estabelecimentos']] == [full[0]]
+    assert company['natureza'] is None or set(company['natureza']) == {'codigo', 'descricao'}
+
+    # Os perfis seguintes vêm do cache, inclusive o CNPJ inexistente
+    hits = query.cache.hits
+    assert query.get_company('99999999') is None
+    assert query.get_company(base) is company
+    assert query.cache.hits == hits + 2
+
+
+def test_get_companies_rejects_an_invalid_cnpj(query):
+    with pytest.raises(ValueError, match='CNPJ inválido'):
+        query.get_companies(['123'])
+
+
+@pytest.fixture(scope='module')
+def api(query):
+    server = serve(query, '127.0.0.1', 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def _request(url: str, body: bytes = None) -> tuple:
+    try:
+        with urlopen(Request(url, data=body), timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_http_returns_the_profile(api, establishments):
+    base, full = establishments
+
+    status, content = _request(f'{api}/empresas/{base}')
+    assert status == 200 and content['cnpj'] == base
+
+    status, content = _request(f'{api}/empresas', json.dumps({'cnpjs': [base, full[0]]}).encode())
+    assert status == 200 and list(content) == [base, full[0]]
+
+
+def test_http_not_found(api):
+    assert _request(f'{api}/empresas/99999999')[0] == 404
+    assert _request(f'{api}/outro')[0] == 404
+    assert _request(f'{api}/outro', b'{}')[0] == 404
+
+
+def test_http_bad_request(api, monkeypatch):
+    monkeypatch.setattr(settings, 'QUERY_HTTP_MAX_CNPJS', 2)
+
+    status, content = _request(f'{api}/empresas/123')
+    assert status == 400 and 'CNPJ inválido' in content['erro']
+    assert _request(f'{api}/empresas')[0] == 400
+    assert _request(f'{api}/empresas?cnpj=11111111,22222222,33333333')[0] == 400
+    assert _request(f'{api}/empresas', b'{"cnpjs": "11111111"}')[0] == 400
+    status, content = _request(f'{api}/empresas', b'{invalido')
+    assert status == 400 and 'JSON inválido' in content['erro']
@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+
+from rfb.utils.scheduler import Scheduler
+
+
+class Recorder:
+    """ Registra o início e o fim de cada etapa e a quantidade de etapas executadas ao mesmo tempo """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+        self.running = 0
+        self.max_running = 0
+
+    def __call__(self, name: str, seconds: float = 0.01) -> None:
+        with self.lock:
+            self.events.append(('inicio', name))
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(seconds)
+        with self.lock:
+            self.running -= 1
+            self.events.append(('fim', name))
+
+    def started(self) -> list:
+        return [name for event, name in self.events if event == 'inicio']
+
+    def position(self, event: str, name: str) -> int:
+        return self.events.index((event, name))
+
+
+def test_dependencies_run_first():
+    recorder = Recorder()
+    scheduler = Scheduler()
+    download = scheduler.add('download', recorder, 'download', 0.05)
+    empresa = scheduler.add('empresa', recorder, 'empresa', depends=[download])
+    socio = scheduler.add('socio', recorder, 'socio', depends=[download])
+    scheduler.add('indices', recorder, 'indices', depends=[empresa, socio])
+
+    scheduler.run(workers=3)
+
+    assert sorted(recorder.started()) == ['download', 'empresa', 'indices', 'socio']
+    for name in ('empresa', 'socio'):
+        assert recorder.position('fim', 'download') < recorder.position('inicio', name)
+        assert recorder.position('fim', name) < recorder.position('inicio', 'indices')
+    assert all(task.done and task.error is None for task in scheduler.tasks)
+
+
+def test_heaviest_ready_tasks_run_first():
+    recorder = Recorder()
+    sizes = {}
+    scheduler = Scheduler()
+    download = scheduler.add('download', sizes.update, {'grande': 30, 'pequeno': 1})
+    scheduler.add('pequeno', recorder, 'pequeno', depends=[download], weight=lambda: sizes['pequeno'])
+    scheduler.add('medio', recorder, 'medio', depends=[download], weight=10)
+    # O peso é calculado apenas quando a etapa fica pronta, após o download
+    scheduler.add('grande', recorder, 'grande', depends=[download], weight=lambda: sizes['grande'])
+    scheduler.add('sem_peso', recorder, 'sem_peso')
+    scheduler.add('prioritario', recorder, 'prioritario', weight=5)
+
+    scheduler.run(workers=1)
+
+    # As etapas liberadas pelo download passam na frente da etapa sem peso, agendada antes
+    assert recorder.started() == ['prioritario', 'grande', 'medio', 'pequeno', 'sem_peso']
+
+
+def test_workers_limit_the_concurrent_tasks():
+    recorder = Recorder()
+    scheduler = Scheduler()
+    for i in range(6):
+        scheduler.add(f'etapa{i}', recorder, f'etapa{i}', 0.02)
+
+    scheduler.run(workers=2)
+
+    assert len(recorder.started()) == 6
+    assert recorder.max_running == 2
+
+
+def test_failure_skips_the_dependents_and_is_raised(capsys):
+    recorder = Recorder()
+
+    def fail():
+        time.sleep(0.01)
+        raise RuntimeError('Arquivo corrompido')
+
+    scheduler = Scheduler()
+    download = scheduler.add('download', fail)
+    empresa = scheduler.add('empresa', recorder, 'empresa', depends=[download])
+    scheduler.add('indices', recorder, 'indices', depends=[empresa])
+    # Etapa independente já em execução quando a falha acontece termina normalmente
+    independente = scheduler.add('independente', recorder, 'independente', 0.05)
+    # Etapa pronta que ainda não foi iniciada não é executada após a falha
+    scheduler.add('pendente', recorder, 'pendente', weight=-1)
+
+    with pytest.raises(RuntimeError, match='Arquivo corrompido'):
+        scheduler.run(workers=2)
+
+    assert recorder.started() == ['independente']
+    assert independente.done and independente.error is None
+    assert isinstance(download.error, RuntimeError)
+    assert not empresa.done
+    err = capsys.readouterr().err
+    assert 'Erro na etapa download: Arquivo corrompido' in err
+    assert 'Etapas não executadas devido ao erro: empresa, indices, pendente' in err
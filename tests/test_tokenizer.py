@@ -0,0 +1,102 @@
+import io
+
+import pytest
+
+from rfb import settings
+from rfb.utils import convert_database
+from rfb.utils.convert_database import read_chunks
+from rfb.utils.metrics import Metrics
+from rfb.utils.tokenizer import split_quoted, tokenize
+
+
+def _tokenize(text: str, columns: int = 3) -> list:
+    return list(tokenize(io.BytesIO(text.encode(settings.ENCODING)), columns=columns))
+
+
+def test_simple_records():
+    assert _tokenize('"1";"A";"B"\n"2";"";"C"\n') == [['1', 'A', 'B'], ['2', '', 'C']]
+
+
+def test_separator_inside_a_field():
+    assert _tokenize('"1";"A;B";"C"\n') == [['1', 'A;B', 'C']]
+
+
+def test_unescaped_quotes_inside_a_field():
+    assert _tokenize('"1";"say "hi"";"C"\n"2";"NOME "X" LTDA";"D"\n"3";"say "hi"";"A;B"\n') == [
+        ['1', 'say "hi"', 'C'],
+        ['2', 'NOME "X" LTDA', 'D'],
+        ['3', 'say "hi"', 'A;B'],
+    ]
+
+
+def test_doubled_quotes_are_kept_as_in_the_simple_split():
+    # A RFB não escapa as aspas, a separação com aspas mantém o valor da separação simples
+    assert _tokenize('"1";"say ""hi""";"C"\n"2";"say ""hi""";"A;B"\n') == [
+        ['1', 'say ""hi""', 'C'],
+        ['2', 'say ""hi""', 'A;B'],
+    ]
+
+
+def test_split_quoted():
+    assert split_quoted('"1";"A;B";"C"') == ['1', 'A;B', 'C']
+    assert split_quoted('"1";"say "hi"";"C"') == ['1', 'say "hi"', 'C']
+    assert split_quoted('"1";"A""B";""') == ['1', 'A""B', '']
+    assert split_quoted('"1";2;""') == ['1', '2', '']
+    # Campo que continua na próxima linha
+    assert split_quoted('"1";"RUA') is None
+
+
+def test_line_break_inside_a_field():
+    assert _tokenize('"1";"RUA A\nSALA 2";"C"\n"2";"B";"D"\n') == [['1', 'RUA A\nSALA 2', 'C'], ['2', 'B', 'D']]
+
+
+@pytest.mark.parametrize('block_size', range(1, 24))
+def test_line_break_inside_a_field_on_every_block_boundary(monkeypatch, block_size):
+    monkeypatch.setattr(settings, 'TOKENIZER_BLOCK_SIZE', block_size)
+
+    assert _tokenize('"1";"RUA A\nSALA 2";"C"\r\n"2";"A;B";"D"\n') == [
+        ['1', 'RUA A\nSALA 2', 'C'],
+        ['2', 'A;B', 'D'],
+    ]
+
+
+def test_record_longer_than_the_maximum_lines(monkeypatch):
+    monkeypatch.setattr(settings, 'TOKENIZER_MAX_LINES', 3)
+    text = '"1";"' + '\n'.join(['LINHA'] * 5) + '";"C"\n"2";"B";"D"\n'
+
+    rows = _tokenize(text)
+
+    # A separação simples da primeira linha é retornada, com a quantidade de colunas errada
+    assert rows[0] == ['1', 'LINH']
+    assert len(rows[0]) != 3
+
+
+def test_record_longer_than_the_maximum_lines_raises_on_read(monkeypatch):
+    monkeypatch.setattr(settings, 'TOKENIZER_MAX_LINES', 3)
+    text = '"1";"A";"B"\n"2";"' + '\n'.join(['LINHA'] * 5) + '";"C"\n'
+    members = [('TESTE.CSV', io.BytesIO(text.encode(settings.ENCODING)))]
+
+    with pytest.raises(ValueError, match='Esperado 3 e encontrado 2'):
+        list(read_chunks('teste.zip', 'teste', 3, tuple, 10, members=iter(members)))
+
+
+def test_counts_the_records_split_with_quotes_after_the_skipped_ones():
+    quoted = []
+    text = '"1";"RUA\nA";"C"\n"2";"A;B";"D"\n"3";"RUA\nB";"E"\n"4";"RUA\nC";"F"\n'
+
+    rows = list(tokenize(io.BytesIO(text.encode(settings.ENCODING)), skip=1, columns=3,
+                         on_quoted=lambda: quoted.append(1)))
+
+    assert [row[0] for row in rows] == ['2', '3', '4']
+    assert len(quoted) == 2
+
+
+def test_read_chunks_registers_the_quoted_rows(monkeypatch):
+    registry = Metrics()
+    monkeypatch.setattr(convert_database, 'REGISTRY', registry)
+    text = '"1";"RUA\nA";"C"\n"2";"A;B";"D"\n'
+    members = [('TESTE.CSV', io.BytesIO(text.encode(settings.ENCODING)))]
+
+    list(read_chunks('teste.zip', 'teste', 3, tuple, 10, members=iter(members)))
+
+    assert registry.summary()['datasets']['teste']['rows_quoted'] == 1